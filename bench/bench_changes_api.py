@@ -0,0 +1,78 @@
+"""
+/api/changes/json 压测：200个并发轮询客户端，对比逐请求读CSV与缓存正文、304、增量三种方式的每秒请求数
+
+API读取static/下的文件，不使用本机监控进程发布的共享快照，见bench.suite.isolated_api。需要bench依赖：
+    pip install -e .[bench]
+
+运行：
+    python -m bench.bench_changes_api
+"""
+import asyncio
+import time
+import httpx
+import pandas as pd
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+import main
+from bench.suite import isolated_api
+from utils.table_store import table_paths
+
+POLLERS = 200
+DURATION = 3.0
+LEGACY_CSV = table_paths(main.CHANGES_SNAPSHOT)['csv']
+
+
+def legacy_app():
+    """原先每个请求都read_csv再to_dict的实现，作为对照"""
+    app = FastAPI()
+
+    @app.get("/api/changes/json")
+    async def get_changes_json():
+        df = pd.read_csv(LEGACY_CSV)
+        data = df.astype(object).where(pd.notnull(df), None).to_dict(orient="records")
+        return JSONResponse(content=data)
+
+    return app
+
+
+async def poller(client, mode, deadline, counts):
+    etag = None
+    version = 0
+    while time.perf_counter() < deadline:
+        if mode == 'etag':
+            headers = {'If-None-Match': etag} if etag else {}
+            response = await client.get('/api/changes/json', headers=headers)
+            etag = response.headers.get('etag', etag)
+        elif mode == 'since':
+            response = await client.get('/api/changes/json', params={'since': version})
+            version = response.json()['version']
+        else:
+            response = await client.get('/api/changes/json')
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+async def run(app, mode):
+    counts = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        deadline = time.perf_counter() + DURATION
+        start = time.perf_counter()
+        await asyncio.gather(*(poller(client, mode, deadline, counts) for _ in range(POLLERS)))
+        elapsed = time.perf_counter() - start
+    return sum(counts.values()) / elapsed, counts
+
+
+def run_benchmark():
+    rows = len(pd.read_csv(LEGACY_CSV))
+    print(f'{POLLERS}个并发轮询，异动表共{rows}行，每种方式{DURATION}秒')
+    with isolated_api():
+        for name, app, mode in (('逐请求读CSV', legacy_app(), 'full'),
+                                ('缓存正文', main.app, 'full'),
+                                ('ETag/304', main.app, 'etag'),
+                                ('since增量', main.app, 'since')):
+            rps, counts = asyncio.run(run(app, mode))
+            print(f'{name:<12} {rps:>10.0f} req/s  {counts}')
+
+
+if __name__ == '__main__':
+    run_benchmark()
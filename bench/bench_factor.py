@@ -0,0 +1,71 @@
+"""
+因子计算基准：对比逐只股票循环与面板向量化的耗时随股票数量的变化
+
+运行：
+    python -m bench.bench_factor
+"""
+import time
+import numpy as np
+import pandas as pd
+from factor.panel import build_panel, tail_mean, window_return
+from factor.support_factor import calculate_support_factor
+from factor.momentum_factor import calculate_momentum_factor
+
+SIZES = (100, 500, 1000, 5000)
+LOOP_MAX_SIZE = 1000  # 逐行循环在大规模下过慢，只在较小规模上作为对照
+
+
+def make_history(n_stocks, n_days=42, seed=0):
+    """生成n_stocks只股票、n_days根K线的合成日K数据"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2025-04-08', periods=n_days).date
+    history_data = {}
+    for i in range(n_stocks):
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+        low = close * (1 - rng.uniform(0, 0.03, n_days))
+        code = f'sz{i:06d}'
+        history_data[code] = pd.DataFrame({'日期': dates, '收盘': close, '最低': low, '代码': code})
+    return history_data
+
+
+def loop_factors(data, history_data, support_window=5, momentum_window=20):
+    """原先逐行循环、逐行pd.concat的实现，作为对照"""
+    support_df = pd.DataFrame()
+    momentum_df = pd.DataFrame()
+    for _, row in data.iterrows():
+        stock_data = history_data.get(row['代码'], pd.DataFrame())
+        if len(stock_data) >= support_window:
+            value = stock_data['最低'].tail(support_window).mean()
+            support_df = pd.concat([support_df, pd.DataFrame({'代码': [row['代码']], '支撑位': [value]})], ignore_index=True)
+        if len(stock_data) > momentum_window:
+            first, last = stock_data['收盘'].iloc[-momentum_window - 1], stock_data['收盘'].iloc[-1]
+            value = (last - first) / first if first > 0 else 0
+            momentum_df = pd.concat([momentum_df, pd.DataFrame({'代码': [row['代码']], '动量': [value]})], ignore_index=True)
+    return support_df, momentum_df
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'股票数':>8} {'循环(s)':>10} {'面板构建(s)':>12} {'面板计算(s)':>12} {'包装函数(s)':>12}")
+    for size in SIZES:
+        history_data = make_history(size)
+        data = pd.DataFrame({'代码': list(history_data.keys())})
+        loop_time = timed(loop_factors, data, history_data, repeat=1) if size <= LOOP_MAX_SIZE else float('nan')
+        build_time = timed(build_panel, history_data, None, ('收盘', '最低'))
+        panel = build_panel(history_data, fields=('收盘', '最低'))
+        compute_time = timed(lambda: (tail_mean(panel, '最低', 5), window_return(panel, '收盘', 20)))
+        wrapper_time = timed(lambda: (calculate_support_factor(data, history_data),
+                                      calculate_momentum_factor(data, history_data)))
+        print(f'{size:>8} {loop_time:>10.4f} {build_time:>12.4f} {compute_time:>12.6f} {wrapper_time:>12.4f}')
+
+
+if __name__ == '__main__':
+    main()
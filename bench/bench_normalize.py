@@ -0,0 +1,98 @@
+"""
+异动规范化基准：对比逐行apply与向量化实现每秒处理的异动条数
+
+开盘涨停潮时一页异动可达上千条，这里用合成的异动推送测量规范化阶段（不含网络请求）的吞吐。
+
+运行：
+    python -m bench.bench_normalize
+"""
+import time
+import numpy as np
+import pandas as pd
+from fluctuation import NEGATIVE_TYPES, TYPE_MAPPING, normalizeChanges
+from utils.concept_index import ConceptIndex
+from utils.table_store import read_table
+
+SIZES = (100, 1000, 5000)
+REPEAT = 20
+
+
+def make_rows(codes, n, seed=0):
+    """生成n条合成异动推送原始行"""
+    rng = np.random.default_rng(seed)
+    types = list(TYPE_MAPPING) + NEGATIVE_TYPES + [1]
+    minutes = np.concatenate([np.arange(9 * 60 + 30, 11 * 60 + 30), np.arange(13 * 60, 15 * 60)])
+    rows = []
+    for _ in range(n):
+        minute = int(rng.choice(minutes))
+        pct = rng.uniform(-0.12, 0.12)
+        price = rng.uniform(2, 200)
+        rows.append({
+            'c': str(rng.choice(codes)),
+            'n': '股票',
+            'tm': minute // 60 * 10000 + minute % 60 * 100 + int(rng.integers(60)),
+            'm': 0,
+            't': int(rng.choice(types)),
+            'i': f'{pct:.4f},{price:.2f},{price * pct:.2f}',
+        })
+    return rows
+
+
+def legacy_normalize(rows, concepts):
+    """原先逐行apply的实现，作为对照"""
+    df = pd.DataFrame(rows).rename(columns={'c': '股票代码', 'n': '股票名称', 'tm': '时间', 'm': '市场', 't': '类型', 'i': '信息'})
+    info_df = df['信息'].str.split(',', expand=True)
+    df['涨跌幅'] = pd.to_numeric(info_df[0], errors='coerce')
+    df = df[(df['涨跌幅'] < 1) & ((df['涨跌幅'] >= 0.05) | (df['涨跌幅'] <= -0.05))]
+    df = df[~df['类型'].astype(str).isin([str(t) for t in NEGATIVE_TYPES])]
+
+    def format_time(tm):
+        tm_str = str(tm).zfill(6)
+        return f"{tm_str[:2]}:{tm_str[2:4]}"
+
+    output_df = pd.DataFrame()
+    output_df['股票代码'] = df['股票代码']
+    output_df['时间'] = df['时间'].apply(format_time)
+    output_df['名称'] = df['股票名称']
+    output_df['类型'] = df['类型'].astype(str).map({str(k): v for k, v in TYPE_MAPPING.items()}).fillna('未知类型')
+    output_df['四舍五入取整'] = df['涨跌幅'].apply(lambda x: int(round(x * 100)) if pd.notnull(x) else None)
+    output_df['相关信息'] = df['涨跌幅'].apply(lambda x: f"%+.2f" % (x * 100) + "%" if pd.notnull(x) else 'NaN')
+    output_df['板块名称'] = [concepts.lookup(code) for code in output_df['股票代码']]
+    output_df = output_df.sort_values('时间')
+    html_df = output_df[['板块名称', '时间', '名称', '相关信息', '类型', '四舍五入取整']].copy()
+    html_df['上下午'] = html_df['时间'].apply(lambda tm: '上午' if int(tm[:2]) < 12 else '下午')
+    html_df['时间排序'] = html_df['时间'].apply(lambda tm: int(tm[:2]) * 60 + int(tm[3:5]))
+    return html_df.sort_values(['上下午', '板块名称', '时间排序'])
+
+
+def timeit(func, *args):
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark():
+    concept_df = read_table('static/concepts', dtype={'股票代码': str})
+    concepts = ConceptIndex(concept_df)
+    codes = concepts.stock_codes
+    print(f'{"条数":>6} {"逐行apply":>14} {"向量化":>14} {"加速比":>8}')
+    for n in SIZES:
+        rows = make_rows(codes, n)
+        legacy = legacy_normalize(rows, concepts)
+        vectorized = normalizeChanges(rows, concepts)
+        key = ['上下午', '板块名称', '时间排序', '名称', '类型', '相关信息']
+        # 旧实现没有股票代码和日期列，只比较共有的列
+        vectorized_common = vectorized[list(legacy.columns)]
+        same = legacy.sort_values(key).reset_index(drop=True).equals(
+            vectorized_common.sort_values(key).reset_index(drop=True))
+        t_legacy = timeit(legacy_normalize, rows, concepts)
+        t_vector = timeit(normalizeChanges, rows, concepts)
+        print(f'{n:>6} {n / t_legacy:>10.0f}条/秒 {n / t_vector:>10.0f}条/秒 {t_legacy / t_vector:>7.1f}x'
+              + ('' if same else '  结果不一致!'))
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,75 @@
+"""
+存储格式基准：对比概念成分表和异动表以CSV与Feather保存时的加载耗时和内存占用
+
+每种格式在独立子进程中加载，分别统计加载耗时、加载前后的常驻内存增量和DataFrame本身占用的内存。
+
+运行：
+    python -m bench.bench_storage
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import pandas as pd
+from utils.table_store import HAS_ARROW, table_paths, write_table
+
+TABLES = (('概念成分', 'static/concepts', {'股票代码': 'str'}), ('异动', 'static/changes', None))
+REPEAT = 5
+
+# 子进程里执行的加载脚本：输出加载耗时（秒）、常驻内存增量和DataFrame占用（字节）、行数
+LOAD_SCRIPT = """
+import json, os, sys, time
+import pandas as pd
+import pyarrow.feather
+path, dtype = sys.argv[1], json.loads(sys.argv[2])
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+before = rss()
+start = time.perf_counter()
+if path.endswith('.feather'):
+    df = pyarrow.feather.read_table(path, memory_map=True).to_pandas()
+else:
+    df = pd.read_csv(path, dtype=dtype)
+elapsed = time.perf_counter() - start
+print(elapsed, rss() - before, df.memory_usage(deep=True).sum(), len(df))
+"""
+
+
+def measure(path, dtype):
+    """在子进程中加载REPEAT次，返回(最短耗时, 最小常驻内存增量, DataFrame占用, 行数)"""
+    runs = []
+    for _ in range(REPEAT):
+        out = subprocess.run([sys.executable, '-c', LOAD_SCRIPT, path, json.dumps(dtype)],
+                             capture_output=True, text=True, check=True).stdout.split()
+        runs.append((float(out[0]), int(out[1]), int(out[2]), int(out[3])))
+    return min(r[0] for r in runs), min(r[1] for r in runs), runs[0][2], runs[0][3]
+
+
+def run_benchmark():
+    if not HAS_ARROW:
+        print('未安装pyarrow，无法对比Feather格式：pip install pyarrow')
+        return
+    tmp = tempfile.mkdtemp()
+    try:
+        for name, base, dtype in TABLES:
+            csv_path = table_paths(base)['csv']
+            if not os.path.exists(csv_path):
+                print(f'{name}: 缺少{csv_path}，跳过')
+                continue
+            local = os.path.join(tmp, os.path.basename(base))
+            shutil.copy(csv_path, table_paths(local)['csv'])
+            write_table(pd.read_csv(csv_path, dtype=dtype), local, fmt='feather')
+            print(f'{name}:')
+            for fmt, path in table_paths(local).items():
+                elapsed, rss, frame, rows = measure(path, dtype)
+                size = os.path.getsize(path) / 1024
+                print(f'  {fmt:<8} {rows:>7}行 文件{size:>8.0f}KB  加载{elapsed * 1000:>8.1f}ms  常驻+{rss / 2**20:>6.1f}MB  DataFrame{frame / 2**20:>6.1f}MB')
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    run_benchmark()
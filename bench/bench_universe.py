@@ -0,0 +1,89 @@
+"""
+选股基准：对比全表排序+nlargest与投影+部分选择，从同一个快照选出多个股票池的耗时和内存
+
+投影每个行情快照只做一次，由所有策略的选股共用，因此单独计时；部分选择是每次选股都要付出的部分。
+合成行情中有少量成交额为NaN的股票（停牌），用来核对两种做法对NaN的处理一致。
+
+运行：
+    python -m bench.bench_universe
+"""
+import time
+import numpy as np
+import pandas as pd
+from factor.universe import BOARDS, board_of, project_spot, select_universes
+
+N_STOCKS = 5000
+REPEAT = 50
+TOP = (100, 500)
+PER_BOARD = 20
+N_SUSPENDED = 100  # 成交额为NaN的股票数
+
+
+def make_spot(n=N_STOCKS, seed=0):
+    """生成与ak.stock_zh_a_spot()列一致的合成全市场行情"""
+    rng = np.random.default_rng(seed)
+    prefixes = rng.choice(['sh600', 'sh601', 'sh688', 'sz000', 'sz002', 'sz300', 'bj830', 'bj920'], n)
+    counters = {}
+    codes = []
+    for p in prefixes:
+        counters[p] = counters.get(p, -1) + 1
+        codes.append(f'{p}{counters[p]:03d}')
+    price = rng.uniform(2, 200, n)
+    amount = rng.lognormal(18, 1.5, n)
+    amount[rng.choice(n, N_SUSPENDED, replace=False)] = np.nan
+    return pd.DataFrame({
+        '代码': codes, '名称': [f'股票{i}' for i in range(n)], '最新价': price,
+        '涨跌额': rng.normal(0, 1, n), '涨跌幅': rng.normal(0, 2, n), '买入': price, '卖出': price,
+        '昨收': price, '今开': price, '最高': price * 1.02, '最低': price * 0.98,
+        '成交量': rng.uniform(1e5, 1e8, n), '成交额': amount,
+        '时间戳': ['15:00:00'] * n,
+    })
+
+
+def legacy_select(spot):
+    """原先的做法：全表按成交额排序后再逐个nlargest(...).copy()，选出与select_universes相同的股票池"""
+    data = spot.sort_values('成交额', ascending=False)
+    universes = {f'top{k}': data.nlargest(k, '成交额').copy() for k in TOP}
+    boards = board_of(data['代码'])
+    for board in BOARDS:
+        mask = np.asarray(boards == board)
+        if mask.any():
+            universes[f'{board}top{PER_BOARD}'] = data[mask].nlargest(PER_BOARD, '成交额').copy()
+    return universes
+
+
+def new_select(spot):
+    snapshot = project_spot(spot)
+    return select_codes(snapshot)
+
+
+def select_codes(snapshot):
+    codes = snapshot['代码'].to_numpy()
+    return {name: codes[rows] for name, rows in select_universes(snapshot, top=TOP, per_board=PER_BOARD).items()}
+
+
+def timeit(func, *args):
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark():
+    spot = make_spot()
+    legacy, new = legacy_select(spot), new_select(spot)
+    same = legacy.keys() == new.keys() and all(legacy[name]['代码'].tolist() == new[name].tolist() for name in legacy)
+    print(f'{N_STOCKS}只股票（{N_SUSPENDED}只成交额为NaN），股票池{list(new)}，结果一致: {same}')
+    print(f'全表排序+nlargest  {timeit(legacy_select, spot) * 1000:>8.2f}ms')
+    print(f'投影+部分选择      {timeit(new_select, spot) * 1000:>8.2f}ms')
+    snapshot = project_spot(spot)
+    print(f'  其中投影（每个快照一次）  {timeit(project_spot, spot) * 1000:>8.2f}ms')
+    print(f'  其中选股（每次选股）      {timeit(select_codes, snapshot) * 1000:>8.2f}ms')
+    print(f'行情表内存  原始{spot.memory_usage(deep=True).sum() / 2**20:>6.2f}MB'
+          f'  投影后{project_spot(spot).memory_usage(deep=True).sum() / 2**20:>6.2f}MB')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,258 @@
+"""
+基准测试使用的离线数据：东方财富异动推送和板块涨幅榜的JSONP原文、概念板块列表与成分、日K、全市场行情
+
+bench/fixtures/下有录制的文件时使用录制数据，否则按固定随机种子生成格式一致的合成数据，
+因此基准可以离线、可重复地运行。录制（需要联网）：
+    python -m bench.fixtures --record
+"""
+import argparse
+import functools
+import json
+import os
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+CONCEPTS_CSV = os.path.join(os.path.dirname(os.path.dirname(FIXTURE_DIR)), 'static', 'concepts.csv')
+JSONP_CALLBACK = 'jQuery35108409427522251944_1753773534498'
+RECORD_KLINES = 20
+RECORD_BOARDS = 20
+
+
+def _path(name):
+    return os.path.join(FIXTURE_DIR, name)
+
+
+def _jsonp(payload):
+    return f'{JSONP_CALLBACK}({json.dumps(payload, ensure_ascii=False)});'
+
+
+@functools.lru_cache(maxsize=None)
+def concept_members():
+    """概念成分表（板块代码, 板块名称, 股票代码, 股票名称），用于合成数据中的代码和板块；只读一次，调用方不要修改"""
+    df = pd.read_csv(CONCEPTS_CSV, dtype={'股票代码': str})
+    return df[df['板块代码'] != '板块代码'].reset_index(drop=True)
+
+
+def changes_pages(page_size=200, pages=5, seed=0):
+    """
+    异动推送的JSONP原文列表，按页序排列，每页内按时间倒序
+
+    返回：
+        list: 每页一个JSONP字符串
+    """
+    if os.path.exists(_path('changes_pages.json')):
+        with open(_path('changes_pages.json'), encoding='utf-8') as f:
+            return json.load(f)
+    from fluctuation import TYPE_MAPPING
+    rng = np.random.default_rng(seed)
+    members = concept_members().drop_duplicates('股票代码')
+    codes, names = members['股票代码'].to_numpy(), members['股票名称'].to_numpy()
+    types = list(TYPE_MAPPING)
+    total = page_size * pages
+    seconds = np.sort(rng.integers(9 * 3600 + 30 * 60, 11 * 3600 + 30 * 60, total))[::-1]
+    rows = []
+    for second in seconds:
+        i = rng.integers(len(codes))
+        pct = rng.uniform(-0.1, 0.1)
+        price = rng.uniform(3, 100)
+        rows.append({
+            'tm': int(second // 3600 * 10000 + second % 3600 // 60 * 100 + second % 60),
+            'c': str(codes[i]), 'm': int(str(codes[i]).startswith('6')), 'n': str(names[i]),
+            't': int(rng.choice(types)), 'i': f'{pct:.6f},{price:.2f},{price * pct:.2f}', 'u': '',
+        })
+    return [_jsonp({'rc': 0, 'data': {'tc': total, 'allstock': rows[p * page_size:(p + 1) * page_size]}})
+            for p in range(pages)]
+
+
+def rising_concepts(seed=0):
+    """板块涨幅榜的JSONP原文"""
+    if os.path.exists(_path('rising_concepts.jsonp')):
+        with open(_path('rising_concepts.jsonp'), encoding='utf-8') as f:
+            return f.read()
+    rng = np.random.default_rng(seed)
+    boards = concept_members().drop_duplicates('板块代码')
+    diff = [{'f3': round(float(rng.normal(0, 2)), 2), 'f12': code, 'f14': name, 'f20': int(rng.uniform(1e11, 4e12))}
+            for code, name in zip(boards['板块代码'], boards['板块名称'])]
+    diff.sort(key=lambda x: -x['f3'])
+    return _jsonp({'rc': 0, 'data': {'total': len(diff), 'diff': diff[:200]}})
+
+
+class FixtureSession:
+    """
+    替代requests.Session的回放会话：按URL返回录制的响应原文
+
+    参数：
+        pages (list): 异动推送各页的原文
+        rising (str): 板块涨幅榜的原文
+    """
+
+    def __init__(self, pages=None, rising=None):
+        self.pages = pages if pages is not None else changes_pages()
+        self.rising = rising if rising is not None else rising_concepts()
+        self.calls = 0
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        from fluctuation import CHANGES_URL
+        self.calls += 1
+        if url == CHANGES_URL:
+            index = int((params or {}).get('pageindex', 0))
+            empty = _jsonp({'rc': 0, 'data': {'tc': 0, 'allstock': []}})
+            return SimpleNamespace(text=self.pages[index] if index < len(self.pages) else empty, status_code=200)
+        return SimpleNamespace(text=self.rising, status_code=200)
+
+
+def recording(path, ticks=120, interval=3.0, page_size=200, pages=5, seed=0):
+    """
+    合成一份python fluctuation.py --record格式的录制：changes_pages的异动按时间逐步出现，
+    每次轮询看到截至当时的全部异动（按时间倒序分页），用于离线回放压测
+
+    参数：
+        path (str): 录制文件路径（.jsonl.gz）
+        ticks (int): 轮询次数
+        interval (float): 录制时两次轮询的间隔秒数
+
+    返回：
+        str: path
+    """
+    from fluctuation import CHANGES_URL, RISING_CONCEPTS_URL
+    from utils.replay import RecordingSession
+    rows = [row for page in changes_pages(page_size, pages, seed)
+            for row in json.loads(page[len(JSONP_CALLBACK) + 1:-2])['data']['allstock']]
+    rows.sort(key=lambda row: row['tm'], reverse=True)
+    # 开盘集中：前1/4的轮询放出一半的事件
+    cutoffs = np.quantile([row['tm'] for row in rows], np.concatenate([
+        np.linspace(0, 0.5, ticks // 4, endpoint=False), np.linspace(0.5, 1, ticks - ticks // 4)]))
+    clock = {'now': 1_700_000_000.0}
+    session = RecordingSession(None, path, clock=lambda: clock['now'])
+    rising = rising_concepts(seed)
+    try:
+        for cutoff in cutoffs:
+            visible = [row for row in rows if row['tm'] <= cutoff]
+            body = [_jsonp({'rc': 0, 'data': {'tc': len(visible), 'allstock': visible[p:p + page_size]}})
+                    for p in range(0, max(len(visible), 1), page_size)]
+            session.session = FixtureSession(body, rising)
+            session.next_tick()
+            session.get(CHANGES_URL, params={'pageindex': 0})
+            for index in range(1, len(body)):
+                session.get(CHANGES_URL, params={'pageindex': index})
+            session.get(RISING_CONCEPTS_URL, params={})
+            clock['now'] += interval
+    finally:
+        session.close()
+    return path
+
+
+def concept_boards(n_boards=None):
+    """ak.stock_board_concept_name_em()格式的概念板块列表"""
+    if os.path.exists(_path('concept_boards.csv')):
+        df = pd.read_csv(_path('concept_boards.csv'))
+    else:
+        members = concept_members()
+        counts = members.groupby('板块代码', sort=False).size()
+        boards = members.drop_duplicates('板块代码').set_index('板块代码')
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            '板块名称': boards['板块名称'].to_numpy(), '板块代码': boards.index.to_numpy(),
+            '总市值': rng.uniform(1e11, 5e12, len(boards)).astype('int64'),
+            '上涨家数': (counts[boards.index].to_numpy() * rng.uniform(0, 0.6, len(boards))).astype(int),
+            '下跌家数': (counts[boards.index].to_numpy() * rng.uniform(0, 0.4, len(boards))).astype(int),
+        })
+    return df.head(n_boards) if n_boards else df
+
+
+def concept_cons(symbol):
+    """ak.stock_board_concept_cons_em(symbol)格式的板块成分"""
+    if os.path.exists(_path('concept_cons.json')):
+        with open(_path('concept_cons.json'), encoding='utf-8') as f:
+            rows = json.load(f).get(symbol, [])
+    else:
+        members = concept_members()
+        rows = members.loc[members['板块代码'] == symbol, ['股票代码', '股票名称']].values.tolist()
+    return pd.DataFrame(rows, columns=['代码', '名称'])
+
+
+def kline(symbol, start_date=None, end_date=None, n_days=60):
+    """ak.stock_zh_a_hist_tx格式的日K（date/open/close/high/low/amount）"""
+    path = _path(os.path.join('kline', f'{symbol}.csv'))
+    if os.path.exists(path):
+        df = pd.read_csv(path)
+    else:
+        # 合成数据以请求的结束日期为最后一天，保证任意日期区间都有数据
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+        dates = pd.bdate_range(end=pd.Timestamp(str(end_date)) if end_date else pd.Timestamp.today().normalize(),
+                               periods=n_days)
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+        df = pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'open': close * (1 + rng.normal(0, 0.005, n_days)),
+                           'close': close, 'high': close * 1.02, 'low': close * (1 - rng.uniform(0, 0.03, n_days)),
+                           'amount': rng.uniform(1e5, 1e7, n_days)})
+    if start_date is not None:
+        dates = pd.to_datetime(df['date']).dt.strftime('%Y%m%d')
+        df = df[(dates >= str(start_date)) & (dates <= str(end_date or '99999999'))]
+    return df.reset_index(drop=True)
+
+
+def spot(n=5000, seed=0):
+    """ak.stock_zh_a_spot()格式的全市场行情"""
+    if os.path.exists(_path('spot.csv')):
+        return pd.read_csv(_path('spot.csv'), dtype={'代码': str})
+    from bench.bench_universe import make_spot
+    return make_spot(n, seed)
+
+
+def news(symbol):
+    """ak.stock_news_em(symbol)格式的新闻"""
+    rows = [{'关键词': symbol, '新闻标题': f'{symbol}新闻{i}', '新闻内容': '', '发布时间': f'2025-04-08 {15 - i:02d}:00:00',
+             '文章来源': '', '新闻链接': f'https://example.com/{symbol}/{i}'} for i in range(10)]
+    return pd.DataFrame(rows)
+
+
+def with_latency(func, latency):
+    """给回放函数加上固定延迟，模拟网络往返"""
+    def wrapper(*args, **kwargs):
+        time.sleep(latency)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def record():
+    """从线上接口录制一份fixtures（需要联网）"""
+    import akshare as ak
+    import fluctuation
+    os.makedirs(_path('kline'), exist_ok=True)
+    pages = [fluctuation.SESSION.get(fluctuation.CHANGES_URL, params={
+        'type': fluctuation.CHANGE_TYPES, 'cb': JSONP_CALLBACK, 'ut': '7eea3edcaed734bea9cbfc24409ed989',
+        'pageindex': i, 'pagesize': fluctuation.PAGE_SIZE, 'dpt': 'wzchanges'}, timeout=fluctuation.REQUEST_TIMEOUT).text
+        for i in range(5)]
+    with open(_path('changes_pages.json'), 'w', encoding='utf-8') as f:
+        json.dump(pages, f, ensure_ascii=False)
+    response = fluctuation.SESSION.get(fluctuation.RISING_CONCEPTS_URL, params={
+        'pn': '1', 'pz': '200', 'po': '1', 'np': '1', 'ut': 'bd1d9ddb04089700cf9c27f6f7426281', 'fltt': '2',
+        'invt': '2', 'fid': 'f3', 'fs': 'm:90 t:3 f:!50', 'fields': 'f3,f12,f14,f20'}, timeout=fluctuation.REQUEST_TIMEOUT)
+    with open(_path('rising_concepts.jsonp'), 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    boards = ak.stock_board_concept_name_em().head(RECORD_BOARDS)
+    boards.to_csv(_path('concept_boards.csv'), index=False)
+    cons = {code: ak.stock_board_concept_cons_em(symbol=code)[['代码', '名称']].values.tolist()
+            for code in boards['板块代码']}
+    with open(_path('concept_cons.json'), 'w', encoding='utf-8') as f:
+        json.dump(cons, f, ensure_ascii=False)
+    spot_df = ak.stock_zh_a_spot()
+    spot_df.to_csv(_path('spot.csv'), index=False)
+    for code in spot_df.nlargest(RECORD_KLINES, '成交额')['代码']:
+        ak.stock_zh_a_hist_tx(symbol=code, start_date='20240101', end_date=time.strftime('%Y%m%d'),
+                              adjust='qfq').to_csv(_path(os.path.join('kline', f'{code}.csv')), index=False)
+    print(f'已录制到{FIXTURE_DIR}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='基准测试离线数据')
+    parser.add_argument('--record', action='store_true', help='从线上接口录制fixtures')
+    if parser.parse_args().record:
+        record()
+    else:
+        print(f'fixtures目录: {FIXTURE_DIR}（没有录制文件时使用合成数据）')
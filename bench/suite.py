@@ -0,0 +1,389 @@
+"""
+基准套件：用bench/fixtures的离线数据测量各热点路径的耗时和峰值内存，并与之前的结果比较以发现回归
+
+覆盖：getChanges单次轮询、录制回放、板块热度聚合、按日分区的历史查询、getConcepts并发抓取、100/1000/5000只股票的因子计算、
+逐日回测、/api/changes/json每秒请求数、端到端calculate_multi_factors。
+
+运行：
+    python -m bench.suite                      # 运行全部用例
+    python -m bench.suite -k factors           # 只运行名称包含factors的用例
+    python -m bench.suite --save               # 结果保存到bench/results/<提交>.json
+    python -m bench.suite --compare <提交|文件>  # 与之前保存的结果比较，有回归时退出码为1
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench import fixtures
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+NETWORK_LATENCY = 0.02  # 回放请求时模拟的网络往返秒数
+CASES = {}
+
+
+def case(name, repeat=5, items=None):
+    """
+    注册基准用例
+
+    被装饰的函数负责准备数据，返回(执行一次的无参函数, 清理函数或None)。
+
+    参数：
+        name (str): 用例名称
+        repeat (int): 计时的重复次数
+        items (int, optional): 每次执行处理的条目数，用于换算吞吐
+    """
+    def decorator(setup):
+        CASES[name] = {'setup': setup, 'repeat': repeat, 'items': items}
+        return setup
+    return decorator
+
+
+@contextlib.contextmanager
+def patched(target, **attrs):
+    """临时替换模块属性，把网络调用换成fixtures回放"""
+    saved = {name: getattr(target, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(target, name, value)
+
+
+@case('changes.tick', repeat=10, items=1000)
+def changes_tick():
+    import fluctuation
+    from utils.concept_index import ConceptIndex
+    from utils.event_store import ChangeStore
+    concepts = ConceptIndex(fixtures.concept_members())
+    session = fixtures.FixtureSession(fixtures.changes_pages(page_size=fluctuation.PAGE_SIZE, pages=5))
+    tmp = tempfile.mkdtemp()
+
+    def run():
+        store = ChangeStore(os.path.join(tmp, 'changes'), os.path.join(tmp, 'changes.log'))
+        fluctuation.getChanges(concepts, store, fluctuation.ChangeCursor(), session)
+    return run, lambda: shutil.rmtree(tmp)
+
+
+@case('changes.replay', repeat=3, items=120)
+def changes_replay():
+    from utils.concept_index import ConceptIndex
+    from utils.replay import load_recording, replay
+    # 合成一天的录制（开盘集中），尽快回放；吞吐为每秒轮询数
+    tmp = tempfile.mkdtemp()
+    ticks = load_recording(fixtures.recording(os.path.join(tmp, 'recording.jsonl.gz'), ticks=120))
+    concepts = ConceptIndex(fixtures.concept_members())
+    return (lambda: replay(ticks, concepts=concepts)), lambda: shutil.rmtree(tmp)
+
+
+HEAT_ROWS = 5000
+
+
+@case('concepts.heat', repeat=10, items=HEAT_ROWS)
+def concepts_heat():
+    import fluctuation
+    from utils.concept_heat import ConceptHeat
+    from utils.concept_index import ConceptIndex
+    from utils.event_store import ChangeStore, SEQ_COLUMN
+    # 一次轮询得到的异动循环喂入，后几轮是已有键的变化，覆盖先减去旧贡献的路径；吞吐为每秒行数
+    concepts = ConceptIndex(fixtures.concept_members())
+    session = fixtures.FixtureSession(fixtures.changes_pages(page_size=fluctuation.PAGE_SIZE, pages=5))
+    tmp = tempfile.mkdtemp()
+    store = ChangeStore(os.path.join(tmp, 'changes'), os.path.join(tmp, 'changes.log'))
+    fluctuation.getChanges(concepts, store, fluctuation.ChangeCursor(), session)
+    records = store.records()
+    rows = [dict(records[i % len(records)], **{SEQ_COLUMN: i + 1}) for i in range(HEAT_ROWS)]
+
+    def run():
+        heat = ConceptHeat()
+        heat.update(rows, HEAT_ROWS)
+        heat.to_json()
+    return run, lambda: shutil.rmtree(tmp)
+
+
+HISTORY_DAYS = 60
+HISTORY_QUERIES = 200
+
+
+@case('history.query', repeat=5, items=HISTORY_QUERIES)
+def history_query():
+    import fluctuation
+    import numpy as np
+    import pandas as pd
+    from utils.change_history import ChangeHistory
+    from utils.concept_index import ConceptIndex
+    from utils.event_store import ChangeStore
+    # 一次轮询的异动复制为HISTORY_DAYS个交易日的分区，按板块+时段、股票代码、时段随机查询单日；吞吐为每秒查询数
+    concepts = ConceptIndex(fixtures.concept_members())
+    session = fixtures.FixtureSession(fixtures.changes_pages(page_size=fluctuation.PAGE_SIZE, pages=5))
+    tmp = tempfile.mkdtemp()
+    store = ChangeStore(os.path.join(tmp, 'changes'), os.path.join(tmp, 'changes.log'))
+    fluctuation.getChanges(concepts, store, fluctuation.ChangeCursor(), session)
+    df = store.to_frame()
+    history = ChangeHistory(os.path.join(tmp, 'history'))
+    days = [20250101 + i for i in range(HISTORY_DAYS)]
+    history.append(pd.concat([df.assign(日期=day) for day in days], ignore_index=True))
+    rng = np.random.default_rng(0)
+    boards = df['板块名称'].dropna().unique()
+    queries = []
+    for i in range(HISTORY_QUERIES):
+        day, start = int(rng.choice(days)), int(rng.integers(570, 690))
+        kind = i % 3
+        if kind == 0:
+            queries.append(dict(day=day, concept=str(rng.choice(boards)), start=start, end=start + 30))
+        elif kind == 1:
+            queries.append(dict(day=day, code=str(rng.choice(df['股票代码']))))
+        else:
+            queries.append(dict(day=day, start=start, end=start + 5))
+
+    def run():
+        for query in queries:
+            history.query(**query)
+    return run, lambda: shutil.rmtree(tmp)
+
+
+@case('concepts.crawl', repeat=3, items=60)
+def concepts_crawl():
+    import fluctuation
+    from types import SimpleNamespace
+    tmp = tempfile.mkdtemp()
+    fake_ak = SimpleNamespace(
+        stock_board_concept_name_em=lambda: fixtures.concept_boards(60),
+        stock_board_concept_cons_em=fixtures.with_latency(fixtures.concept_cons, NETWORK_LATENCY),
+    )
+    base = os.path.join(tmp, 'concepts')
+    patch = patched(fluctuation, ak=fake_ak, CONCEPTS_BASE=base, CONCEPTS_FILE=f'{base}.csv',
+                    CONCEPT_BOARDS_FILE=os.path.join(tmp, 'concepts.boards.jsonl'))
+    patch.__enter__()
+
+    def run():
+        # 删除检查点，每次都完整抓取
+        if os.path.exists(fluctuation.CONCEPT_BOARDS_FILE):
+            os.remove(fluctuation.CONCEPT_BOARDS_FILE)
+        fluctuation.getConcepts(max_workers=4, rate_limit=1000)
+
+    def cleanup():
+        patch.__exit__(None, None, None)
+        shutil.rmtree(tmp)
+    return run, cleanup
+
+
+def _factors_case(size):
+    def setup():
+        from bench.bench_factor import make_history
+        from factor.registry import compute_factors
+        history_data = make_history(size)
+        return (lambda: compute_factors(history_data)), None
+    return setup
+
+
+for _size in (100, 1000, 5000):
+    case(f'factors.{_size}', repeat=5, items=_size)(_factors_case(_size))
+
+
+@case('backtest.1000x250', repeat=3, items=250)
+def backtest_dates():
+    from bench.bench_factor import make_history
+    from factor.backtest import build_date_panel, run_backtest
+    # 单进程计算，测量的是逐日截面本身，不受机器核数影响；吞吐为每秒调仓日数
+    panel = build_date_panel(make_history(1000, n_days=250 + 21), fields=('最低', '收盘'))
+    return (lambda: run_backtest(None, max_workers=1, panel=panel)), None
+
+
+API_REQUESTS = 2000
+API_CONCURRENCY = 100
+
+
+@contextlib.contextmanager
+def isolated_api():
+    """
+    让API进程的异动和热度视图使用临时目录中的共享快照
+
+    默认的共享快照在/dev/shm，本机有监控进程在运行时API返回的是它发布的数据，结果随行情而变；
+    临时路径下没有快照，视图读取static/下的文件。返回main模块。
+    """
+    import main
+    from utils.concept_heat import HeatView
+    from utils.event_store import ChangesView
+    from utils.shared_snapshot import SharedChangesView
+    tmp = tempfile.mkdtemp()
+    changes_view = SharedChangesView(os.path.join(tmp, 'changes.snap'),
+                                     fallback=ChangesView(main.CHANGES_SNAPSHOT, main.CHANGES_LOG))
+    heat_view = HeatView(changes_view, os.path.join(tmp, 'heat.snap'))
+    try:
+        with patched(main, changes_view=changes_view, heat_view=heat_view):
+            yield main
+    finally:
+        shutil.rmtree(tmp)
+
+
+@case('api.changes_json', repeat=3, items=API_REQUESTS)
+def api_changes_json():
+    import httpx
+    stack = contextlib.ExitStack()
+    main = stack.enter_context(isolated_api())
+
+    async def poll_all():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            async def poller(n):
+                for _ in range(n):
+                    await client.get('/api/changes/json')
+            await asyncio.gather(*(poller(API_REQUESTS // API_CONCURRENCY) for _ in range(API_CONCURRENCY)))
+    return (lambda: asyncio.run(poll_all())), stack.close
+
+
+@case('multi_factor.e2e', repeat=3, items=100)
+def multi_factor_e2e():
+    import factor.multi_factor as mf
+    from factor.universe import project_spot
+    from utils.kline_store import KlineStore
+    from utils.news_store import NewsStore
+    data = project_spot(fixtures.spot())
+
+    def run():
+        tmp = tempfile.mkdtemp()
+        # 本地缓存从空开始，限流关闭，测量的是并发抓取和计算本身
+        with patched(mf, ak=_FixtureAk(),
+                     KlineStore=functools.partial(KlineStore, root=os.path.join(tmp, 'kline')),
+                     NewsStore=functools.partial(NewsStore, root=os.path.join(tmp, 'news')),
+                     get_stock_history_data=functools.partial(mf.get_stock_history_data, rate_limit=0),
+                     get_stock_news_data=functools.partial(mf.get_stock_news_data, rate_limit=0)):
+            _, path = mf.calculate_multi_factors(data)
+        if path and os.path.exists(path):
+            os.remove(path)
+        shutil.rmtree(tmp)
+    return run, None
+
+
+class _FixtureAk:
+    """calculate_multi_factors用到的akshare接口的回放版本"""
+    stock_zh_a_hist_tx = staticmethod(fixtures.with_latency(
+        lambda symbol, start_date, end_date, adjust='': fixtures.kline(symbol, start_date, end_date), NETWORK_LATENCY))
+    stock_news_em = staticmethod(fixtures.with_latency(lambda symbol: fixtures.news(symbol), NETWORK_LATENCY))
+    stock_zh_a_spot = staticmethod(fixtures.spot)
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测代码的打印和日志"""
+    logging.disable(logging.CRITICAL)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def run_case(name):
+    """运行一个用例，返回耗时和峰值内存"""
+    spec = CASES[name]
+    with quiet():
+        run, cleanup = spec['setup']()
+        try:
+            run()  # 预热：导入、缓存和线程池的一次性开销不计入
+            times = []
+            for _ in range(spec['repeat']):
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+            tracemalloc.start()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            if cleanup is not None:
+                cleanup()
+    result = {'median': statistics.median(times), 'min': min(times), 'peak_mb': peak / 2 ** 20}
+    if spec['items']:
+        result['per_second'] = spec['items'] / result['median']
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_results(ref):
+    """按文件路径或提交号读取保存的结果"""
+    path = ref if os.path.exists(ref) else os.path.join(RESULTS_DIR, f'{ref}.json')
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(current, baseline, tolerance):
+    """
+    比较两次结果，耗时中位数或峰值内存超过基线(1+tolerance)倍的用例视为回归
+
+    返回：
+        list: 回归的用例名称
+    """
+    regressions = []
+    print(f"\n与{baseline['revision']}比较（容差{tolerance:.0%}）:")
+    for name, result in current['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            print(f'  {name:<20} 基线中没有该用例')
+            continue
+        time_ratio = result['median'] / base['median']
+        mem_ratio = result['peak_mb'] / base['peak_mb'] if base['peak_mb'] else 1.0
+        regressed = time_ratio > 1 + tolerance or mem_ratio > 1 + tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<20} 耗时x{time_ratio:>5.2f}  内存x{mem_ratio:>5.2f}  {'回归' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='运行基准套件')
+    parser.add_argument('-k', dest='pattern', help='只运行名称包含该字符串的用例')
+    parser.add_argument('--save', action='store_true', help='把结果保存到bench/results/<提交>.json')
+    parser.add_argument('--compare', metavar='REF', help='与保存的结果（提交号或文件路径）比较')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='判定回归的相对容差，默认0.15')
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if not args.pattern or args.pattern in name]
+    current = {'revision': git_revision(), 'python': platform.python_version(),
+               'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'cases': {}}
+    print(f"{'用例':<20} {'中位数(ms)':>12} {'最短(ms)':>10} {'峰值内存(MB)':>14} {'吞吐(条/秒)':>14}")
+    for name in names:
+        result = run_case(name)
+        current['cases'][name] = result
+        rate = f"{result['per_second']:>14.0f}" if 'per_second' in result else ''
+        print(f"{name:<20} {result['median'] * 1000:>12.2f} {result['min'] * 1000:>10.2f} "
+              f"{result['peak_mb']:>14.2f} {rate}")
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{current['revision']}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f'\n结果已保存到{path}')
+    if args.compare:
+        regressions = compare(current, load_results(args.compare), args.tolerance)
+        if regressions:
+            print(f'\n发现{len(regressions)}个回归: {regressions}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
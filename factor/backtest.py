@@ -0,0 +1,354 @@
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+from factor.panel import Panel
+from factor.registry import FactorContext, get_factors, required_fields, required_lookback
+
+logger = logging.getLogger(__name__)
+
+BACKTEST_RESULT_DIR = 'result'
+PRICE_FIELD = '收盘'
+
+
+class DatePanel:
+    """
+    按交易日对齐的面板
+
+    与右对齐的Panel不同，每一列对应同一个交易日，股票在某日没有K线（未上市、停牌）时为NaN，
+    因此可以截取任意历史日期为止的窗口，得到"当时"的截面。
+
+    属性：
+        codes (list): 股票代码，与数组的行一一对应
+        dates (ndarray): 交易日，YYYYMMDD整数，递增
+        fields (dict): 字段名 -> (股票数 x 交易日数)的二维float64数组
+    """
+
+    def __init__(self, codes, dates, fields):
+        self.codes = list(codes)
+        self.dates = np.asarray(dates, dtype='int64')
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def window(self, end, width, fields=None):
+        """
+        截取以第end个交易日为最后一根K线、宽width的右对齐Panel，供已注册的因子直接计算
+
+        有效K线数取截止日向前连续有K线的根数：窗口内停牌过的股票只计停牌之后的K线，
+        因子按数据不足处理，不会跨过停牌缺口取值。
+        """
+        fields = fields or list(self.fields)
+        start = max(end - width + 1, 0)
+        sliced = {field: self.fields[field][:, start:end + 1] for field in fields}
+        missing = np.zeros((len(self.codes), end + 1 - start), dtype=bool)
+        for values in sliced.values():
+            missing |= np.isnan(values)
+        # 从右向左第一个缺失的位置之后都是连续的有效K线
+        width = missing.shape[1]
+        any_missing = missing.any(axis=1)
+        last_missing = width - 1 - np.argmax(missing[:, ::-1], axis=1)
+        lengths = np.where(any_missing, width - 1 - last_missing, width)
+        return Panel(self.codes, lengths, sliced)
+
+
+def build_date_panel(history_data, codes=None, fields=(PRICE_FIELD,)):
+    """
+    将history_data堆叠为按交易日对齐的面板
+
+    所有股票的日期只拼接后转换一次，再用searchsorted定位到交易日列，不逐只股票解析日期。
+
+    参数：
+        history_data (dict): 以股票代码为键，包含'日期'列的日K DataFrame为值的字典
+        codes (list, optional): 面板包含的股票代码及顺序，默认为history_data的全部键
+        fields (tuple): 需要的字段
+
+    返回：
+        DatePanel: 对齐后的面板，交易日为所有股票日期的并集
+    """
+    codes = list(history_data.keys()) if codes is None else list(codes)
+    frames = [history_data.get(code) for code in codes]
+    usable = [df is not None and not df.empty and '日期' in df.columns and all(f in df.columns for f in fields)
+              for df in frames]
+    lengths = np.array([len(df) if ok else 0 for df, ok in zip(frames, usable)], dtype='int64')
+    if not lengths.sum():
+        return DatePanel(codes, np.empty(0, 'int64'), {f: np.empty((len(codes), 0)) for f in fields})
+    parsed = pd.to_datetime(pd.concat([df['日期'] for df, ok in zip(frames, usable) if ok], ignore_index=True))
+    # 按年月日整数运算得到YYYYMMDD，避免逐个日期格式化为字符串
+    all_dates = (parsed.dt.year * 10000 + parsed.dt.month * 100 + parsed.dt.day).to_numpy(dtype='int64')
+    dates = np.unique(all_dates)
+    columns = np.searchsorted(dates, all_dates)
+    rows = np.repeat(np.arange(len(codes)), lengths)
+
+    stacked = {}
+    for field in fields:
+        values = np.concatenate([df[field].to_numpy(dtype='float64') for df, ok in zip(frames, usable) if ok])
+        array = np.full((len(codes), len(dates)), np.nan)
+        array[rows, columns] = values
+        stacked[field] = array
+    return DatePanel(codes, dates, stacked)
+
+
+def forward_returns(prices, horizon=1):
+    """
+    每个交易日收盘买入、horizon个交易日后收盘卖出的收益率
+
+    返回：
+        ndarray: 与prices同形状，最后horizon列以及买入或卖出日没有价格的位置为NaN
+    """
+    result = np.full(prices.shape, np.nan)
+    if horizon < prices.shape[1]:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[:, :-horizon] = prices[:, horizon:] / prices[:, :-horizon] - 1
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def rank_ic(values, returns):
+    """
+    截面Spearman秩相关系数
+
+    参数：
+        values (ndarray): 因子值，已按评分方向调整（越大越好）
+        returns (ndarray): 同一批股票的远期收益率
+
+    返回：
+        float: 秩相关系数，有效样本不足3个或某一侧没有差异时为NaN
+    """
+    valid = np.isfinite(values) & np.isfinite(returns)
+    if valid.sum() < 3:
+        return np.nan
+    x, y = rankdata(values[valid]), rankdata(returns[valid])
+    x, y = x - x.mean(), y - y.mean()
+    denominator = np.sqrt((x * x).sum() * (y * y).sum())
+    return float((x * y).sum() / denominator) if denominator > 0 else np.nan
+
+
+def quantile_labels(values, quantiles):
+    """
+    按截面百分位把股票分为quantiles组，0为因子值最小的一组；无效值为-1
+    """
+    labels = np.full(len(values), -1, dtype='int64')
+    valid = np.isfinite(values)
+    n = valid.sum()
+    if n >= quantiles:
+        ranks = rankdata(values[valid], method='ordinal') - 1
+        labels[valid] = ranks * quantiles // n
+    return labels
+
+
+def _evaluate_shard(task):
+    """
+    在一段连续的调仓日上计算各因子的IC、分组收益和最高组成员（进程池的工作函数）
+
+    task中的数组只包含这段调仓日所需的列（回看窗口 + 持有期），减少进程间传输的数据量。
+    """
+    codes, dates, fields, returns, positions, names, width, quantiles = task
+    panel = DatePanel(codes, dates, fields)
+    factors = get_factors(names)
+    signs = [1.0 if spec.ascending else -1.0 for spec in factors]
+    ic = np.full((len(factors), len(positions)), np.nan)
+    quantile_returns = np.full((len(factors), len(positions), quantiles), np.nan)
+    counts = np.zeros((len(factors), len(positions)), dtype='int64')
+    top = np.zeros((len(factors), len(positions), len(codes)), dtype=bool)
+    for t, position in enumerate(positions):
+        ctx = FactorContext(panel.window(position, width))
+        forward = returns[:, position]
+        # 当天没有成交的股票不能买入，不参与截面
+        tradable = ~np.isnan(fields[PRICE_FIELD][:, position])
+        for k, spec in enumerate(factors):
+            values = np.asarray(spec.compute(ctx), dtype='float64') * signs[k]
+            values[~tradable] = np.nan
+            ic[k, t] = rank_ic(values, forward)
+            labels = quantile_labels(np.where(np.isfinite(forward), values, np.nan), quantiles)
+            counts[k, t] = (labels >= 0).sum()
+            if counts[k, t]:
+                sums = np.bincount(labels[labels >= 0], weights=forward[labels >= 0], minlength=quantiles)
+                sizes = np.bincount(labels[labels >= 0], minlength=quantiles)
+                with np.errstate(invalid='ignore'):
+                    quantile_returns[k, t] = sums / sizes
+            top[k, t] = labels == quantiles - 1
+    return ic, quantile_returns, counts, top
+
+
+class BacktestResult:
+    """
+    回测结果
+
+    属性：
+        dates (DatetimeIndex): 调仓日
+        ic (DataFrame): 调仓日 x 因子的截面秩IC
+        quantile_returns (dict): 因子 -> 调仓日 x 分组的平均远期收益，第quantiles组为因子评分最高的一组
+        turnover (DataFrame): 调仓日 x 因子，最高组相对上一调仓日被换出的成分比例
+        coverage (DataFrame): 调仓日 x 因子，参与截面的股票数
+        horizon (int): 持有期（交易日）
+    """
+
+    def __init__(self, dates, ic, quantile_returns, turnover, coverage, horizon):
+        self.dates = dates
+        self.ic = ic
+        self.quantile_returns = quantile_returns
+        self.turnover = turnover
+        self.coverage = coverage
+        self.horizon = horizon
+
+    def summary(self):
+        """
+        每个因子一行的汇总：IC均值、IC标准差、ICIR、IC的t值、IC为正的比例、各组平均收益、多空收益、平均换手
+
+        返回：
+            DataFrame: 以因子名为索引
+        """
+        rows = {}
+        for name in self.ic.columns:
+            ic = self.ic[name].dropna()
+            std = ic.std()
+            returns = self.quantile_returns[name]
+            row = {
+                'IC均值': ic.mean(),
+                'IC标准差': std,
+                'ICIR': ic.mean() / std if std > 0 else np.nan,
+                'IC_t值': ic.mean() / std * np.sqrt(len(ic)) if std > 0 else np.nan,
+                'IC>0比例': (ic > 0).mean() if len(ic) else np.nan,
+            }
+            for column in returns.columns:
+                row[f'第{column}组收益'] = returns[column].mean()
+            row['多空收益'] = (returns[returns.columns[-1]] - returns[returns.columns[0]]).mean()
+            row['平均换手'] = self.turnover[name].mean()
+            row['平均股票数'] = self.coverage[name].mean()
+            rows[name] = row
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def run_backtest(history_data, start=None, end=None, names=None, horizon=1, quantiles=5, step=1,
+                 max_workers=None, shard_size=None, panel=None):
+    """
+    在历史交易日上逐日截面评估已注册因子
+
+    每个调仓日截取该日为止的窗口构成右对齐面板，用与实盘相同的因子函数计算因子值，
+    再与该日收盘买入、horizon个交易日后卖出的收益率比较。调仓日按日期区间切分为若干段，
+    在进程池中并行计算；每段只传入该段所需的列。
+
+    参数：
+        history_data (dict): 以股票代码为键，包含'日期'和因子所需字段的日K DataFrame为值的字典
+        start (str, optional): 第一个调仓日（含），格式YYYYMMDD，默认为历史足够计算因子的第一天
+        end (str, optional): 最后一个调仓日（含），默认为还能计算远期收益的最后一天
+        names (list, optional): 需要评估的因子列名，默认全部已注册因子
+        horizon (int): 持有期（交易日）
+        quantiles (int): 分组数
+        step (int): 每隔多少个交易日调仓一次
+        max_workers (int, optional): 进程数，默认为CPU核数；为1时在当前进程内计算
+        shard_size (int, optional): 每段的调仓日数，默认按进程数均分
+        panel (DatePanel, optional): 已堆叠好的日期面板，传入时不再从history_data构建
+
+    返回：
+        BacktestResult: 回测结果
+    """
+    factors = get_factors(names)
+    names = [spec.column for spec in factors]
+    width = required_lookback(factors) + 1
+    fields = tuple(dict.fromkeys(required_fields(factors) + (PRICE_FIELD,)))
+    if panel is None:
+        panel = build_date_panel(history_data, fields=fields)
+    returns = forward_returns(panel[PRICE_FIELD], horizon)
+
+    first = width - 1
+    last = len(panel.dates) - 1 - horizon
+    if start is not None:
+        first = max(first, int(np.searchsorted(panel.dates, int(start))))
+    if end is not None:
+        last = min(last, int(np.searchsorted(panel.dates, int(end), side='right')) - 1)
+    positions = np.arange(first, last + 1, step) if last >= first else np.empty(0, 'int64')
+    logger.info(f'回测{len(panel)}只股票、{len(positions)}个调仓日、{len(names)}个因子')
+
+    max_workers = max_workers or os.cpu_count() or 1
+    shard_size = shard_size or max(1, -(-len(positions) // max_workers))
+    tasks = []
+    for i in range(0, len(positions), shard_size):
+        shard = positions[i:i + shard_size]
+        lo, hi = max(shard[0] - width + 1, 0), shard[-1] + 1
+        tasks.append((panel.codes, panel.dates[lo:hi], {f: panel[f][:, lo:hi] for f in fields},
+                      returns[:, lo:hi], shard - lo, names, width, quantiles))
+    if max_workers == 1 or len(tasks) <= 1:
+        results = [_evaluate_shard(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+            results = list(executor.map(_evaluate_shard, tasks))
+
+    n = len(positions)
+    ic = np.concatenate([r[0] for r in results], axis=1) if results else np.empty((len(names), 0))
+    quantile_returns = np.concatenate([r[1] for r in results], axis=1) if results else np.empty((len(names), 0, quantiles))
+    counts = np.concatenate([r[2] for r in results], axis=1) if results else np.empty((len(names), 0))
+    top = np.concatenate([r[3] for r in results], axis=1) if results else np.empty((len(names), 0, len(panel)), bool)
+    # 换手：最高组中上一调仓日不在组内的成分比例，第一个调仓日没有上一期
+    turnover = np.full((len(names), n), np.nan)
+    if n > 1:
+        held = top[:, 1:].sum(axis=2)
+        kept = (top[:, 1:] & top[:, :-1]).sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            turnover[:, 1:] = np.where(held > 0, 1 - kept / held, np.nan)
+
+    dates = pd.to_datetime(panel.dates[positions].astype(str), format='%Y%m%d')
+    return BacktestResult(
+        dates=dates,
+        ic=pd.DataFrame(ic.T, index=dates, columns=names),
+        quantile_returns={name: pd.DataFrame(quantile_returns[k], index=dates, columns=range(1, quantiles + 1))
+                          for k, name in enumerate(names)},
+        turnover=pd.DataFrame(turnover.T, index=dates, columns=names),
+        coverage=pd.DataFrame(counts.T, index=dates, columns=names),
+        horizon=horizon,
+    )
+
+
+def load_cached_history(root=None):
+    """读取本地K线存储中的全部股票，不发请求"""
+    from utils.kline_store import KlineStore
+    store = KlineStore(root) if root else KlineStore()
+    codes = sorted(name[:-4] for name in os.listdir(store.root) if name.endswith('.npz'))
+    return {code: store.load(code) for code in codes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='因子历史回测：截面秩IC、分组收益和换手')
+    parser.add_argument('--start', help='第一个调仓日，格式YYYYMMDD')
+    parser.add_argument('--end', help='最后一个调仓日，格式YYYYMMDD')
+    parser.add_argument('--days', type=int, default=500, help='获取的历史自然日数，默认500')
+    parser.add_argument('--factors', nargs='*', help='需要评估的因子列名，默认全部')
+    parser.add_argument('--horizon', type=int, default=1, help='持有期（交易日），默认1')
+    parser.add_argument('--quantiles', type=int, default=5, help='分组数，默认5')
+    parser.add_argument('--step', type=int, default=1, help='调仓间隔（交易日），默认1')
+    parser.add_argument('--workers', type=int, help='进程数，默认为CPU核数')
+    parser.add_argument('--cached', action='store_true', help='只使用本地K线存储中已有的股票，不发请求')
+    args = parser.parse_args(argv)
+
+    if args.cached:
+        history_data = load_cached_history()
+    else:
+        # 全市场当前在市的股票，通过本地K线存储增量获取；已退市的股票不在其中（存在幸存者偏差）
+        from factor.multi_factor import get_stock_data, get_stock_history_data
+        codes = get_stock_data()['代码'].tolist()
+        history_data = get_stock_history_data(codes, days=args.days)
+
+    result = run_backtest(history_data, start=args.start, end=args.end, names=args.factors, horizon=args.horizon,
+                          quantiles=args.quantiles, step=args.step, max_workers=args.workers)
+    summary = result.summary()
+    print(summary.to_string(float_format=lambda v: f'{v:.4f}'))
+
+    os.makedirs(BACKTEST_RESULT_DIR, exist_ok=True)
+    path = os.path.join(BACKTEST_RESULT_DIR, f"backtest_{datetime.now().strftime('%y%m%d%H%M')}.csv")
+    result.ic.add_suffix('_IC').join(result.turnover.add_suffix('_换手')).to_csv(path, index_label='日期')
+    logger.info(f'逐日IC和换手已保存到{path}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,308 @@
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from factor.momentum_factor import MOMENTUM_WINDOW
+from factor.support_factor import SUPPORT_WINDOW
+from factor.registry import lookback_days
+from factor.universe import project_spot, top_k
+from utils.scheduler import TickScheduler, TradingCalendar
+from utils import metrics
+from utils.table_store import write_table
+
+logger = logging.getLogger(__name__)
+
+LIVE_RESULT = 'result/live_factors'
+LIVE_INTERVAL = 60
+LIVE_COLUMNS = ('代码', '最新价', '最低', '成交额')
+
+TICK_SECONDS = metrics.histogram('live_tick_seconds', '盘中因子服务各阶段耗时', ('stage',))
+TICKS = metrics.counter('live_ticks_total', '盘中因子更新次数', ('outcome',))
+UNIVERSE_CHANGES = metrics.counter('live_universe_entries_total', '新进入成交额前N、需要获取历史数据的股票数')
+
+
+class LiveFactors:
+    """
+    盘中增量因子状态
+
+    每只股票保存最近若干根已收盘日K的环形缓冲区（收盘价、最低价）和当天的实时K线。
+    每个实时快照只覆盖当天K线，动量和支撑位按O(1)更新：
+    动量 = 当天价格相对环形缓冲区中最早一根（MOMENTUM_WINDOW根之前）收盘价的收益率，
+    支撑位 = (最近SUPPORT_WINDOW-1根已收盘最低价的滚动和 + 当天最低价) / SUPPORT_WINDOW。
+    交易日切换时把当天K线写入环形缓冲区，覆盖最早的一根；LiveFactorService随后用reseed以官方日K校正。
+    结果与在含当天K线的日K上批量计算一致。
+
+    参数：
+        momentum_window (int): 动量窗口
+        support_window (int): 支撑位窗口
+    """
+
+    def __init__(self, momentum_window=MOMENTUM_WINDOW, support_window=SUPPORT_WINDOW):
+        self.momentum_window = momentum_window
+        self.support_window = support_window
+        self.codes = []
+        self._index = {}
+        self._code_index = pd.Index([])
+        self.day = None
+        self._closes = np.empty((0, momentum_window))
+        self._lows = np.empty((0, max(support_window - 1, 1)))
+        self._close_pos = np.empty(0, dtype='int64')
+        self._low_pos = np.empty(0, dtype='int64')
+        self._counts = np.empty(0, dtype='int64')
+        self._low_sum = np.empty(0)
+        self._close = np.empty(0)  # 当天的实时价格
+        self._low = np.empty(0)    # 当天的实时最低价
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self._index
+
+    def _load(self, history_data, codes, day):
+        """把codes的日K中day之前已收盘的K线整理为环形缓冲区的初始内容（closes, lows, counts）"""
+        closes = np.full((len(codes), self._closes.shape[1]), np.nan)
+        lows = np.full((len(codes), self._lows.shape[1]), np.nan)
+        counts = np.zeros(len(codes), dtype='int64')
+        for i, code in enumerate(codes):
+            bars = history_data[code]
+            if bars is None or bars.empty:
+                continue
+            bars = bars[pd.to_datetime(bars['日期']).dt.date < day]
+            close = bars['收盘'].to_numpy(dtype='float64')[-closes.shape[1]:]
+            low = bars['最低'].to_numpy(dtype='float64')[-lows.shape[1]:]
+            closes[i, :len(close)] = close
+            lows[i, :len(low)] = low
+            counts[i] = len(bars)
+        return closes, lows, counts
+
+    def add(self, history_data, day):
+        """
+        用日K历史初始化新股票的状态，只使用day之前已收盘的K线
+
+        参数：
+            history_data (dict): 以股票代码为键，日K DataFrame为值的字典
+            day (date): 当前交易日
+        """
+        codes = [code for code in history_data if code not in self._index]
+        if not codes:
+            return
+        closes, lows, counts = self._load(history_data, codes, day)
+        for code in codes:
+            self._index[code] = len(self.codes)
+            self.codes.append(code)
+        self._code_index = pd.Index(self.codes)
+        self._closes = np.vstack([self._closes, closes])
+        self._lows = np.vstack([self._lows, lows])
+        self._close_pos = np.concatenate([self._close_pos, np.minimum(counts, closes.shape[1]) % closes.shape[1]])
+        self._low_pos = np.concatenate([self._low_pos, np.minimum(counts, lows.shape[1]) % lows.shape[1]])
+        self._counts = np.concatenate([self._counts, counts])
+        self._low_sum = np.concatenate([self._low_sum, np.nansum(lows, axis=1)])
+        self._close = np.concatenate([self._close, np.full(len(codes), np.nan)])
+        self._low = np.concatenate([self._low, np.full(len(codes), np.nan)])
+        if self.day is None:
+            self.day = day
+
+    def reseed(self, history_data, day):
+        """
+        进入交易日day时用官方日K重新初始化已有股票的环形缓冲区
+
+        盘中最后一个快照的价格和最低价不一定等于官方收盘价和最低价（收盘集合竞价、盘后更正），
+        也不含除权除息后的前复权调整。先按快照滚动，再用日K覆盖：只覆盖日K已包含上一交易日K线的股票，
+        日K尚未更新或获取失败的股票保留滚动结果。
+
+        参数：
+            history_data (dict): 以股票代码为键，日K DataFrame为值的字典
+            day (date): 新的交易日
+
+        返回：
+            int: 重新初始化的股票数
+        """
+        if self.day is not None and day != self.day:
+            self._roll()
+        previous, self.day = self.day, day
+        codes = []
+        for code, bars in history_data.items():
+            if code not in self._index or bars is None or bars.empty:
+                continue
+            dates = pd.to_datetime(bars['日期']).dt.date
+            closed = dates[dates < day]
+            if len(closed) and (previous is None or closed.max() >= previous):
+                codes.append(code)
+        if not codes:
+            return 0
+        rows = self._code_index.get_indexer(codes)
+        closes, lows, counts = self._load(history_data, codes, day)
+        self._closes[rows] = closes
+        self._lows[rows] = lows
+        self._close_pos[rows] = np.minimum(counts, closes.shape[1]) % closes.shape[1]
+        self._low_pos[rows] = np.minimum(counts, lows.shape[1]) % lows.shape[1]
+        self._counts[rows] = counts
+        self._low_sum[rows] = np.nansum(lows, axis=1)
+        return len(codes)
+
+    def update(self, spot, day):
+        """
+        用实时快照覆盖当天K线；交易日切换时先把上一交易日的K线写入环形缓冲区
+
+        参数：
+            spot (DataFrame): 实时行情，包含['代码','最新价','最低']
+            day (date): 快照所属交易日
+
+        返回：
+            int: 更新的股票数
+        """
+        if self.day is not None and day != self.day:
+            self._roll()
+        self.day = day
+        idx = self._code_index.get_indexer(spot['代码'])
+        found = idx >= 0
+        idx = idx[found]
+        price = spot['最新价'].to_numpy(dtype='float64')[found]
+        low = spot['最低'].to_numpy(dtype='float64')[found]
+        # 停牌或尚未成交的股票价格为0，不覆盖当天K线
+        traded = price > 0
+        self._close[idx[traded]] = price[traded]
+        self._low[idx[traded]] = np.where(low[traded] > 0, low[traded], price[traded])
+        return int(traded.sum())
+
+    def _roll(self):
+        rows = np.flatnonzero(~np.isnan(self._close))
+        close_pos, low_pos = self._close_pos[rows], self._low_pos[rows]
+        self._closes[rows, close_pos] = self._close[rows]
+        self._close_pos[rows] = (close_pos + 1) % self._closes.shape[1]
+        # 滚动和：减去被覆盖的最早一根，加上新写入的一根
+        self._low_sum[rows] += self._low[rows] - np.nan_to_num(self._lows[rows, low_pos])
+        self._lows[rows, low_pos] = self._low[rows]
+        self._low_pos[rows] = (low_pos + 1) % self._lows.shape[1]
+        self._counts[rows] += 1
+        self._close[:] = np.nan
+        self._low[:] = np.nan
+
+    def momentum(self):
+        """当天价格相对momentum_window根K线之前收盘价的收益率，历史不足或当天无成交时为NaN"""
+        base = self._closes[np.arange(len(self.codes)), self._close_pos]
+        valid = (self._counts >= self.momentum_window) & ~np.isnan(self._close)
+        result = np.full(len(self.codes), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[valid] = np.where(base[valid] > 0, (self._close[valid] - base[valid]) / base[valid], 0.0)
+        return result
+
+    def support(self):
+        """含当天在内最近support_window根K线最低价的均值，历史不足或当天无成交时为NaN"""
+        valid = (self._counts >= self.support_window - 1) & ~np.isnan(self._low)
+        result = np.full(len(self.codes), np.nan)
+        result[valid] = (self._low_sum[valid] + self._low[valid]) / self.support_window
+        return result
+
+    def scores(self, codes):
+        """
+        计算指定股票的因子值和百分位评分
+
+        返回：
+            DataFrame: 包含['代码','支撑位','动量','支撑位评分','动量评分']，因子值缺失的股票被剔除
+        """
+        idx = self._code_index.get_indexer(codes)
+        idx = idx[idx >= 0]
+        result_df = pd.DataFrame({
+            '代码': np.asarray(self.codes, dtype=object)[idx],
+            '支撑位': self.support()[idx],
+            '动量': self.momentum()[idx],
+        }).dropna().reset_index(drop=True)
+        for column in ('支撑位', '动量'):
+            result_df[f'{column}评分'] = result_df[column].rank() / len(result_df)
+        return result_df
+
+
+class LiveFactorService:
+    """
+    盘中因子服务：定时拉取实时快照，增量更新因子评分并写入result/live_factors
+
+    成交额前top_n的股票集合不变时只更新当天K线；集合变化时只为新进入的股票拉取日K历史。
+    进入新交易日后的第一个快照前，为已有股票重新拉取日K，用官方收盘价、最低价和复权价校正环形缓冲区。
+
+    参数：
+        top_n (int): 按成交额选取的股票数
+        spot_func (callable): 返回全市场实时行情的函数，默认ak.stock_zh_a_spot
+        history_func (callable): history_func(codes, days) -> dict，默认get_stock_history_data
+        output (str): 结果文件路径（不含扩展名）
+    """
+
+    def __init__(self, top_n=100, spot_func=None, history_func=None, output=LIVE_RESULT):
+        self.top_n = top_n
+        self.spot_func = spot_func
+        self.history_func = history_func
+        self.output = output
+        self.state = LiveFactors()
+        self.universe = frozenset()
+        self.codes = []
+
+    def _spot(self):
+        if self.spot_func is not None:
+            return self.spot_func()
+        import akshare as ak
+        return ak.stock_zh_a_spot()
+
+    def _history(self, codes):
+        days = lookback_days(max(self.state.momentum_window, self.state.support_window) + 1)
+        if self.history_func is not None:
+            return self.history_func(codes, days)
+        from factor.multi_factor import get_stock_history_data
+        return get_stock_history_data(codes, days=days)
+
+    def tick(self, now=None):
+        """
+        处理一个实时快照
+
+        返回：
+            DataFrame: 当前top_n股票的因子评分
+        """
+        now = now or datetime.now()
+        if self.state.day is not None and now.date() != self.state.day and len(self.state):
+            with TICK_SECONDS.time(stage='history'):
+                reseeded = self.state.reseed(self._history(self.state.codes), now.date())
+            logger.info(f'进入新交易日，用日K校正{reseeded}/{len(self.state)}只股票')
+        with TICK_SECONDS.time(stage='spot'):
+            spot = project_spot(self._spot(), LIVE_COLUMNS)
+        top = spot.iloc[top_k(spot['成交额'].to_numpy(), self.top_n)]
+        universe = frozenset(top['代码'])
+        if universe != self.universe:
+            entering = [code for code in top['代码'] if code not in self.state]
+            if entering:
+                logger.info(f'成交额前{self.top_n}变化，获取{len(entering)}只新股票的历史数据')
+                UNIVERSE_CHANGES.inc(len(entering))
+                with TICK_SECONDS.time(stage='history'):
+                    self.state.add(self._history(entering), now.date())
+            self.universe = universe
+            self.codes = top['代码'].tolist()
+        with TICK_SECONDS.time(stage='update'):
+            self.state.update(spot, now.date())
+            result_df = self.state.scores(self.codes)
+        with TICK_SECONDS.time(stage='persist'):
+            write_table(result_df, self.output)
+        logger.debug(f'盘中因子更新完成，共{len(result_df)}只股票')
+        return result_df
+
+    def run(self, scheduler=None, interval=LIVE_INTERVAL):
+        """交易时段内每interval秒处理一次快照"""
+        scheduler = scheduler or TickScheduler(interval=interval, job='live')
+        profile = metrics.ProfileTrigger('live')
+
+        def task():
+            try:
+                profile.run(self.tick)
+                TICKS.inc(outcome='ok')
+            except Exception as e:
+                TICKS.inc(outcome='error')
+                logger.error(f'盘中因子更新失败: {str(e)}')
+            finally:
+                metrics.report('live')
+            return 0
+
+        scheduler.run(task)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    LiveFactorService().run(TickScheduler(TradingCalendar.load(), interval=LIVE_INTERVAL, job='live'))
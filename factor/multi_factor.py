@@ -4,39 +4,89 @@ import akshare as ak
 import os
 import time
 from datetime import datetime, timedelta
-from factor.support_factor import calculate_support_factor  # Changed from relative to absolute import
-from factor.momentum_factor import calculate_momentum_factor  # Changed from relative to absolute import
+from factor.registry import compute_factors, get_factors, lookback_days, required_lookback
 from utils.template import generate_html_table  # 新增导入
+from utils.fetcher import fetch_concurrently
+from utils.kline_store import KlineStore
+from utils.news_store import NewsStore
+from factor.universe import SPOT_COLUMNS, project_spot, top_k
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
-def get_stock_data():
+# 单次请求（含本地缓存读写）的耗时和重试用尽后仍失败的股票数，按数据源区分
+FETCH_SECONDS = metrics.histogram('factor_fetch_seconds', '单只股票数据获取耗时', ('source',))
+FETCH_FAILURES = metrics.counter('factor_fetch_failures_total', '重试用尽后获取失败的股票数', ('source',))
+RUN_SECONDS = metrics.histogram('factor_run_seconds', '一次多因子计算的总耗时')
+
+def get_stock_data(columns=SPOT_COLUMNS):
     """
     获取股票数据，集中处理数据获取逻辑
     
+    参数：
+        columns (tuple): 需要保留的行情列，默认只保留选股所需的代码、名称、成交额
+    
     返回：
-        DataFrame: 包含成交额和价格数据的全量股票数据
+        DataFrame: 投影为所需列的全量股票数据（未排序），另含板块列
     """
     try:
         logger.info('开始获取股票数据')
-        data = ak.stock_zh_a_spot().sort_values('成交额', ascending=False)
-        # 确保列名统一，如果存在"股票代码"列，将其重命名为"代码"
-        if "股票代码" in data.columns and "代码" not in data.columns:
-            data = data.rename(columns={"股票代码": "代码"})
+        # 立即投影为所需的列，不保留整张行情表；排序交给选股阶段的部分选择
+        data = project_spot(ak.stock_zh_a_spot(), columns)
         logger.info(f'成功获取股票数据，共{len(data)}条记录')
         return data
     except Exception as e:
         logger.error(f'获取股票数据失败: {str(e)}')
         raise
 
-def get_stock_history_data(stock_codes, days=60):
+def fetch_stock_history(stock_code, start_date, end_date):
+    """
+    获取单只股票的前复权日K数据并统一列名
+
+    参数：
+        stock_code (str): 股票代码
+        start_date (str): 开始日期，格式YYYYMMDD
+        end_date (str): 结束日期，格式YYYYMMDD
+
+    返回：
+        DataFrame: 日K数据，接口返回空数据时为空DataFrame
+    """
+    # 使用akshare获取个股日K数据
+    stock_data = ak.stock_zh_a_hist_tx(symbol=stock_code, start_date=start_date, end_date=end_date, adjust="qfq")
+    if stock_data.empty:
+        return stock_data
+    # 添加代码列
+    stock_data['代码'] = stock_code
+    # 确保列名统一
+    column_mapping = {
+        'date': '日期',
+        'open': '开盘',
+        'close': '收盘',
+        'high': '最高',
+        'low': '最低',
+        'amount': '成交量'
+    }
+    return stock_data.rename(columns=column_mapping)
+
+def get_stock_history_data(stock_codes, days=60, max_workers=8, rate_limit=5.0, max_retries=3, fetch_func=None,
+                           store=None, use_store=True):
     """
     集中获取多只股票的历史K线数据
-    
+
+    使用有界线程池并发请求，所有线程共享令牌桶限流，失败时按指数退避重试。
+    默认先读取本地K线存储，只请求缺失的日期区间并追加保存。
+
     参数：
         stock_codes (list): 股票代码列表
         days (int): 需要获取的历史数据天数，默认60天
-    
+        max_workers (int): 最大并发请求数，默认8
+        rate_limit (float): 每秒最多请求数，默认5
+        max_retries (int): 每只股票的最大尝试次数，默认3
+        fetch_func (callable, optional): fetch_func(stock_code, start_date, end_date) -> DataFrame，
+            默认为fetch_stock_history，测试时可注入带延迟和错误的桩函数
+        store (KlineStore, optional): 本地K线存储，默认使用项目下的cache/kline
+        use_store (bool): 是否使用本地K线存储，为False时每次全量请求
+
     返回：
         dict: 以股票代码为键，历史数据DataFrame为值的字典
     """
@@ -47,45 +97,33 @@ def get_stock_history_data(stock_codes, days=60):
         end_date = datetime.now().strftime('%Y%m%d')
         # 计算开始日期（往前推指定天数，确保有足够的数据计算窗口）
         start_date = (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
+        fetch_func = fetch_func or fetch_stock_history
+        if use_store and store is None:
+            store = KlineStore()
         
-        # 创建结果字典
-        history_data = {}
+        def fetch_one(stock_code):
+            with FETCH_SECONDS.time(source='kline'):
+                if store is not None:
+                    return store.get(stock_code, start_date, end_date, fetch_func)
+                return fetch_func(stock_code, start_date, end_date)
         
-        # 遍历每只股票，获取日K数据
-        for stock_code in stock_codes:
-            max_retries = 3
-            retry_count = 0
-            while retry_count < max_retries:
-                try:
-                    # 使用akshare获取个股日K数据
-                    stock_data = ak.stock_zh_a_hist_tx(symbol=stock_code, start_date=start_date, end_date=end_date, adjust="qfq")
-                    if not stock_data.empty:
-                        # 添加代码列
-                        stock_data['代码'] = stock_code
-                        # 确保列名统一
-                        column_mapping = {
-                            'date': '日期',
-                            'open': '开盘',
-                            'close': '收盘',
-                            'high': '最高',
-                            'low': '最低',
-                            'amount': '成交量'
-                        }
-                        stock_data = stock_data.rename(columns=column_mapping)
-                        history_data[stock_code] = stock_data
-                        logger.debug(f'成功获取{stock_code}的历史数据，共{len(stock_data)}条记录')
-                        break
-                    else:
-                        logger.warning(f'获取股票{stock_code}的历史数据为空，尝试重试 {retry_count + 1}/{max_retries}')
-                except Exception as e:
-                    logger.warning(f'获取股票{stock_code}的历史数据失败: {str(e)}，尝试重试 {retry_count + 1}/{max_retries}')
-                retry_count += 1
-                if retry_count < max_retries:
-                    time.sleep(1)  # 等待1秒后重试
-            
-            if retry_count == max_retries:
-                logger.error(f'获取股票{stock_code}的历史数据失败，已达到最大重试次数')
-                history_data[stock_code] = pd.DataFrame()  # 设置为空DataFrame
+        results = fetch_concurrently(
+            stock_codes,
+            fetch_one,
+            max_workers=max_workers,
+            rate_limit=rate_limit,
+            max_retries=max_retries,
+        )
+        
+        # 创建结果字典，失败的股票设置为空DataFrame
+        history_data = {}
+        for stock_code, stock_data in results.items():
+            if stock_data is None:
+                FETCH_FAILURES.inc(source='kline')
+                history_data[stock_code] = pd.DataFrame()
+            else:
+                history_data[stock_code] = stock_data
+                logger.debug(f'成功获取{stock_code}的历史数据，共{len(stock_data)}条记录')
         
         logger.info(f'成功获取{len(history_data)}只股票的历史数据')
         return history_data
@@ -97,6 +135,8 @@ def filter_top_stocks(data, top_n=100):
     """
     筛选成交额前N的股票
     
+    用一次部分选择取出前N，只对这N只排序，不对全表排序。
+    
     参数：
         data (DataFrame): 包含成交额的股票数据
         top_n (int): 筛选的股票数量，默认100只
@@ -105,13 +145,77 @@ def filter_top_stocks(data, top_n=100):
         DataFrame: 筛选后的股票数据
     """
     try:
-        top_stocks = data.nlargest(top_n, '成交额').copy()
+        top_stocks = data.iloc[top_k(data['成交额'].to_numpy(), top_n)].reset_index(drop=True)
         logger.debug(f'筛选出{len(top_stocks)}条成交额前{top_n}数据')
         return top_stocks
     except Exception as e:
         logger.error(f'筛选股票数据失败: {str(e)}')
         raise
 
+def fetch_stock_news(stock_code):
+    """
+    获取单只股票的最新新闻
+
+    返回：
+        DataFrame: 新闻数据，包含发布时间、新闻标题、新闻链接等列
+    """
+    return ak.stock_news_em(symbol=stock_code)
+
+def get_stock_news_data(stock_codes, top_n=5, max_workers=4, rate_limit=2.0, max_retries=2, fetch_func=None,
+                        store=None, use_store=True):
+    """
+    集中获取多只股票的最新新闻标题
+
+    使用有界线程池并发请求并共享令牌桶限流。默认使用本地新闻缓存：缓存未过期的股票不发请求，
+    过期的只合并比本地更新的标题；请求失败时退回使用过期的本地缓存。
+
+    参数：
+        stock_codes (list): 股票代码列表
+        top_n (int): 每只股票拼接的最新标题数，默认5条
+        max_workers (int): 最大并发请求数，默认4
+        rate_limit (float): 每秒最多请求数，默认2
+        max_retries (int): 每只股票的最大尝试次数，默认2
+        fetch_func (callable, optional): fetch_func(stock_code) -> DataFrame，默认为fetch_stock_news
+        store (NewsStore, optional): 本地新闻缓存，默认使用项目下的cache/news
+        use_store (bool): 是否使用本地新闻缓存
+
+    返回：
+        dict: 以股票代码为键、以" | "拼接的最新标题为值的字典
+    """
+    logger.info(f'开始获取{len(stock_codes)}只股票的新闻')
+    fetch_func = fetch_func or fetch_stock_news
+    if use_store and store is None:
+        store = NewsStore()
+
+    def fetch_one(stock_code):
+        with FETCH_SECONDS.time(source='news'):
+            if store is not None:
+                return store.get(stock_code, fetch_func)
+            return fetch_func(stock_code)
+
+    # 缓存未过期的股票直接使用本地标题，不占用限流令牌，也不进入重试
+    results = {}
+    if store is not None:
+        results = {code: store.fresh(code) for code in stock_codes}
+        results = {code: cached for code, cached in results.items() if cached is not None}
+    pending = [code for code in stock_codes if code not in results]
+    # 没有新闻的股票接口返回空表，这是有效结果，不重试
+    results.update(fetch_concurrently(pending, fetch_one, max_workers=max_workers, rate_limit=rate_limit,
+                                      max_retries=max_retries, accept_empty=True))
+    news = {}
+    for stock_code, news_df in results.items():
+        if news_df is None and store is not None:
+            # 请求失败或没有新闻时，使用本地已有的标题（可能已过期）；从未成功请求过的仍视为失败
+            fetched_at, cached = store.load(stock_code)
+            news_df = cached if fetched_at is not None else None
+        if news_df is None:
+            FETCH_FAILURES.inc(source='news')
+            news[stock_code] = "新闻获取异常"
+            continue
+        top_news = news_df.head(top_n)['新闻标题'].tolist()
+        news[stock_code] = " | ".join(top_news) if top_news else "无相关新闻"
+    return news
+
 def calculate_multi_factors(data=None):
     """
     整合多个因子计算
@@ -122,6 +226,7 @@ def calculate_multi_factors(data=None):
     返回：
         DataFrame: 合并后的多因子数据表
     """
+    start = time.perf_counter()
     try:
         logger.info('开始多因子计算')
         
@@ -133,44 +238,20 @@ def calculate_multi_factors(data=None):
         top_100_stocks = filter_top_stocks(data)
         logger.info(f'筛选出成交额前100的股票，共{len(top_100_stocks)}条记录')
         
-        # 集中获取所有股票的历史数据
+        # 根据已注册因子声明的回看窗口，集中获取一次所有股票的历史数据
+        factors = get_factors()
+        days = lookback_days(required_lookback(factors))
         stock_codes = top_100_stocks['代码'].tolist()
-        history_data = get_stock_history_data(stock_codes, days=60)  # 获取60天的历史数据，足够计算各种因子
-        logger.info(f'集中获取{len(history_data)}只股票的历史数据完成')
-        
-        # 计算支撑因子
-        support_df = calculate_support_factor(top_100_stocks, history_data)
-        logger.debug('支撑因子计算完成')
-
-        # 计算动量因子
-        momentum_df = calculate_momentum_factor(top_100_stocks, history_data)
-        logger.debug('动量因子计算完成')
-
-        # 合并因子数据
-        merged_df = pd.merge(support_df, momentum_df, on='代码', how='inner')
-        logger.info(f'成功合并因子数据，最终记录数：{len(merged_df)}')
+        history_data = get_stock_history_data(stock_codes, days=days)
+        logger.info(f'集中获取{len(history_data)}只股票{days}天的历史数据完成')
         
-        # 标准化处理：将支撑位和动量转换为百分位评分（0-1之间）
-        merged_df['支撑位评分'] = merged_df['支撑位'].rank(ascending=True) / len(merged_df)
-        merged_df['动量评分'] = merged_df['动量'].rank(ascending=True) / len(merged_df)
-        logger.info('完成因子标准化处理')
-
-        # 新增新闻数据获取
-        def get_stock_news(stock_code):
-            """获取单个股票的最近5条新闻标题"""
-            try:
-                news_df = ak.stock_news_em(symbol=stock_code)
-                # 取最新5条新闻并拼接标题
-                top_news = news_df.head(5)['新闻标题'].tolist()
-                return " | ".join(top_news) if top_news else "无相关新闻"
-            except Exception as e:
-                logger.warning(f"获取{stock_code}新闻失败: {str(e)}")
-                return "新闻获取异常"
+        # 在共享面板上计算全部已注册因子，一次性合并并转换为百分位评分
+        merged_df = compute_factors(history_data, codes=stock_codes)
+        logger.info(f'成功计算{len(factors)}个因子，最终记录数：{len(merged_df)}')
 
-        # 添加新闻列（添加延时避免频繁请求）
-        merged_df['news'] = merged_df['代码'].apply(
-            lambda x: get_stock_news(x)
-        )
+        # 并发获取新闻标题，未过期的直接使用本地缓存
+        news = get_stock_news_data(merged_df['代码'].tolist())
+        merged_df['news'] = merged_df['代码'].map(news)
         logger.info('新闻数据添加完成')
 
         # 保存结果到CSV文件
@@ -202,6 +283,10 @@ def calculate_multi_factors(data=None):
     except Exception as e:
         logger.error(f'多因子计算失败: {str(e)}')
         raise
+    finally:
+        # 批量计算是短进程，结束时把指标写给API的/metrics
+        RUN_SECONDS.observe(time.perf_counter() - start)
+        metrics.report('multi_factor')
 
 if __name__ == '__main__':
     # 配置日志
@@ -0,0 +1,112 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Panel:
+    """
+    多只股票日K数据的对齐面板
+
+    每个字段是一个(股票数 x K线数)的二维float64数组，按最近一根K线右对齐：
+    最后一列是每只股票最新的K线，历史不足的部分在左侧以NaN填充。
+    因子在整个面板上一次向量化计算，不再逐只股票循环。
+
+    属性：
+        codes (list): 股票代码，与数组的行一一对应
+        lengths (ndarray): 每只股票的有效K线数
+        fields (dict): 字段名 -> 二维数组
+    """
+
+    def __init__(self, codes, lengths, fields):
+        self.codes = list(codes)
+        self.lengths = np.asarray(lengths, dtype='int64')
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    @property
+    def width(self):
+        """面板的K线数（列数）"""
+        return next(iter(self.fields.values())).shape[1] if self.fields else 0
+
+    def to_series(self, values, name):
+        """将按行排列的因子值转换为以代码为索引的Series"""
+        return pd.Series(values, index=pd.Index(self.codes, name='代码'), name=name)
+
+
+def build_panel(history_data, codes=None, fields=('收盘', '最低'), max_bars=None):
+    """
+    将history_data一次性堆叠为右对齐的面板
+
+    参数：
+        history_data (dict): 以股票代码为键，历史数据DataFrame为值的字典
+        codes (list, optional): 面板包含的股票代码及顺序，默认为history_data的全部键
+        fields (tuple): 需要的字段，例如('收盘', '最低')
+        max_bars (int, optional): 每只股票最多保留的最近K线数，默认保留全部
+
+    返回：
+        Panel: 对齐后的面板
+    """
+    codes = list(history_data.keys()) if codes is None else list(codes)
+    columns = []
+    lengths = np.zeros(len(codes), dtype='int64')
+    for i, code in enumerate(codes):
+        stock_data = history_data.get(code)
+        if stock_data is None or stock_data.empty or any(f not in stock_data.columns for f in fields):
+            columns.append(None)
+            continue
+        # 逐列取底层数组，避免为每只股票构造子DataFrame
+        values = [stock_data[f].to_numpy(dtype='float64') for f in fields]
+        if max_bars is not None:
+            values = [v[-max_bars:] for v in values]
+        columns.append(values)
+        lengths[i] = len(values[0])
+
+    width = int(lengths.max()) if len(lengths) else 0
+    stacked = np.full((len(fields), len(codes), width), np.nan)
+    for i, values in enumerate(columns):
+        if values is not None and lengths[i]:
+            for k, v in enumerate(values):
+                stacked[k, i, width - lengths[i]:] = v
+    return Panel(codes, lengths, {field: stacked[k] for k, field in enumerate(fields)})
+
+
+def tail_mean(panel, field, window):
+    """
+    每只股票最近window根K线某字段的均值
+
+    返回：
+        ndarray: 均值，有效K线不足window根的股票为NaN
+    """
+    values = panel[field]
+    result = np.full(len(panel), np.nan)
+    if panel.width < window or window <= 0:
+        return result
+    valid = panel.lengths >= window
+    result[valid] = values[valid, -window:].mean(axis=1)
+    return result
+
+
+def window_return(panel, field, window):
+    """
+    每只股票的window日收益率：最新值相对window根K线之前的变化比例
+
+    返回：
+        ndarray: 收益率，有效K线不超过window根的股票为NaN；基准价格非正时为0
+    """
+    values = panel[field]
+    result = np.full(len(panel), np.nan)
+    if panel.width <= window:
+        return result
+    valid = panel.lengths > window
+    first = values[valid, -window - 1]
+    last = values[valid, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[valid] = np.where(first > 0, (last - first) / first, 0.0)
+    return result
@@ -0,0 +1,149 @@
+import importlib
+import logging
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from factor.panel import build_panel, tail_mean, window_return
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# 已注册的因子：因子列名 -> FactorSpec，按注册顺序排列
+FACTORS = {}
+_discovered = False
+
+PANEL_SECONDS = metrics.histogram('factor_panel_seconds', '日K堆叠为共享面板的耗时')
+FACTOR_SECONDS = metrics.histogram('factor_compute_seconds', '单个因子的计算耗时', ('factor',))
+
+
+class FactorSpec:
+    """
+    因子声明
+
+    属性：
+        column (str): 因子值列名，例如'支撑位'
+        score_column (str): 百分位评分列名，例如'支撑位评分'
+        fields (tuple): 计算所需的日K字段
+        lookback (int): 计算所需的最少K线数
+        compute (callable): compute(ctx) -> ndarray，按ctx.panel的行顺序返回因子值，数据不足处为NaN
+        ascending (bool): 评分方向，True表示因子值越大评分越高
+    """
+
+    def __init__(self, column, score_column, fields, lookback, compute, ascending=True):
+        self.column = column
+        self.score_column = score_column
+        self.fields = tuple(fields)
+        self.lookback = int(lookback)
+        self.compute = compute
+        self.ascending = ascending
+
+
+def register_factor(column, fields, lookback, score_column=None, ascending=True):
+    """
+    因子注册装饰器，factor/下的各因子模块用它声明所需字段和回看窗口
+
+    用法：
+        @register_factor('支撑位', fields=('最低',), lookback=5)
+        def support_factor(ctx):
+            return ctx.tail_mean('最低', 5)
+    """
+    def decorator(func):
+        FACTORS[column] = FactorSpec(column, score_column or f'{column}评分', fields, lookback, func, ascending)
+        return func
+    return decorator
+
+
+class FactorContext:
+    """
+    因子计算上下文，持有共享面板并缓存中间结果
+
+    多个因子共用的中间量（例如同一窗口的收益率、近期最低价均值）只计算一次。
+    """
+
+    def __init__(self, panel):
+        self.panel = panel
+        self._cache = {}
+
+    def cached(self, key, func):
+        """按key缓存func()的结果"""
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    def tail_mean(self, field, window):
+        return self.cached(('tail_mean', field, window), lambda: tail_mean(self.panel, field, window))
+
+    def window_return(self, field, window):
+        return self.cached(('window_return', field, window), lambda: window_return(self.panel, field, window))
+
+
+def discover_factors():
+    """导入factor/下所有*_factor.py模块，使其中声明的因子完成注册"""
+    global _discovered
+    factor_dir = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(os.listdir(factor_dir)):
+        if filename.endswith('_factor.py') and filename != 'multi_factor.py':
+            importlib.import_module(f'factor.{filename[:-3]}')
+    _discovered = True
+
+
+def get_factors(names=None):
+    """返回指定名称（默认全部）的已注册因子"""
+    if not _discovered:
+        discover_factors()
+    if names is None:
+        return list(FACTORS.values())
+    return [FACTORS[name] for name in names]
+
+
+def required_fields(factors):
+    """所有因子所需字段的并集，保持声明顺序"""
+    fields = []
+    for spec in factors:
+        fields.extend(f for f in spec.fields if f not in fields)
+    return tuple(fields)
+
+
+def required_lookback(factors):
+    """所有因子中最大的回看K线数"""
+    return max((spec.lookback for spec in factors), default=0)
+
+
+def lookback_days(bars):
+    """将所需K线数换算为需要请求的自然日数，每周5个交易日，另留出节假日余量"""
+    return math.ceil(bars * 7 / 5) + 20
+
+
+def compute_factors(history_data, codes=None, names=None, panel=None):
+    """
+    在一个共享面板上计算全部已注册因子，并一次性合并为结果表
+
+    参数：
+        history_data (dict): 以股票代码为键，历史数据DataFrame为值的字典
+        codes (list, optional): 需要计算的股票代码及顺序
+        names (list, optional): 需要计算的因子列名，默认全部已注册因子
+        panel (Panel, optional): 已堆叠好的面板，传入时不再从history_data构建
+
+    返回：
+        DataFrame: 包含['代码']、各因子值列和各评分列；任一因子数据不足的股票被剔除
+    """
+    factors = get_factors(names)
+    if panel is None:
+        with PANEL_SECONDS.time():
+            panel = build_panel(history_data, codes=codes, fields=required_fields(factors),
+                                max_bars=required_lookback(factors))
+    ctx = FactorContext(panel)
+
+    columns = {'代码': panel.codes}
+    for spec in factors:
+        with FACTOR_SECONDS.time(factor=spec.column):
+            columns[spec.column] = np.asarray(spec.compute(ctx), dtype='float64')
+        logger.debug(f'{spec.column}因子计算完成')
+    result_df = pd.DataFrame(columns).dropna(subset=[spec.column for spec in factors]).reset_index(drop=True)
+
+    # 标准化处理：将各因子转换为百分位评分（0-1之间）
+    for spec in factors:
+        result_df[spec.score_column] = result_df[spec.column].rank(ascending=spec.ascending) / len(result_df)
+    return result_df
@@ -0,0 +1,139 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 选股只需要代码和成交额，其余列按需保留
+SPOT_COLUMNS = ('代码', '名称', '成交额')
+# 按代码前缀划分的板块：(前缀, 板块)，更长的前缀优先
+BOARD_PREFIXES = (
+    ('688', '科创板'), ('689', '科创板'),
+    ('300', '创业板'), ('301', '创业板'),
+    ('60', '沪主板'),
+    ('000', '深主板'), ('001', '深主板'), ('002', '深主板'), ('003', '深主板'),
+    ('4', '北交所'), ('8', '北交所'), ('92', '北交所'),
+)
+BOARDS = ('沪主板', '深主板', '创业板', '科创板', '北交所', '其他')
+
+
+def project_spot(spot, columns=SPOT_COLUMNS):
+    """
+    把全市场实时行情投影为选股所需的紧凑表
+
+    只保留columns中的列；代码统一列名，数值列转为float64，另加按代码前缀划分的板块列（category）。
+
+    参数：
+        spot (DataFrame): ak.stock_zh_a_spot()等接口返回的实时行情
+        columns (tuple): 需要保留的列
+
+    返回：
+        DataFrame: 投影后的行情，包含columns各列和'板块'列
+    """
+    if "股票代码" in spot.columns and "代码" not in spot.columns:
+        spot = spot.rename(columns={"股票代码": "代码"})
+    data = {}
+    for column in columns:
+        if column not in spot.columns:
+            continue
+        values = spot[column]
+        if column not in ('代码', '名称'):
+            values = pd.to_numeric(values, errors='coerce').astype('float64')
+        data[column] = values.to_numpy()
+    projected = pd.DataFrame(data)
+    projected['板块'] = board_of(projected['代码'])
+    return projected
+
+
+def _board_table():
+    """前三位数字(0-999) -> BOARDS下标的查找表"""
+    table = np.full(1000, BOARDS.index('其他'), dtype='int8')
+    for prefix, board in reversed(BOARD_PREFIXES):
+        start = int(prefix.ljust(3, '0'))
+        table[start:start + 10 ** (3 - len(prefix))] = BOARDS.index(board)
+    return table
+
+
+_BOARD_TABLE = _board_table()
+
+
+def board_of(codes):
+    """
+    按代码前缀判断所属板块，代码可带sh/sz/bj前缀
+
+    把代码转为定长Unicode数组后按码点整体运算，取6位代码的前三位查表，不逐个代码做字符串处理。
+
+    返回：
+        Categorical: 板块，取值为BOARDS之一
+    """
+    codes = np.asarray(codes).astype(str)
+    width = max(codes.dtype.itemsize // 4, 1)
+    chars = codes.view('<u4').reshape(len(codes), width).astype('int64') if len(codes) else np.zeros((0, width), 'int64')
+    lengths = (chars != 0).sum(axis=1)
+    rows = np.arange(len(codes))
+    start = np.clip(lengths - 6, 0, width - 1)
+    digits = [chars[rows, np.minimum(start + j, width - 1)] - ord('0') for j in range(3)]
+    valid = (lengths >= 6) & np.logical_and.reduce([(d >= 0) & (d <= 9) for d in digits])
+    prefix = np.where(valid, digits[0] * 100 + digits[1] * 10 + digits[2], 0)
+    index = np.where(valid, _BOARD_TABLE[prefix], BOARDS.index('其他'))
+    if width >= 2:
+        index = np.where((chars[:, 0] == ord('b')) & (chars[:, 1] == ord('j')), BOARDS.index('北交所'), index)
+    return pd.Categorical.from_codes(index, categories=BOARDS)
+
+
+def top_k(values, k):
+    """
+    用一次部分选择（np.partition，O(n)）取最大的k个值的下标，按值从大到小排列
+
+    NaN（例如停牌股票没有成交额）不参与选择；k大于有效元素数时只返回有效元素，不用NaN补足。
+
+    返回：
+        ndarray: 下标数组
+    """
+    values = np.asarray(values, dtype='float64')
+    valid = np.flatnonzero(~np.isnan(values))
+    keys = values[valid]
+    k = min(k, len(keys))
+    if k <= 0:
+        return np.empty(0, dtype='int64')
+    if k < len(keys):
+        threshold = -np.partition(-keys, k - 1)[k - 1]
+        # 与第k大相同的值可能有多个，和nlargest一样取最靠前的
+        above = np.flatnonzero(keys > threshold)
+        candidates = np.concatenate([above, np.flatnonzero(keys == threshold)[:k - len(above)]])
+    else:
+        candidates = np.arange(len(keys))
+    # 只对选出的k个排序；值相同时按原始顺序
+    return valid[candidates[np.lexsort((candidates, -keys[candidates]))]]
+
+
+def select_universes(snapshot, top=(100,), per_board=None, by='成交额'):
+    """
+    从同一个行情快照一次性选出多个股票池
+
+    全市场只做一次部分选择（取所需的最大k），各top-k股票池是它的前缀；按板块的股票池在各板块内分别部分选择。
+    返回行号而不是子表，多个策略共用同一份快照，需要时再用snapshot.iloc[rows]取出。
+
+    参数：
+        snapshot (DataFrame): project_spot投影后的行情
+        top (tuple): 全市场前k的股票池，例如(100, 500)
+        per_board (int, optional): 每个板块选取的股票数，为None时不按板块选取
+        by (str): 排序列，默认成交额
+
+    返回：
+        dict: 股票池名称 -> 按by从大到小排列的行号数组；名称为'top100'、'创业板top20'等
+    """
+    values = snapshot[by].to_numpy(dtype='float64')
+    universes = {}
+    if top:
+        order = top_k(values, max(top))
+        for k in top:
+            universes[f'top{k}'] = order[:k]
+    if per_board:
+        boards = snapshot['板块'].cat.codes.to_numpy()
+        for code, board in enumerate(snapshot['板块'].cat.categories):
+            rows = np.flatnonzero(boards == code)
+            if len(rows):
+                universes[f'{board}top{per_board}'] = rows[top_k(values[rows], per_board)]
+    return universes
@@ -1,9 +1,29 @@
 import re,os
+import argparse
 import json
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import akshare as ak
 import time as t
+import threading
+from utils.event_store import ChangeStore
+from utils.change_history import ChangeHistory
+from utils.concept_heat import HEAT_SNAPSHOT_PATH, ConceptHeat
+from utils.concept_index import ConceptIndex
+from utils.fetcher import AdaptiveTokenBucket, fetch_concurrently
+from utils.feed import EventPublisher
+from utils import metrics
+from utils.shared_snapshot import SnapshotWriter
+from utils.replay import RecordingSession
+from utils.scheduler import TickScheduler, TradingCalendar, refresh_trade_dates
+from utils.supervisor import exit_with_supervisor, hold_watch_lock
+from utils.table_store import HAS_ARROW, latest_path, read_table, table_paths, write_table
+from datetime import datetime
 
 HEADERS = {
     'Accept': '*/*',
@@ -18,153 +38,294 @@ HEADERS = {
     'sec-ch-ua-platform': '"macOS"',
 }
 
+RISING_CONCEPTS_URL = 'https://79.push2.eastmoney.com/api/qt/clist/get'
+REQUEST_TIMEOUT = (3.05, 5)  # (连接, 读取)超时秒数
+
+def createSession(pool_size=4, retries=2, backoff_factor=0.2):
+    """
+    创建带连接池和重试预算的会话，所有请求复用keep-alive连接，避免每次轮询重新握手
+
+    参数：
+        pool_size (int): 每个主机的最大连接数
+        retries (int): 连接错误和429/5xx的最大重试次数
+        backoff_factor (float): 重试退避系数
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+SESSION = createSession()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fluctuation')
+
+_default_store = None
+
+# 监控进程的指标，每次轮询后写到cache/metrics/watch.json，由API的/metrics输出
+# 各阶段：fetch(HTTP请求)、parse(JSONP解析)、normalize(规范化，含concept_join)、concept_join(股票->板块)、persist(合并与写日志)
+STAGE_SECONDS = metrics.histogram('watch_stage_seconds', '监控进程各阶段耗时', ('stage',))
+FETCH_ERRORS = metrics.counter('watch_fetch_errors_total', '请求失败次数（重试用尽后）', ('endpoint',))
+PARSE_ERRORS = metrics.counter('watch_parse_errors_total', '无法解析的响应数')
+TICKS = metrics.counter('watch_ticks_total', '轮询次数', ('outcome',))
+EVENTS = metrics.counter('watch_events_total', '收到的新异动条数')
+ROWS_CHANGED = metrics.counter('watch_rows_changed_total', '新增或变化的展示行数')
+STORE_ROWS = metrics.gauge('watch_store_rows', '当前去重异动表的行数')
+STORE_VERSION = metrics.gauge('watch_store_version', '当前异动表的版本号')
+
+def get_default_store():
+    """进程内共享的异动状态，首次使用时从快照和日志恢复；之前交易日的异动归档到static/history"""
+    global _default_store
+    if _default_store is None:
+        os.makedirs('static', exist_ok=True)
+        _default_store = ChangeStore(history=ChangeHistory()).load()
+    return _default_store
+
 def parse_jsonp(jsonp_str):
     if not jsonp_str or not isinstance(jsonp_str, str):
-        print("错误：输入不是有效的字符串")
+        PARSE_ERRORS.inc()
         return None
-    print("\n原始响应前100个字符:", jsonp_str[:100])
-    match = re.match(r'^[a-zA-Z0-9_]+\s*\(\s*(.*)\s*\)\s*;?\s*$', jsonp_str.strip(), re.DOTALL)
-    if match:
-        json_str = match.group(1)
-        data = json.loads(json_str)
-        print("JSON解析成功！")
-        return data
-    else:
-        return json.loads(jsonp_str)
+    with STAGE_SECONDS.time(stage='parse'):
+        match = re.match(r'^[a-zA-Z0-9_]+\s*\(\s*(.*)\s*\)\s*;?\s*$', jsonp_str.strip(), re.DOTALL)
+        try:
+            return json.loads(match.group(1) if match else jsonp_str)
+        except json.JSONDecodeError:
+            PARSE_ERRORS.inc()
+            raise
 
 
-def getChanges(concept_df: pd.DataFrame):
-    risingConceptsCodes = getRisingConcepts()
-    # 先取出在risingConceptsCodes中的部分，按顺序排列
-    ordered_df = concept_df[concept_df['板块代码'].isin(risingConceptsCodes)].set_index('板块代码').loc[risingConceptsCodes].reset_index()
-    # 剩下的部分
-    rest_df = concept_df[~concept_df['板块代码'].isin(risingConceptsCodes)]
-    # 拼接
-    changedConcepts_df = pd.concat([ordered_df, rest_df], ignore_index=True)
-    
-    response = requests.get(
-        'https://push2ex.eastmoney.com/getAllStockChanges?type=8201,8202,8193,4,32,64,8207,8209,8211,8213,8215,8204,8203,8194,8,16,128,8208,8210,8212,8214,8216&cb=jQuery35108409427522251944_1753773534498&ut=7eea3edcaed734bea9cbfc24409ed989&pageindex=0&pagesize=1000&dpt=wzchanges&_=1753773534514',
-        headers={**HEADERS, 'Referer': 'https://quote.eastmoney.com/changes/'},
-    )
-    
+CHANGES_URL = 'https://push2ex.eastmoney.com/getAllStockChanges'
+CHANGE_TYPES = '8201,8202,8193,4,32,64,8207,8209,8211,8213,8215,8204,8203,8194,8,16,128,8208,8210,8212,8214,8216'
+PAGE_SIZE = 200
+MAX_PAGES = 20
+
+class ChangeCursor:
+    """
+    异动推送的高水位：已处理的最新时间，以及该时间上已处理过的(代码, 类型)
+
+    接口按时间倒序返回，时间早于高水位、或等于高水位且键已出现过的行都已处理过。
+    跨日时自动重置。
+    """
+
+    def __init__(self):
+        self.day = None
+        self.tm = -1
+        self.seen_at_tm = set()
+
+    def _roll_day(self):
+        today = t.strftime('%Y%m%d')
+        if today != self.day:
+            self.day, self.tm, self.seen_at_tm = today, -1, set()
+
+    def is_new(self, row):
+        tm = int(row['tm'])
+        return tm > self.tm or (tm == self.tm and (row['c'], row['t']) not in self.seen_at_tm)
+
+    def new_rows(self, rows):
+        """在构造DataFrame之前过滤掉已处理过的原始行"""
+        self._roll_day()
+        return [row for row in rows if self.is_new(row)]
+
+    def advance(self, rows):
+        """把高水位推进到这批新行中的最新时间"""
+        for row in rows:
+            tm = int(row['tm'])
+            if tm > self.tm:
+                self.tm, self.seen_at_tm = tm, set()
+            if tm == self.tm:
+                self.seen_at_tm.add((row['c'], row['t']))
+
+@contextmanager
+def _count_errors(endpoint):
+    """请求抛出异常时计数后继续抛出"""
+    try:
+        yield
+    except Exception:
+        FETCH_ERRORS.inc(endpoint=endpoint)
+        raise
+
+def fetchChangePage(pageindex=0, pagesize=PAGE_SIZE, session: requests.Session = None):
+    """获取一页异动推送（按时间倒序），返回原始行列表"""
+    session = session or SESSION
+    with STAGE_SECONDS.time(stage='fetch'), _count_errors('changes'):
+        response = session.get(
+            CHANGES_URL,
+            params={
+                'type': CHANGE_TYPES,
+                'cb': 'jQuery35108409427522251944_1753773534498',
+                'ut': '7eea3edcaed734bea9cbfc24409ed989',
+                'pageindex': pageindex,
+                'pagesize': pagesize,
+                'dpt': 'wzchanges',
+                '_': int(t.time() * 1000),
+            },
+            headers={'Referer': 'https://quote.eastmoney.com/changes/'},
+            timeout=REQUEST_TIMEOUT,
+        )
     # 解析JSONP响应
     data = parse_jsonp(response.text)
+    if data and data.get('data') and 'allstock' in data['data']:
+        return data['data']['allstock'] or []
+    return []
+
+def pollNewChanges(cursor: ChangeCursor, pagesize=PAGE_SIZE, max_pages=MAX_PAGES, session: requests.Session = None):
+    """
+    只取高水位之后的新异动
+
+    若整页都是新行且页已满，说明两次轮询之间的新事件超过一页，继续向后翻页直到遇到已处理的行。
+    """
+    new_rows = []
+    for pageindex in range(max_pages):
+        rows = fetchChangePage(pageindex, pagesize, session)
+        fresh = cursor.new_rows(rows)
+        new_rows.extend(fresh)
+        if len(rows) < pagesize or len(fresh) < len(rows):
+            break
+    else:
+        print(f"警告：新异动超过{max_pages}页，更早的事件可能被遗漏")
+    cursor.advance(new_rows)
+    return new_rows
+
+_default_cursor = ChangeCursor()
+
+# 异动类型代码 -> 名称
+TYPE_MAPPING = {
+    8201: '火箭发射',
+    8202: '快速反弹',
+    8193: '大笔买入',
+    4: '封涨停板',
+    32: '打开跌停板',
+    64: '有大买盘',
+    8207: '竞价上涨',
+    8209: '高开5日线',
+    8211: '向上缺口',
+    8213: '60日新高',
+    8215: '60日大幅上涨',
+    8204: '加速下跌',
+    8203: '高台跳水',
+    8194: '大笔卖出',
+    8: '封跌停板',
+    16: '打开涨停板',
+    128: '有大卖盘',
+    8208: '竞价下跌',
+    8210: '低开5日线',
+    8212: '向下缺口',
+    8214: '60日新低',
+    8216: '60日大幅下跌',
+}
+# 过滤掉的负面类型：大笔卖出、封跌停板、竞价下跌、向下缺口、60日新低、60日大幅下跌、高台跳水、加速下跌等
+NEGATIVE_TYPES = [8194, 8, 128, 8208, 8210, 8212, 8214, 8216, 8203, 99, 106]
+# 类型查找表：get_indexer找不到时返回-1，正好取到末尾的'未知类型'
+_TYPE_CODES = pd.Index(list(TYPE_MAPPING))
+_TYPE_LABELS = np.array(list(TYPE_MAPPING.values()) + ['未知类型'], dtype=object)
+# 一天内每分钟的'HH:MM'，按分钟数下标取，避免逐行格式化
+_MINUTE_LABELS = np.array([f'{m // 60:02d}:{m % 60:02d}' for m in range(24 * 60)], dtype=object)
+# 涨跌幅'+1.23%'查表：下标为以0.01%为单位的涨跌幅加偏移，覆盖±100%（涨跌幅过滤条件是小于100%）
+_PERCENT_CENTS = 10000
+_PERCENT_LABELS = np.array(['%+.2f%%' % (c / 100) for c in range(-_PERCENT_CENTS, _PERCENT_CENTS + 1)], dtype=object)
+
+def formatPercent(percent):
+    """
+    涨跌幅（单位%）格式化为'+1.23%'，结果与逐个'%+.2f%%' % v完全一致
+
+    先乘100取整后查表；乘法有舍入误差，离进位边界(.5)过近、为0或超出表范围的少数值仍逐个格式化。
+    """
+    scaled = percent * 100
+    cents = np.rint(scaled)
+    exact = (np.abs(np.abs(scaled - cents) - 0.5) > 1e-6) & (np.abs(cents) <= _PERCENT_CENTS) & (cents != 0)
+    labels = np.empty(len(percent), dtype=object)
+    labels[exact] = _PERCENT_LABELS[cents[exact].astype('int64') + _PERCENT_CENTS]
+    rest = ~exact
+    if rest.any():
+        labels[rest] = ['%+.2f%%' % v for v in percent[rest].tolist()]
+    return labels
+HTML_COLUMNS = ['板块名称', '时间', '名称', '相关信息', '类型', '四舍五入取整', '上下午', '时间排序', '股票代码', '日期']
+
+def normalizeChanges(rows, concepts, day=None):
+    """
+    把异动推送的原始行转换为页面展示的格式
+
+    原始行只按字段取一次列，之后整个转换按列向量化进行：时间按整数HHMMSS拆出分钟数并查表得到'HH:MM'，
+    类型和涨跌幅文本通过查找表映射，排序用整数键的lexsort，不再逐行apply。
+
+    参数：
+        rows (list): 异动推送的原始行（字典，键为c/n/tm/t/i等）
+        concepts (ConceptIndex): 股票 -> 概念板块索引
+        day (int, optional): 这批异动所属的交易日YYYYMMDD，默认为今天
+
+    返回：
+        DataFrame: HTML_COLUMNS各列，按上下午、板块名称、时间排序
+    """
+    codes = np.array([row.get('c') for row in rows], dtype=object)
+    names = np.array([row.get('n') for row in rows], dtype=object)
+    tm = pd.to_numeric([row.get('tm') for row in rows], errors='coerce')
+    types = pd.to_numeric([row.get('t') for row in rows], errors='coerce')
+    # 信息字段为"涨跌幅,最新价,涨跌额"，只取涨跌幅
+    pct = pd.to_numeric([str(row.get('i')).split(',', 1)[0] for row in rows], errors='coerce')
+    pct, types = np.asarray(pct, dtype='float64'), np.asarray(types, dtype='float64')
+
+    keep = (pct < 1) & (np.abs(pct) >= 0.05) & ~np.isin(types, NEGATIVE_TYPES)
+    codes, names, pct, types = codes[keep], names[keep], pct[keep], types[keep]
+    tm = np.nan_to_num(np.asarray(tm, dtype='float64')[keep]).astype('int64')
+    minutes = (tm // 10000) * 60 + (tm // 100) % 100
+    afternoon = minutes >= 12 * 60
+    with STAGE_SECONDS.time(stage='concept_join'):
+        boards = concepts.lookup_many(codes)
+
+    # 按上下午、板块名称（无板块的排最后）、时间排序，与sort_values的结果一致且稳定
+    board_order, _ = pd.factorize(boards, sort=True)
+    board_order[board_order < 0] = len(board_order)
+    order = np.lexsort((minutes, board_order, afternoon))
+
+    percent = pct[order] * 100
+    return pd.DataFrame({
+        '板块名称': boards[order],
+        '时间': _MINUTE_LABELS[minutes[order]],
+        '名称': names[order],
+        '相关信息': formatPercent(percent),
+        '类型': _TYPE_LABELS[_TYPE_CODES.get_indexer(types[order])],
+        '四舍五入取整': np.round(percent).astype('int64'),
+        '上下午': np.where(afternoon[order], '下午', '上午').astype(object),
+        '时间排序': minutes[order],
+        '股票代码': codes[order],
+        '日期': day or int(t.strftime('%Y%m%d')),
+    }, columns=HTML_COLUMNS)
+
+def getChanges(concepts, store: ChangeStore = None, cursor: ChangeCursor = None, session: requests.Session = None):
+    """concepts为预计算的ConceptIndex；传入概念成分DataFrame时临时构建索引"""
+    if not isinstance(concepts, ConceptIndex):
+        concepts = ConceptIndex(concepts)
+    cursor = cursor or _default_cursor
+    # 板块涨幅榜与异动推送两个请求并发进行
+    rising_future = _executor.submit(getRisingConcepts, session)
+    new_rows = pollNewChanges(cursor, session=session)
+    EVENTS.inc(len(new_rows))
+    if not new_rows:
+        return 0
     
-    if data and 'data' in data and 'allstock' in data['data']:
-        # 转换为DataFrame
-        df = pd.DataFrame(data['data']['allstock'])
-        
-        # 重命名列名，使其更易读
-        column_mapping = {
-            'c': '股票代码',
-            'n': '股票名称',
-            'tm': '时间',
-            'm': '市场',
-            't': '类型',
-            'i': '信息'
-        }
-        df = df.rename(columns=column_mapping)
-        
-        # 解析info字段（包含涨跌幅、最新价、涨跌额）
-        if '信息' in df.columns:
-            info_df = df['信息'].str.split(',', expand=True)
-            if len(info_df.columns) >= 3:
-                # 清理并转换数据
-                info_df[0] = pd.to_numeric(info_df[0], errors='coerce')
-
-                if not df.empty:
-                    df['涨跌幅'] = info_df[0]
-                
-            df = df[(df['涨跌幅'] < 1) & ((df['涨跌幅'] >= 0.05) | (df['涨跌幅'] <= -0.05))]
-        
-        # 过滤掉负面类型
-        negative_types = ['8194', '8', '128', '8208', '8210', '8212', '8214', '8216', '8203', '99', '106']  # 包含大笔卖出、封跌停板、竞价下跌、向下缺口、60日新低、60日大幅下跌、高台跳水、加速下跌等
-        df = df[~df['类型'].astype(str).isin(negative_types)]
-        
-        # 转换为指定的输出格式
-        def format_time(tm):
-            """将时间戳格式化为 HH:MM"""
-            tm_str = str(tm)
-            if len(tm_str) < 6:
-                tm_str = tm_str.zfill(6)
-            return f"{tm_str[:2]}:{tm_str[2:4]}"  # 只返回小时和分钟
-        
-        # 创建新的DataFrame用于输出
-        output_df = pd.DataFrame()
-        output_df['股票代码'] = df['股票代码']
-        output_df['时间'] = df['时间'].apply(format_time)
-        output_df['名称'] = df['股票名称']
-        # 直接放原始类型和涨跌幅，便于调试
-        output_df['原始类型'] = df['类型']
-        output_df['原始涨跌幅'] = df['涨跌幅']
-        
-        # 类型映射字典
-        type_mapping = {
-            '8201': '火箭发射',
-            '8202': '快速反弹',
-            '8193': '大笔买入',
-            '4': '封涨停板',
-            '32': '打开跌停板',
-            '64': '有大买盘',
-            '8207': '竞价上涨',
-            '8209': '高开5日线',
-            '8211': '向上缺口',
-            '8213': '60日新高',
-            '8215': '60日大幅上涨',
-            '8204': '加速下跌',
-            '8203': '高台跳水',
-            '8194': '大笔卖出',
-            '8': '封跌停板',
-            '16': '打开涨停板',
-            '128': '有大卖盘',
-            '8208': '竞价下跌',
-            '8210': '低开5日线',
-            '8212': '向下缺口',
-            '8214': '60日新低',
-            '8216': '60日大幅下跌'
-        }
-        # 增加映射后的类型和相关信息，便于对比
-        output_df['类型'] = df['类型'].astype(str).map(type_mapping).fillna('未知类型')
-        # 先加一列'四舍五入取整'，在加百分号前处理
-        output_df['四舍五入取整'] = df['涨跌幅'].apply(lambda x: int(round(x * 100)) if pd.notnull(x) else None)
-        output_df['相关信息'] = df['涨跌幅'].apply(
-            lambda x: f"%+.2f" % (x * 100) + "%" if pd.notnull(x) else 'NaN'
-        )
-        
-
-        first_concept_df = changedConcepts_df.drop_duplicates(subset=['股票代码'], keep='first')
-        output_df = pd.merge(output_df, first_concept_df[['股票代码', '板块名称']], on='股票代码', how='left')
-
-        output_df = output_df.sort_values('时间')       
-
-        # 先排序再加上午/下午列
-        html_df = output_df[['板块名称', '时间', '名称', '相关信息','类型', '四舍五入取整']].copy()
-        def am_pm_col(tm):
-            hour = int(tm[:2])
-            return '上午' if hour < 12 else '下午'
-        html_df['上下午'] = html_df['时间'].apply(am_pm_col)
-        # 新增一列用于排序，转为分钟数
-        html_df['时间排序'] = html_df['时间'].apply(lambda tm: int(tm[:2])*60 + int(tm[3:5]))
-        html_df = html_df.sort_values(['上下午','板块名称', '时间排序'])
-        # 确保 static 目录存在
-        os.makedirs('static', exist_ok=True)
-        # 保存到 static 目录下
-        # 保存为csv，追加且去重（股票代码+时间+四舍五入取整）
-        csv_file = 'static/changes.csv'
-        if os.path.exists(csv_file):
-            old_df = pd.read_csv(csv_file)
-            combined = pd.concat([old_df, html_df], ignore_index=True)
-            # 去重，保留最新一条
-            combined = combined.drop_duplicates(subset=['名称', '类型'], keep='last')
-            combined.to_csv(csv_file, index=False, encoding='utf-8')
-        else:
-            html_df.drop_duplicates(subset=['名称', '类型'], keep='last').to_csv(csv_file, index=False, encoding='utf-8')
-        print(f"已保存到{csv_file}，当前总行数：", pd.read_csv(csv_file).shape[0])
-
-
-def getRisingConcepts():
+    # 涨幅榜变化时只对每只股票的所属板块重新排序；涨幅榜请求失败时沿用上次排名
+    try:
+        concepts.rank(rising_future.result())
+    except Exception as e:
+        print(f"获取板块涨幅榜失败，沿用上次排名: {e}")
     
-    url = "https://79.push2.eastmoney.com/api/qt/clist/get"
+    with STAGE_SECONDS.time(stage='normalize'):
+        html_df = normalizeChanges(new_rows, concepts, int(cursor.day))
+    # 合并到内存去重状态，只把新增或变化的行追加到日志，定期压缩为static/changes快照
+    if store is None:
+        store = get_default_store()
+    with STAGE_SECONDS.time(stage='persist'):
+        changed = store.upsert(html_df)
+    ROWS_CHANGED.inc(len(changed))
+    print(f"新增或变化{len(changed)}条，当前总行数：", len(store))
+    return len(new_rows)
+
+
+def getRisingConcepts(session: requests.Session = None):
+    session = session or SESSION
+    url = RISING_CONCEPTS_URL
     params = {
         "pn": "1",
         "pz": "200",
@@ -178,47 +339,216 @@ def getRisingConcepts():
         "fields": "f3,f12,f14,f20",
         "_": "1626075887768",
     }
-    response=requests.get(url=url,params=params,headers={**HEADERS, 'Referer': 'https://quote.eastmoney.com/center/gridlist.html'})
+    with STAGE_SECONDS.time(stage='fetch_rising'), _count_errors('rising'):
+        response=session.get(url=url,params=params,headers={'Referer': 'https://quote.eastmoney.com/center/gridlist.html'},timeout=REQUEST_TIMEOUT)
     data = parse_jsonp(response.text)['data']['diff']
     bkcodes = [ x['f12'] for x in data if int(x['f20'])<5000000000000 and not '昨日' in x['f14']]
     return bkcodes
 
-def getConcepts():
-    concepts=[['板块代码','板块名称','股票代码','股票名称']]
+CONCEPTS_BASE = 'static/concepts'
+CONCEPTS_FILE = table_paths(CONCEPTS_BASE)['csv']
+CONCEPT_BOARDS_FILE = 'static/concepts.boards.jsonl'
+
+def loadBoardRecords(path=CONCEPT_BOARDS_FILE):
+    """读取逐板块的抓取记录（检查点），返回 板块代码 -> 记录"""
+    records = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 崩溃时最后一行可能只写了一半
+                records[record['板块代码']] = record
+    return records
+
+def isBoardStale(record, board, cap_tolerance):
+    """板块成分可能变化：涨跌家数超过已抓取的成分数，或总市值偏离超过cap_tolerance"""
+    active = int(board.get('上涨家数') or 0) + int(board.get('下跌家数') or 0)
+    if active > record['成分数']:
+        return True
+    old_cap, new_cap = float(record['总市值'] or 0), float(board['总市值'] or 0)
+    return abs(new_cap - old_cap) > cap_tolerance * max(old_cap, 1)
+
+def getConcepts(refresh=False, max_workers=4, rate_limit=2.0, cap_tolerance=0.05):
+    """
+    抓取全部概念板块成分并保存为static/concepts.csv，有pyarrow时另存一份Feather供监控进程快速加载
+
+    使用有界线程池并发抓取，自适应限流（成功提速、失败降速）。
+    每抓完一个板块立即追加一条记录到static/concepts.boards.jsonl，中断后再次运行会跳过已完成的板块；
+    删除该文件即可强制全量重新抓取。
+
+    参数：
+        refresh (bool): 增量刷新模式，只重新抓取新增板块和成分可能变化的板块
+        max_workers (int): 最大并发数
+        rate_limit (float): 初始每秒请求数
+        cap_tolerance (float): 增量刷新时总市值的相对变化阈值
+    """
     stock_board_concept_name_em_df = ak.stock_board_concept_name_em()
     stock_board_concept_name_em_df.sort_values(by='总市值',ascending=True,inplace=True)
-    for k,v in stock_board_concept_name_em_df.iterrows():
-        if int(v['总市值'])>30000000000000 or '昨日' in v['板块名称']:
-            continue
-        stock_board_concept_spot_em_df = ak.stock_board_concept_cons_em(symbol=v['板块代码'])
-        for k2,v2 in stock_board_concept_spot_em_df.iterrows():
-            row = [v['板块代码'],v['板块名称'],v2['代码'],v2['名称']]
-            concepts.append(row)
-        print(v['板块名称'],len(concepts))
-        if len(concepts)%20==0:
-            t.sleep(15)
+    boards = [v for _, v in stock_board_concept_name_em_df.iterrows()
+              if not (int(v['总市值'])>30000000000000 or '昨日' in v['板块名称'])]
+
+    records = loadBoardRecords(CONCEPT_BOARDS_FILE)
+    if refresh:
+        stale = {v['板块代码'] for v in boards
+                 if v['板块代码'] in records and isBoardStale(records[v['板块代码']], v, cap_tolerance)}
+        for code in stale:
+            del records[code]
+        print(f"增量刷新：{len(stale)}个板块成分可能变化")
+    pending = [v for v in boards if v['板块代码'] not in records]
+    print(f"共{len(boards)}个板块，已完成{len(boards)-len(pending)}个，待抓取{len(pending)}个")
+
+    lock = threading.Lock()
+    pending_boards = {v['板块代码']: v for v in pending}
+    def crawl(board_code):
+        board = pending_boards[board_code]
+        cons_df = ak.stock_board_concept_cons_em(symbol=board['板块代码'])
+        record = {
+            '板块代码': board['板块代码'],
+            '板块名称': board['板块名称'],
+            '总市值': float(board['总市值']),
+            '成分数': len(cons_df),
+            '成分': cons_df[['代码', '名称']].values.tolist(),
+        }
+        with lock:
+            # 逐板块写检查点，崩溃后可从断点继续
+            with open(CONCEPT_BOARDS_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            records[record['板块代码']] = record
+            print(board['板块名称'], record['成分数'], f"{len(records)}/{len(boards)}")
+        return record
+
+    os.makedirs('static', exist_ok=True)
+    limiter = AdaptiveTokenBucket(rate_limit, max_rate=rate_limit * 2, capacity=1)
+    fetch_concurrently(list(pending_boards), crawl, max_workers=max_workers, limiter=limiter,
+                       max_retries=5, base_delay=2.0, max_delay=30.0)
+
+    concepts = [[code, record['板块名称'], stock_code, stock_name]
+                for code, record in ((v['板块代码'], records.get(v['板块代码'])) for v in boards) if record
+                for stock_code, stock_name in record['成分']]
+    missing = sum(1 for v in boards if v['板块代码'] not in records)
+    if missing:
+        print(f"警告：{missing}个板块抓取失败，下次运行将继续抓取")
     df = pd.DataFrame(concepts,columns=['板块代码','板块名称','股票代码','股票名称'])
-    df.to_csv('static/concepts.csv',index=False)
+    df.to_csv(CONCEPTS_FILE,index=False)
+    if HAS_ARROW:
+        write_table(df, CONCEPTS_BASE, fmt='feather')
+    # 压缩检查点，只保留当前板块的最新记录
+    with open(CONCEPT_BOARDS_FILE + '.tmp', 'w', encoding='utf-8') as f:
+        for v in boards:
+            if v['板块代码'] in records:
+                f.write(json.dumps(records[v['板块代码']], ensure_ascii=False) + '\n')
+    os.replace(CONCEPT_BOARDS_FILE + '.tmp', CONCEPT_BOARDS_FILE)
+    return df
+
+def loadTradingCalendar():
+    """加载本地交易日历，本地日历未覆盖今天时尝试从akshare更新"""
+    calendar = TradingCalendar.load()
+    if calendar.last_known is None or calendar.last_known < datetime.now().date():
+        try:
+            calendar = refresh_trade_dates()
+        except Exception as e:
+            print(f"更新交易日历失败，按工作日判断交易日: {e}")
+    return calendar
+
+def loadConcepts():
+    """
+    加载概念板块成分
 
-def watch():
-    if not os.path.exists('static/concepts.csv'):
+    优先读取Feather文件（内存映射，无需解析文本）；只有CSV时读取后转存一份Feather，之后的启动直接读二进制文件。
+    """
+    if latest_path(CONCEPTS_BASE) is None:
         getConcepts()
-    concept_df = pd.read_csv('static/concepts.csv')
-    while True:
-        now = t.localtime()
-        now_minutes = now.tm_hour * 60 + now.tm_min
-        # 定义允许的时间段（分钟）
-        allowed_periods = [
-            (9*60+30, 11*60+30),   # 上午9:30-11:30
-            (13*60, 15*60)         # 下午13:00-15:00
-        ]
-        in_period = any(start <= now_minutes <= end for start, end in allowed_periods)
-        if in_period:
-            getChanges(concept_df)
-        t.sleep(2)
+    df = read_table(CONCEPTS_BASE, dtype={'股票代码': str})
+    if HAS_ARROW and not os.path.exists(table_paths(CONCEPTS_BASE)['feather']):
+        write_table(df, CONCEPTS_BASE, fmt='feather')
+    return df
+
+def _today():
+    return int(t.strftime('%Y%m%d'))
+
+def watch(scheduler: TickScheduler = None, record: str = None):
+    """record为录制文件路径时，每个原始响应追加写入该文件，供python -m utils.replay离线回放"""
+    concepts = ConceptIndex(loadConcepts())
+    store = get_default_store()
+    store.roll(_today())
+    cursor = ChangeCursor()
+    # 把新增或变化的行实时推送给API进程，再由API以SSE扇出到页面
+    publisher = EventPublisher().start()
+    store.listeners.append(lambda rows, version: publisher.publish({'type': 'changes', 'version': version, 'rows': rows}))
+    # 按板块增量聚合热度，页面只取聚合结果，展开某个板块时再取该板块的异动
+    heat = ConceptHeat()
+    heat.update(store.records(), store.version)
+    store.listeners.append(heat.update)
+    # 把完整的去重异动表和板块热度发布到共享内存快照，API进程直接映射读取，不再经过文件读写和解析
+    publish = None
+    try:
+        # 心跳让API进程能发现监控进程已退出，改为读取快照文件，而不是一直返回最后一次发布的数据
+        snapshot = SnapshotWriter().start_heartbeat()
+        heat_snapshot = SnapshotWriter(HEAT_SNAPSHOT_PATH).start_heartbeat()
+    except OSError as e:
+        print(f"共享快照不可用，API将读取快照文件: {e}")
+    else:
+        def publish(rows, version):
+            snapshot.publish(version, len(store), store.to_json())
+            heat_snapshot.publish(version, len(heat), heat.to_json())
+        publish(None, store.version)
+        store.listeners.append(publish)
+    # 按固定时间网格轮询，间隔随时段和事件量自适应；非交易时段休眠到下一个交易时段
+    scheduler = scheduler or TickScheduler(loadTradingCalendar(), job='watch')
+    # POST /api/watch/profile 请求后，下一次轮询在剖析器下执行
+    profile = metrics.ProfileTrigger('watch')
+    session = RecordingSession(SESSION, record) if record else None
+
+    def roll():
+        # 进入新交易日：之前的异动归档到按日分区的历史，热度从零开始，通知页面重新同步
+        if not store.roll(_today()):
+            return
+        heat.clear()
+        heat.update(store.records(), store.version)
+        if publish is not None:
+            publish(None, store.version)
+        publisher.publish({'type': 'resync', 'version': store.version})
+
+    def poll():
+        if session is not None:
+            session.next_tick()
+        with STAGE_SECONDS.time(stage='tick'):
+            return getChanges(concepts, store, cursor, session)
+
+    def tick():
+        try:
+            roll()
+            events = profile.run(poll)
+            TICKS.inc(outcome='ok')
+            return events
+        except Exception as e:
+            # 单次轮询失败（重试预算用尽、超时等）不影响后续轮询
+            TICKS.inc(outcome='error')
+            print(f"获取异动失败: {e}")
+            return 0
+        finally:
+            store.maybe_compact()
+            STORE_ROWS.set(len(store))
+            STORE_VERSION.set(store.version)
+            metrics.report('watch')
+
+    scheduler.run(tick, on_idle=store.flush)
 
 def main():
-    watch()
+    parser = argparse.ArgumentParser(description='盘口异动监控')
+    parser.add_argument('--refresh-concepts', action='store_true', help='增量刷新概念板块成分后退出')
+    parser.add_argument('--record', metavar='PATH', help='把每个原始响应录制到PATH（.jsonl.gz）')
+    args = parser.parse_args()
+    if args.refresh_concepts:
+        getConcepts(refresh=True)
+        return
+    # 由API的WatchSupervisor启动时，API进程退出后不留下孤儿监控进程
+    exit_with_supervisor()
+    # 换主期间旧的监控进程可能还在运行，等它退出后再打开推送端口和共享快照
+    lock = hold_watch_lock()
+    watch(record=args.record)
 
 if __name__ == '__main__':
     main()
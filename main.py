@@ -1,48 +1,116 @@
 import asyncio
+import json
 import os
-import signal
-import subprocess
 import sys
+import time
 import pandas as pd
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Query, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from typing import Optional
 import pandas as pd
 import os
+from utils.event_store import ChangesView
+from utils.shared_snapshot import SharedChangesView
+from utils.concept_heat import HeatView
+from utils.change_history import ChangeHistory, filter_rows, parse_days, parse_minute
+from utils.table_store import read_table
+from factor.live import LIVE_RESULT
+from utils.feed import Broadcaster, subscribe_feed
+from utils import metrics
+from utils.supervisor import WatchSupervisor
 
-# Global variable to store the subprocess reference
-watch_process: Optional[subprocess.Popen] = None
+# Snapshot base path without extension: changes.feather when pyarrow is installed, else changes.csv
+CHANGES_SNAPSHOT = "static/changes"
+CHANGES_LOG = "static/changes.log"
+# Served from the watcher's shared-memory snapshot; falls back to the files
+# while the watcher has not published yet
+changes_view = SharedChangesView(fallback=ChangesView(CHANGES_SNAPSHOT, CHANGES_LOG))
+# Per-concept aggregates maintained by the watcher; the dashboard renders these
+# and only fetches raw rows for a concept when it is expanded
+heat_view = HeatView(changes_view)
+# Earlier trading days archived by the watcher, one partition per day
+change_history = ChangeHistory()
+broadcaster = Broadcaster()
+SSE_HEARTBEAT = 15
+FEED_RESTART_DELAY = 1.0
+
+# One watcher per host: every worker runs a supervisor, the one that wins the
+# election on the control port spawns and babysits the watcher, the others
+# forward status and restart requests to it. Scale with `uvicorn main:app --workers N`.
+watch_supervisor = WatchSupervisor([sys.executable, "fluctuation.py"])
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Start the fluctuation watch
-    global watch_process
+    # Startup: elect a leader and, if this worker wins, start the fluctuation watch
+    watch_supervisor.start()
+    role = "leader" if watch_supervisor.is_leader else "follower"
+    print(f"Worker {os.getpid()} is the fluctuation watch {role}")
+    # Relay events pushed by the watcher to the SSE clients; if the relay task ever
+    # dies, log it and start a new one, which resyncs the clients on connect
+    feed_task = None
+    stopping = False
+
+    def start_feed():
+        nonlocal feed_task
+        if stopping:
+            return
+        feed_task = asyncio.create_task(subscribe_feed(broadcaster.publish))
+        feed_task.add_done_callback(restart_feed)
+
+    def restart_feed(task):
+        if stopping or task.cancelled():
+            return
+        print(f"Event feed relay failed: {task.exception()!r}; restarting in {FEED_RESTART_DELAY}s")
+        asyncio.get_running_loop().call_later(FEED_RESTART_DELAY, start_feed)
+
+    start_feed()
     try:
-        watch_process = subprocess.Popen(
-            [sys.executable, "fluctuation.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        print(f"Started fluctuation watch with PID: {watch_process.pid}")
         yield
     finally:
-        # Shutdown: Stop the fluctuation watch
-        if watch_process:
-            watch_process.terminate()
-            try:
-                watch_process.wait(timeout=5)
-                print("Fluctuation watch stopped gracefully")
-            except subprocess.TimeoutExpired:
-                watch_process.kill()
-                print("Fluctuation watch was force stopped")
+        stopping = True
+        feed_task.cancel()
+        # Shutdown: the leader stops the watch and releases the control port to another worker
+        await asyncio.to_thread(watch_supervisor.stop)
 
 app = FastAPI(lifespan=lifespan)
 
+REQUEST_SECONDS = metrics.histogram("api_request_seconds", "API request latency", ("path", "status"))
+
+class RequestMetrics:
+    """
+    Time every HTTP request by route template and status for /metrics
+
+    A plain ASGI middleware rather than @app.middleware: it adds no extra task
+    or body buffering to the polled /api/changes/json path. For the SSE stream
+    the recorded time ends when the response starts.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                route = scope.get("route")
+                REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                        path=getattr(route, "path", "other"), status=status)
+            await send(message)
+
+        await self.app(scope, receive, send_and_record)
+
+app.add_middleware(RequestMetrics)
+
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -56,66 +124,189 @@ os.makedirs("templates", exist_ok=True)
 @app.get("/api/changes/csv")
 async def get_changes_csv():
     """Get changes data in CSV format"""
-    csv_path = "static/changes.csv"
-    if not os.path.exists(csv_path):
+    if not changes_view.exists():
         raise HTTPException(status_code=404, detail="CSV file not found")
-    return FileResponse(csv_path, media_type="text/csv", filename="changes.csv")
+    # Snapshot plus the watcher's append-only log is the current state
+    changes_view.refresh()
+    return Response(
+        content=changes_view.to_frame().to_csv(index=False),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="changes.csv"'},
+    )
 
 @app.get("/api/changes/json")
-async def get_changes_json():
-    """Get changes data in JSON format"""
-    csv_path = "static/changes.csv"
-    if not os.path.exists(csv_path):
+async def get_changes_json(request: Request, since: Optional[int] = None, concept: Optional[str] = None):
+    """
+    Get changes data in JSON format
+
+    The body is pre-serialized and only rebuilt when the changes files change.
+    Responses carry an ETag with the data version, so unchanged polls get 304.
+    With since=<version> and/or concept=<板块名称> only the matching rows are
+    returned as {"version": ..., "reset": ..., "rows": [...]}; an empty concept
+    selects rows without a concept.
+    """
+    if not changes_view.exists():
         raise HTTPException(status_code=404, detail="CSV file not found")
     
     try:
-        # Read CSV and fill NaN values with None
-        df = pd.read_csv(csv_path)
-        # Convert DataFrame to list of dicts, replacing NaN with None
-        data = df.where(pd.notnull(df), None).to_dict(orient="records")
-        return JSONResponse(content=data)
+        version = changes_view.refresh()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading CSV: {str(e)}")
 
+    etag = f'"{version}-{len(changes_view)}"'
+    headers = {"ETag": etag, "X-Changes-Version": str(version), "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if since is not None or concept is not None:
+        # A client ahead of the server means the history was reset; send everything
+        reset = since is not None and since > version
+        rows = changes_view.records(None if reset else since)
+        if concept is not None:
+            rows = [row for row in rows if (row["板块名称"] or "") == concept]
+        return JSONResponse(content={"version": version, "reset": reset, "rows": rows}, headers=headers)
+    return Response(content=changes_view.body(), media_type="application/json", headers=headers)
+
+@app.get("/api/changes")
+async def query_changes(
+    date: Optional[str] = None,
+    concept: Optional[str] = None,
+    code: Optional[str] = None,
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+):
+    """
+    Query the changes history by trading day, concept, stock code and minute
+
+    date is YYYYMMDD or an inclusive range YYYYMMDD-YYYYMMDD (default: the
+    latest day with data); from/to are HH:MM bounds within each day. Only the
+    partitions of the requested days are opened, and rows are located through
+    their indexes. The live day comes from the watcher's current state.
+    Returns {"days": [...], "rows": [...]} with rows ordered by day and minute.
+    """
+    try:
+        start_minute, end_minute = parse_minute(start), parse_minute(end)
+        days = parse_days(date) if date else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = {"concept": concept, "code": code, "start": start_minute, "end": end_minute}
+
+    live = {}
+    if changes_view.exists():
+        changes_view.refresh()
+        for row in changes_view.records():
+            live.setdefault(row["日期"], []).append(row)
+    archived = change_history.days()
+    if days is None:
+        latest = max(list(live) + archived, default=None)
+        days = (latest, latest)
+    selected = sorted(day for day in set(live) | set(archived)
+                      if day is not None and days[0] <= day <= days[1])
+
+    rows = []
+    for day in selected:
+        # The live state wins for a day that has not been archived yet
+        if day in live:
+            rows.extend(filter_rows(live[day], **filters))
+        else:
+            rows.extend(await asyncio.to_thread(change_history.query, day, **filters))
+    return JSONResponse(content={"days": selected, "rows": rows})
+
+@app.get("/api/concepts/heat")
+async def get_concepts_heat(request: Request):
+    """
+    Per-concept aggregates, hottest first
+
+    Each row has 板块名称, 异动数 (current rows), 涨停数 (limit-ups), 平均涨跌幅,
+    上午/下午 counts, 首次异动 (first trigger time), 热度 (decaying heat score) and
+    序号 (version of the concept's last change). Maintained incrementally by the
+    watcher and served pre-serialized, with the same ETag/304 handling as
+    /api/changes/json.
+    """
+    if not heat_view.exists():
+        raise HTTPException(status_code=404, detail="Changes not available")
+    version = heat_view.refresh()
+    etag = f'"heat-{version}"'
+    headers = {"ETag": etag, "X-Changes-Version": str(version), "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=heat_view.body(), media_type="application/json", headers=headers)
+
+@app.get("/api/changes/stream")
+async def stream_changes(request: Request):
+    """
+    Server-Sent Events feed of new or changed rows pushed by the watcher
+
+    Events: "changes" with {"version": ..., "rows": [...]}, and "resync" when the
+    client may have missed events and should catch up with /api/changes/json?since=.
+    """
+    queue = broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                event = message.get("type", "changes")
+                yield f"event: {event}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/factors/live")
+async def get_live_factors():
+    """Latest intraday factor scores written by `python -m factor.live`"""
+    df = read_table(LIVE_RESULT)
+    if df is None:
+        raise HTTPException(status_code=404, detail="Live factors not available")
+    return JSONResponse(content=df.astype(object).where(pd.notnull(df), None).to_dict(orient="records"))
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus text exposition of this process plus the reports written by the
+    watcher, the live factor service and the last multi-factor run
+    """
+    snapshots = [("api", metrics.REGISTRY.snapshot())] + metrics.load_reports()
+    return Response(content=metrics.render(snapshots), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/watch/profile")
+async def profile_watch():
+    """Profile the watcher's next tick; the report is written under cache/profiles"""
+    flag = metrics.ProfileTrigger("watch").request()
+    return {"status": "requested", "directory": os.path.dirname(flag)}
+
 @app.get("/changes_by_concept", response_class=HTMLResponse)
 async def get_changes_by_concept(request: Request):
     return templates.TemplateResponse("changes_by_concept.html", {"request": request})
 
 @app.get("/api/watch/status")
 async def get_watch_status():
-    """Get the status of the fluctuation watch process"""
-    global watch_process
-    if watch_process is None:
-        return {"status": "not_running"}
-    
-    return_code = watch_process.poll()
-    if return_code is None:
-        return {"status": "running", "pid": watch_process.pid}
-    else:
-        return {"status": "stopped", "return_code": return_code}
+    """
+    Get the status of the fluctuation watch process
+
+    Answered by the supervisor leader whichever worker receives the request;
+    worker_pid tells which worker relayed it.
+    """
+    status = await asyncio.to_thread(watch_supervisor.status)
+    return dict(status, worker_pid=os.getpid())
 
 @app.post("/api/watch/restart")
 async def restart_watch():
-    """Restart the fluctuation watch process"""
-    global watch_process
-    
-    # Stop existing process if running
-    if watch_process:
-        watch_process.terminate()
-        try:
-            watch_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            watch_process.kill()
-    
-    # Start new process
-    watch_process = subprocess.Popen(
-        [sys.executable, "fluctuation.py"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-    
-    return {"status": "restarted", "pid": watch_process.pid}
+    """Restart the fluctuation watch process; followers route the request to the leader"""
+    status = await asyncio.to_thread(watch_supervisor.restart)
+    return dict(status, worker_pid=os.getpid())
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import spearmanr
+
+from factor.backtest import build_date_panel, forward_returns, quantile_labels, rank_ic, run_backtest
+from factor.registry import compute_factors, get_factors
+
+
+def make_history(n_codes=24, n_days=80, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2026-10-16', periods=n_days)
+    history = {}
+    for i in range(n_codes):
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+        history[f'{i:06d}'] = pd.DataFrame({'日期': dates.date, '收盘': close,
+                                            '最低': close * (1 - rng.uniform(0, 0.03, n_days))})
+    return history
+
+
+def test_date_panel_aligns_missing_days():
+    history = make_history(n_codes=2, n_days=5)
+    history['000001'] = history['000001'].drop(index=[1, 2]).reset_index(drop=True)  # 停牌两天
+    panel = build_date_panel(history, fields=('收盘',))
+    assert panel.dates.tolist() == [20261012, 20261013, 20261014, 20261015, 20261016]
+    assert np.isnan(panel['收盘'][1, 1:3]).all() and not np.isnan(panel['收盘'][0]).any()
+    # 窗口只计停牌之后连续的K线
+    window = panel.window(4, 4)
+    assert window.lengths.tolist() == [4, 2]
+
+
+def test_forward_returns_and_cross_section_helpers():
+    prices = np.array([[10.0, 11.0, np.nan, 12.1], [5.0, 5.0, 4.0, 4.4]])
+    returns = forward_returns(prices, horizon=1)
+    np.testing.assert_allclose(returns, [[0.1, np.nan, np.nan, np.nan], [0.0, -0.2, 0.1, np.nan]])
+
+    rng = np.random.default_rng(1)
+    values, future = rng.normal(size=50), rng.normal(size=50)
+    future[::7] = np.nan
+    valid = ~np.isnan(future)
+    assert rank_ic(values, future) == pytest.approx(spearmanr(values[valid], future[valid])[0])
+    assert np.isnan(rank_ic(np.array([1.0, 2.0]), np.array([1.0, 2.0])))
+    assert quantile_labels(np.array([5.0, np.nan, 1.0, 3.0, 4.0, 2.0]), 5).tolist() == [4, -1, 0, 2, 3, 1]
+
+
+def test_ic_matches_factors_computed_on_truncated_history():
+    history = make_history()
+    result = run_backtest(history, max_workers=1)
+    factors = get_factors()
+    day = result.dates[5]
+    truncated = {code: bars[pd.to_datetime(bars['日期']) <= day] for code, bars in history.items()}
+    values = compute_factors(truncated).set_index('代码')
+    closes = pd.DataFrame({code: bars.set_index(pd.to_datetime(bars['日期']))['收盘'] for code, bars in history.items()})
+    future = (closes.shift(-1) / closes - 1).loc[day]
+    for spec in factors:
+        sign = 1.0 if spec.ascending else -1.0
+        expected = spearmanr(values[spec.column] * sign, future[values.index])[0]
+        assert result.ic.loc[day, spec.column] == pytest.approx(expected)
+    assert (result.coverage.loc[day] == len(history)).all()
+
+
+def test_sharded_and_parallel_runs_agree():
+    history = make_history(seed=2)
+    serial = run_backtest(history, max_workers=1, horizon=2, quantiles=4)
+    sharded = run_backtest(history, max_workers=1, shard_size=7, horizon=2, quantiles=4)
+    parallel = run_backtest(history, max_workers=2, horizon=2, quantiles=4)
+    for other in (sharded, parallel):
+        pd.testing.assert_frame_equal(other.ic, serial.ic)
+        pd.testing.assert_frame_equal(other.turnover, serial.turnover)
+        for name, returns in serial.quantile_returns.items():
+            pd.testing.assert_frame_equal(other.quantile_returns[name], returns)
+    summary = serial.summary()
+    assert list(summary.index) == [spec.column for spec in get_factors()]
+    assert {'IC均值', 'ICIR', '多空收益', '平均换手'} <= set(summary.columns)
+    assert ((serial.turnover.iloc[1:] >= 0) & (serial.turnover.iloc[1:] <= 1)).all().all()
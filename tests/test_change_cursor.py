@@ -0,0 +1,76 @@
+import fluctuation
+from fluctuation import ChangeCursor, pollNewChanges
+
+
+class FakeFeed:
+    """按时间倒序分页返回异动的推送接口，记录请求过的页号"""
+
+    def __init__(self):
+        self.rows = []  # 最新的在前
+        self.requests = []
+
+    def push(self, *events):
+        for tm, code, kind in events:
+            self.rows.insert(0, {'tm': tm, 'c': code, 't': kind, 'n': f'股票{code}', 'm': 1, 'i': 0.01})
+
+    def page(self, pageindex=0, pagesize=2, session=None):
+        self.requests.append(pageindex)
+        return self.rows[pageindex * pagesize:(pageindex + 1) * pagesize]
+
+
+def poll(monkeypatch, feed, cursor):
+    feed.requests = []
+    monkeypatch.setattr(fluctuation, 'fetchChangePage', feed.page)
+    return [(row['tm'], row['c'], row['t']) for row in pollNewChanges(cursor, pagesize=2, max_pages=10)]
+
+
+def test_first_poll_pages_until_short_page(monkeypatch):
+    feed, cursor = FakeFeed(), ChangeCursor()
+    feed.push((93000, '000001', 8201), (93001, '000002', 8201), (93002, '000003', 8202),
+              (93003, '000004', 8201), (93004, '000005', 8201))
+    assert len(poll(monkeypatch, feed, cursor)) == 5
+    assert feed.requests == [0, 1, 2]
+    assert cursor.tm == 93004
+
+
+def test_only_rows_above_high_water_mark_are_new(monkeypatch):
+    feed, cursor = FakeFeed(), ChangeCursor()
+    feed.push((93000, '000001', 8201), (93001, '000002', 8201))
+    poll(monkeypatch, feed, cursor)
+    feed.push((93005, '000003', 8201), (93006, '000004', 8201), (93007, '000005', 8201))
+    # 第0页全是新行且页满，继续翻到第1页，遇到已处理的行后停止
+    assert poll(monkeypatch, feed, cursor) == [(93007, '000005', 8201), (93006, '000004', 8201),
+                                                (93005, '000003', 8201)]
+    assert feed.requests == [0, 1]
+    assert cursor.tm == 93007
+
+
+def test_no_new_rows_stops_after_first_page(monkeypatch):
+    feed, cursor = FakeFeed(), ChangeCursor()
+    feed.push((93000, '000001', 8201), (93001, '000002', 8201), (93002, '000003', 8201))
+    poll(monkeypatch, feed, cursor)
+    assert poll(monkeypatch, feed, cursor) == []
+    assert feed.requests == [0]
+
+
+def test_rows_at_the_high_water_second_are_deduplicated_by_key(monkeypatch):
+    feed, cursor = FakeFeed(), ChangeCursor()
+    feed.push((93000, '000001', 8201), (93001, '000002', 8201))
+    poll(monkeypatch, feed, cursor)
+    # 与高水位同一秒到达的另一只股票是新行；同一(代码, 类型)不是
+    feed.push((93001, '000003', 8201))
+    assert poll(monkeypatch, feed, cursor) == [(93001, '000003', 8201)]
+    assert poll(monkeypatch, feed, cursor) == []
+    assert cursor.seen_at_tm == {('000002', 8201), ('000003', 8201)}
+
+
+def test_cursor_resets_on_a_new_day(monkeypatch):
+    feed, cursor = FakeFeed(), ChangeCursor()
+    feed.push((145900, '000001', 8201))
+    poll(monkeypatch, feed, cursor)
+    # 高水位属于前一天：新一天的早盘时间虽然更小，仍然是新行
+    cursor.day = '20000101'
+    feed.rows = []
+    feed.push((93000, '000002', 8201))
+    assert poll(monkeypatch, feed, cursor) == [(93000, '000002', 8201)]
+    assert cursor.tm == 93000
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import random
+
+import httpx
+import pandas as pd
+import pytest
+
+from utils import change_history as change_history_module
+from utils import table_store
+from utils.change_history import ChangeHistory, filter_rows, parse_days, parse_minute
+from utils.event_store import COLUMNS, SEQ_COLUMN, STORED_COLUMNS, ChangeStore, ChangesView
+
+CONCEPTS = ['AI', '芯片', None]
+CODES = ['000001', '000002', '600000', '300750']
+
+
+def make_rows(day, n, seed=0, start_seq=1):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        minute = rng.choice([570, 571, 575, 600, 660, 780, 781, 900])
+        code = rng.choice(CODES)
+        row = dict(zip(COLUMNS, [rng.choice(CONCEPTS), f'{minute // 60:02d}:{minute % 60:02d}', f'股票{code}',
+                                 f'+{rng.randint(1, 9)}.00%', rng.choice(['大笔买入', '封涨停板', '火箭发射']), 1,
+                                 '上午' if minute < 720 else '下午', minute, code, day]))
+        row[SEQ_COLUMN] = start_seq + i
+        rows.append(row)
+    return rows
+
+
+def current(rows):
+    """按(日期, 名称, 类型)保留最新一条"""
+    latest = {}
+    for row in rows:
+        latest[(row['日期'], row['名称'], row['类型'])] = row
+    return list(latest.values())
+
+
+@pytest.fixture(params=['feather', 'csv'])
+def history(request, tmp_path, monkeypatch):
+    if request.param == 'csv':
+        monkeypatch.setattr(table_store, 'HAS_ARROW', False)
+        monkeypatch.setattr(change_history_module, 'HAS_ARROW', False)
+    elif not table_store.HAS_ARROW:
+        pytest.skip('pyarrow未安装')
+    return ChangeHistory(str(tmp_path / 'history'), cache_size=2)
+
+
+def test_append_partitions_by_day_and_merges(history):
+    first = make_rows(20261014, 30, seed=1) + make_rows(20261015, 30, seed=2, start_seq=31)
+    history.append(pd.DataFrame(first, columns=STORED_COLUMNS))
+    assert history.days() == [20261014, 20261015]
+    # 再次归档同一天时与已有分区合并，同一(名称, 类型)保留最新一条
+    later = make_rows(20261015, 20, seed=3, start_seq=61)
+    history.append(pd.DataFrame(later, columns=STORED_COLUMNS))
+    rows = history.query(20261015)
+    assert len(rows) == len(current(first[30:] + later))
+    assert [(row['时间排序'], row[SEQ_COLUMN]) for row in rows] == sorted((row['时间排序'], row[SEQ_COLUMN])
+                                                                          for row in rows)
+    assert history.query(20261016) == []
+
+
+def test_indexed_queries_match_a_scan(history):
+    rows = current(make_rows(20261016, 200, seed=4))
+    history.append(pd.DataFrame(rows, columns=STORED_COLUMNS))
+    # 板块条件中空字符串表示没有归属板块，None表示不按板块筛选
+    for concept in ['AI', '芯片', '', '不存在', None]:
+        for code in [None, '000001', '300750', '999999']:
+            for start, end in [(None, None), (571, 600), (700, None), (None, 570), (601, 659)]:
+                expected = filter_rows(rows, concept=concept, code=code, start=start, end=end)
+                assert history.query(20261016, concept=concept, code=code, start=start, end=end) == expected
+
+
+def test_stale_or_missing_index_is_rebuilt(history):
+    history.append(pd.DataFrame(current(make_rows(20261016, 50, seed=5)), columns=STORED_COLUMNS))
+    expected = history.query(20261016, concept='AI')
+    os.remove(os.path.join(history.directory, '20261016.index.json'))
+    assert ChangeHistory(history.directory).query(20261016, concept='AI') == expected
+    with open(os.path.join(history.directory, '20261016.index.json'), 'w', encoding='utf-8') as f:
+        f.write('{"source": "其他文件"}')
+    assert ChangeHistory(history.directory).query(20261016, concept='AI') == expected
+
+
+def test_cache_follows_rewrites_and_evicts(history):
+    for seed, day in enumerate([20261013, 20261014, 20261015]):
+        history.append(pd.DataFrame(current(make_rows(day, 20, seed=seed)), columns=STORED_COLUMNS))
+        history.query(day)
+    # cache_size=2，只保留最近用过的两个分区
+    assert list(history._cache) == [20261014, 20261015]
+    before = len(history.query(20261015))
+    extra = make_rows(20261015, 1, seed=9, start_seq=100)
+    extra[0]['名称'] = '新股'
+    history.append(pd.DataFrame(extra, columns=STORED_COLUMNS))
+    assert len(history.query(20261015)) == before + 1
+
+
+def test_parse_days_and_minutes():
+    assert parse_days('20261016') == (20261016, 20261016)
+    assert parse_days(' 2026-10-16 ') == (20261016, 20261016)
+    assert parse_days('20261012-20261016') == (20261012, 20261016)
+    with pytest.raises(ValueError):
+        parse_days('2026101')
+    assert (parse_minute('09:35'), parse_minute('575'), parse_minute(None), parse_minute('')) == (575, 575, None, None)
+
+
+def test_api_spans_archived_and_live_days(tmp_path, monkeypatch):
+    import main
+    archived = current(make_rows(20261015, 40, seed=6))
+    history = ChangeHistory(str(tmp_path / 'history'))
+    history.append(pd.DataFrame(archived, columns=STORED_COLUMNS))
+    store = ChangeStore(str(tmp_path / 'changes'), str(tmp_path / 'changes.log'))
+    store.upsert(pd.DataFrame(make_rows(20261016, 40, seed=7), columns=COLUMNS))
+    store.compact()
+    monkeypatch.setattr(main, 'change_history', history)
+    monkeypatch.setattr(main, 'changes_view', ChangesView(store.snapshot_path, store.log_path))
+
+    def get(path):
+        async def request():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await client.get(path)
+        return asyncio.run(request())
+
+    # 默认只查最新的交易日，即当前交易日
+    body = get('/api/changes?concept=AI').json()
+    assert body['days'] == [20261016]
+    assert body['rows'] == filter_rows(store.records(), concept='AI')
+
+    body = get('/api/changes?date=20261014-20261016&code=000001&from=09:31&to=11:00').json()
+    assert body['days'] == [20261015, 20261016]
+    assert body['rows'] == (filter_rows(archived, code='000001', start=571, end=660)
+                            + filter_rows(store.records(), code='000001', start=571, end=660))
+    assert get('/api/changes?date=bad').status_code == 400
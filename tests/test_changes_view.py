@@ -0,0 +1,123 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+import pandas as pd
+import pytest
+
+from utils import event_store
+from utils.change_history import ChangeHistory
+from utils.event_store import COLUMNS, ChangeStore, ChangesView, read_changes
+from utils.scheduler import TradingCalendar
+
+LEGACY_COLUMNS = ['板块名称', '时间', '名称', '相关信息', '类型', '四舍五入取整', '上下午', '时间排序']
+
+
+def change(name, info='+1.00%', day=20261016, minute=571):
+    return dict(zip(COLUMNS, ['AI', '09:31', name, info, '大笔买入', 1, '上午', minute, '000001', day]))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChangeStore(str(tmp_path / 'changes'), str(tmp_path / 'changes.log'))
+
+
+def freeze(monkeypatch, moment):
+    """固定event_store看到的当前时间，交易日历用工作日日历（2026-10-15、16为周四、周五）"""
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return moment
+
+    monkeypatch.setattr(event_store, 'datetime', FrozenDatetime)
+    monkeypatch.setattr(TradingCalendar, 'load', classmethod(lambda cls, path=None: cls()))
+
+
+def write_legacy(tmp_path):
+    rows = [['体育产业', '13:10', '泰慕士', '+5.69%', '60日大幅上涨', 6, '下午', 790],
+            ['AI', '09:31', '甲', '+1.00%', '大笔买入', 1, '上午', 571]]
+    pd.DataFrame(rows, columns=LEGACY_COLUMNS).to_csv(tmp_path / 'changes.csv', index=False)
+
+
+def test_legacy_rows_dated_before_upgrade_day_during_session(tmp_path, monkeypatch):
+    freeze(monkeypatch, datetime(2026, 10, 16, 10, 0))
+    write_legacy(tmp_path)
+    df = read_changes(str(tmp_path / 'changes'), str(tmp_path / 'changes.log'))
+    assert df['日期'].tolist() == [20261015, 20261015]
+    assert df['序号'].tolist() == [1, 2]
+    assert df['股票代码'].isna().all()
+
+
+def test_legacy_rows_after_weekend_take_previous_trading_day(tmp_path, monkeypatch):
+    freeze(monkeypatch, datetime(2026, 10, 19, 9, 0))
+    write_legacy(tmp_path)
+    assert set(read_changes(str(tmp_path / 'changes'), '')['日期']) == {20261016}
+
+
+def test_legacy_rows_archived_and_do_not_collide_with_today(tmp_path, monkeypatch):
+    freeze(monkeypatch, datetime(2026, 10, 16, 10, 0))
+    write_legacy(tmp_path)
+    history = ChangeHistory(str(tmp_path / 'history'))
+    store = ChangeStore(str(tmp_path / 'changes'), str(tmp_path / 'changes.log'), history=history).load()
+    assert store.roll(20261016)
+    assert len(store) == 0
+    assert history.days() == [20261015]
+
+    # 今天同名同类型的异动是新行，不会覆盖或沿用旧行
+    changed = store.upsert(pd.DataFrame([change('甲', '+3.00%')]))
+    assert changed['日期'].tolist() == [20261016]
+    assert [row['相关信息'] for row in history.query(20261015) if row['名称'] == '甲'] == ['+1.00%']
+
+
+def test_view_reads_only_appended_log_lines(store):
+    store.upsert(pd.DataFrame([change('甲'), change('乙')]))
+    store.compact()
+    view = ChangesView(store.snapshot_path, store.log_path)
+    assert view.refresh() == 2 and len(view) == 2
+
+    store.upsert(pd.DataFrame([change('乙', '+2.00%'), change('丙')]))
+    with open(store.log_path, 'a', encoding='utf-8') as f:
+        f.write('AI,09:32,丁')  # 写了一半的行留到下次
+    assert view.refresh() == 4
+    assert [row['名称'] for row in view.records(since=2)] == ['乙', '丙']
+    assert view.body() is view.body()
+
+    # 压缩后快照被替换，视图全量重读，结果不变
+    open(store.log_path, 'w').close()
+    store.compact()
+    assert view.refresh() == 4 and len(view) == 3
+
+
+@pytest.fixture
+def api(store, monkeypatch):
+    import main
+    monkeypatch.setattr(main, 'changes_view', ChangesView(store.snapshot_path, store.log_path))
+
+    def get(path, **headers):
+        async def request():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await client.get(path, headers=headers)
+        return asyncio.run(request())
+
+    return get
+
+
+def test_json_etag_and_since(store, api):
+    assert api('/api/changes/json').status_code == 404
+    store.upsert(pd.DataFrame([change('甲'), change('乙')]))
+
+    first = api('/api/changes/json')
+    assert first.status_code == 200 and first.headers['X-Changes-Version'] == '2'
+    assert [row['名称'] for row in first.json()] == ['甲', '乙']
+    assert api('/api/changes/json', **{'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    store.upsert(pd.DataFrame([change('甲', '+2.00%')]))
+    delta = api('/api/changes/json?since=2').json()
+    assert delta['version'] == 3 and not delta['reset']
+    assert [(row['名称'], row['序号']) for row in delta['rows']] == [('甲', 3)]
+
+    # 客户端的版本比服务端新（数据被重置）时返回全量
+    reset = api('/api/changes/json?since=99').json()
+    assert reset['reset'] and len(reset['rows']) == 2
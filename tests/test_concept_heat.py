@@ -0,0 +1,93 @@
+import json
+import random
+
+import pandas as pd
+import pytest
+
+from utils.concept_heat import ConceptHeat, HeatView
+from utils.event_store import COLUMNS, ChangeStore, ChangesView
+from utils.shared_snapshot import SnapshotWriter
+
+
+def change(concept, name, minute, kind='大笔买入', info='+1.00%'):
+    period = '上午' if minute < 12 * 60 else '下午'
+    return dict(zip(COLUMNS, [concept, f'{minute // 60:02d}:{minute % 60:02d}', name, info, kind, 1, period,
+                              minute, '000001', 20261016]))
+
+
+def by_concept(heat):
+    return {row['板块名称']: row for row in heat.rows()}
+
+
+def test_heat_decays_by_half_life_in_event_time():
+    heat = ConceptHeat(half_life=10)
+    heat.update([change('AI', '甲', 570), change('AI', '乙', 580, kind='封涨停板')], 2)
+    # 第一次触发过了一个半衰期，封涨停板权重为3
+    assert by_concept(heat)['AI']['热度'] == pytest.approx(0.5 + 3)
+    # 其他板块的异动推进时钟，AI板块的热度在读取时按时间差衰减
+    heat.update([change('芯片', '丙', 600)], 3)
+    rows = by_concept(heat)
+    assert rows['AI']['热度'] == pytest.approx(3.5 * 0.25, abs=1e-3)
+    assert rows['芯片']['热度'] == 1.0
+    assert [row['板块名称'] for row in heat.rows()] == ['芯片', 'AI']
+
+
+def test_arrival_order_does_not_change_the_result():
+    rows = [change(random.Random(i).choice(['AI', '芯片', '']), f'股票{i}', 570 + i * 3,
+                   kind='封涨停板' if i % 4 == 0 else '大笔买入', info=f'+{i % 9}.50%') for i in range(40)]
+    in_order = ConceptHeat()
+    in_order.update(rows, 40)
+    shuffled = ConceptHeat()
+    rows = rows[:]
+    random.Random(0).shuffle(rows)
+    for start in range(0, 40, 7):
+        shuffled.update(rows[start:start + 7], 40)
+    assert shuffled.rows() == in_order.rows()
+
+
+def test_changed_row_replaces_its_contribution():
+    heat = ConceptHeat()
+    heat.update([change('AI', '甲', 570, info='+2.00%'), change('AI', '乙', 571, info='+4.00%')], 2)
+    # 同一(名称, 类型)再次触发：计数不变，涨跌幅取新值，热度累加
+    heat.update([change('AI', '甲', 571, info='+6.00%')], 3)
+    row = by_concept(heat)['AI']
+    assert (row['异动数'], row['平均涨跌幅'], row['首次异动']) == (2, 5.0, '09:30')
+    assert row['热度'] == pytest.approx(0.5 ** 0.1 + 2, abs=1e-3)
+    # 改归其他板块后从原板块移出，原板块只剩一条
+    heat.update([change('芯片', '乙', 572)], 4)
+    rows = by_concept(heat)
+    assert (rows['AI']['异动数'], rows['芯片']['异动数'], len(heat)) == (1, 1, 2)
+    heat.update([change('芯片', '甲', 573)], 5)
+    assert list(by_concept(heat)) == ['芯片'] and len(heat) == 1
+
+
+def test_listener_counts_match_the_store(tmp_path):
+    store = ChangeStore(str(tmp_path / 'changes'), str(tmp_path / 'changes.log'))
+    heat = ConceptHeat()
+    store.listeners.append(heat.update)
+    store.upsert(pd.DataFrame([change('AI', '甲', 570), change('AI', '乙', 571, kind='封涨停板'),
+                               change(None, '丙', 572)]))
+    store.upsert(pd.DataFrame([change('AI', '乙', 575, kind='封涨停板')]))
+    rows = by_concept(heat)
+    assert (rows['AI']['异动数'], rows['AI']['涨停数'], rows['AI']['序号']) == (2, 1, store.version)
+    assert rows['']['异动数'] == 1
+    assert heat.version == store.version
+
+
+def test_view_prefers_the_watcher_snapshot(tmp_path):
+    store = ChangeStore(str(tmp_path / 'changes'), str(tmp_path / 'changes.log'))
+    store.upsert(pd.DataFrame([change('AI', '甲', 570), change('芯片', '乙', 571)]))
+    store.compact()
+    path = str(tmp_path / 'heat.snap')
+    view = HeatView(ChangesView(store.snapshot_path, store.log_path), path=path)
+
+    # 没有热度快照时按异动视图重新聚合
+    assert view.exists() and view.refresh() == store.version
+    assert {row['板块名称'] for row in json.loads(view.body())} == {'AI', '芯片'}
+
+    writer = SnapshotWriter(path)
+    writer.publish(42, 0, b'[]')
+    assert view.refresh() == 42 and view.body() == b'[]'
+    # 监控进程退出后回到重新聚合
+    writer.close()
+    assert view.refresh() == store.version and len(json.loads(view.body())) == 2
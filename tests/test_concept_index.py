@@ -0,0 +1,53 @@
+import pandas as pd
+
+from utils.concept_index import ConceptIndex
+
+
+def concept_df():
+    rows = [['BK01', '人工智能', '000001'], ['BK02', '机器人', '000001'], ['BK02', '机器人', '600000'],
+            ['板块代码', '板块名称', '股票代码'],  # 混入数据中的表头行
+            ['BK03', '算力', '1'], ['BK03', '算力', '600000']]
+    return pd.DataFrame(rows, columns=['板块代码', '板块名称', '股票代码'])
+
+
+def baseline_lookup(df, rising, code):
+    """原先的做法：按涨幅榜重排成分表后取每只股票的第一条"""
+    df = df[df['板块代码'] != '板块代码']
+    ordered = df[df['板块代码'].isin(rising)].set_index('板块代码').loc[[c for c in rising if c in set(df['板块代码'])]]
+    combined = pd.concat([ordered.reset_index(), df[~df['板块代码'].isin(rising)]], ignore_index=True)
+    combined['股票代码'] = combined['股票代码'].str.zfill(6)
+    match = combined[combined['股票代码'] == code]
+    return match['板块名称'].iloc[0] if len(match) else None
+
+
+def test_unranked_lookup_takes_first_membership():
+    index = ConceptIndex(concept_df())
+    assert len(index) == 2
+    assert index.lookup('000001') == '人工智能'
+    assert index.lookup('600000') == '机器人'
+    # 丢失前导0的代码在构建和查询时都补齐
+    assert index.lookup('000001') == index.lookup(1) == '人工智能'
+    assert index.lookup('999999') is None
+
+
+def test_rank_prefers_best_ranked_board():
+    index = ConceptIndex(concept_df())
+    assert index.rank(['BK02', 'BK03'])
+    assert index.lookup('600000') == '机器人'
+    assert index.lookup('000001') == '机器人'
+    assert index.rank(['BK03', 'BK02'])
+    assert index.lookup('600000') == index.lookup('000001') == '算力'
+    # 排名不变时沿用上次结果
+    assert not index.rank(['BK03', 'BK02'])
+    assert index.rank(['BKXX'])
+    assert index.lookup('000001') == '人工智能'
+
+
+def test_lookup_many_matches_baseline_reordering():
+    df = concept_df()
+    index = ConceptIndex(df)
+    codes = ['000001', '600000', '1', '000002', None]
+    for rising in ([], ['BK02'], ['BK03', 'BK01'], ['BK03', 'BK02', 'BK01']):
+        index.rank(rising)
+        expected = [baseline_lookup(df, rising, str(code).zfill(6)) if code else None for code in codes]
+        assert index.lookup_many(codes).tolist() == expected
@@ -0,0 +1,86 @@
+import functools
+import json
+
+import pandas as pd
+import pytest
+
+import fluctuation
+from utils.fetcher import fetch_concurrently
+
+
+class StubAk:
+    """替代akshare：板块列表和成分都来自内存，可指定抓取失败的板块"""
+
+    def __init__(self, boards, members):
+        self.boards = boards
+        self.members = members
+        self.failing = set()
+        self.calls = []
+
+    def stock_board_concept_name_em(self):
+        return pd.DataFrame(self.boards, columns=['板块代码', '板块名称', '总市值', '上涨家数', '下跌家数'])
+
+    def stock_board_concept_cons_em(self, symbol):
+        self.calls.append(symbol)
+        if symbol in self.failing:
+            raise ConnectionError('reset')
+        return pd.DataFrame(self.members[symbol], columns=['代码', '名称'])
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ak = StubAk(
+        boards=[['BK01', '人工智能', 3e12, 1, 0], ['BK02', '机器人', 1e12, 1, 1], ['BK03', '昨日涨停', 1e11, 0, 0]],
+        members={'BK01': [['000001', '甲']], 'BK02': [['000002', '乙'], ['000003', '丙']]},
+    )
+    monkeypatch.setattr(fluctuation, 'ak', ak)
+    monkeypatch.setattr(fluctuation, 'fetch_concurrently', functools.partial(fetch_concurrently, sleep=lambda s: None))
+    return ak
+
+
+def crawl(**kwargs):
+    return fluctuation.getConcepts(rate_limit=1000, **kwargs)
+
+
+def test_crawl_writes_members_in_board_order(stub):
+    df = crawl()
+    # 按总市值升序，跳过"昨日"类板块
+    assert df.values.tolist() == [['BK02', '机器人', '000002', '乙'], ['BK02', '机器人', '000003', '丙'],
+                                  ['BK01', '人工智能', '000001', '甲']]
+    assert pd.read_csv(fluctuation.CONCEPTS_FILE, dtype={'股票代码': str}).equals(df)
+    assert set(fluctuation.loadBoardRecords()) == {'BK01', 'BK02'}
+
+
+def test_crawl_resumes_from_checkpoint(stub):
+    stub.failing = {'BK01'}
+    df = crawl()
+    assert set(df['板块代码']) == {'BK02'}
+    assert set(fluctuation.loadBoardRecords()) == {'BK02'}
+
+    # 再次运行只抓取上次失败的板块
+    stub.failing = set()
+    stub.calls.clear()
+    df = crawl()
+    assert stub.calls == ['BK01']
+    assert len(df) == 3
+
+
+def test_checkpoint_tolerates_torn_last_line(stub):
+    crawl()
+    with open(fluctuation.CONCEPT_BOARDS_FILE, 'a', encoding='utf-8') as f:
+        f.write('{"板块代码": "BK0')
+    assert set(fluctuation.loadBoardRecords()) == {'BK01', 'BK02'}
+
+
+def test_refresh_recrawls_only_stale_boards(stub):
+    crawl()
+    stub.calls.clear()
+    # BK01总市值变化超过阈值，BK02不变
+    stub.boards[0][2] = 4e12
+    stub.members['BK01'] = [['000001', '甲'], ['000004', '丁']]
+    df = crawl(refresh=True)
+    assert stub.calls == ['BK01']
+    assert df[df['板块代码'] == 'BK01']['股票代码'].tolist() == ['000001', '000004']
+    with open(fluctuation.CONCEPT_BOARDS_FILE, encoding='utf-8') as f:
+        assert [json.loads(line)['板块代码'] for line in f] == ['BK02', 'BK01']
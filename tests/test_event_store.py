@@ -0,0 +1,106 @@
+import pandas as pd
+import pytest
+
+from utils.event_store import COLUMNS, ChangeStore, read_changes
+from utils.table_store import latest_path
+
+
+def change(name, info='+1.00%', kind='大笔买入', day=20261016):
+    return dict(zip(COLUMNS, ['AI', '09:31', name, info, kind, 1, '上午', 571, '000001', day]))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_store(tmp_path, clock):
+    def make(**kwargs):
+        return ChangeStore(str(tmp_path / 'changes'), str(tmp_path / 'changes.log'), clock=clock, **kwargs)
+    return make
+
+
+def log_lines(store):
+    with open(store.log_path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_upsert_returns_only_new_or_changed_rows(make_store):
+    store = make_store()
+    received = []
+    store.listeners.append(lambda rows, version: received.append(([row['名称'] for row in rows], version)))
+
+    changed = store.upsert(pd.DataFrame([change('甲'), change('乙')]))
+    assert changed['序号'].tolist() == [1, 2]
+    # 同样的行不再产生变化；同名不同类型、不同交易日是不同的键
+    assert store.upsert(pd.DataFrame([change('甲'), change('乙')])).empty
+    changed = store.upsert(pd.DataFrame([change('甲', '+2.00%'), change('甲', kind='火箭发射'),
+                                         change('甲', day=20261017)]))
+    assert changed['序号'].tolist() == [3, 4, 5]
+    assert len(store) == 4 and store.version == 5
+    assert received == [(['甲', '乙'], 2), (['甲', '甲', '甲'], 5)]
+    assert len(log_lines(store)) == 5
+
+    # 更新的行移到末尾，保持“保留最新一条”的顺序
+    assert [(row['名称'], row['相关信息']) for row in store.records()][:2] == [('乙', '+1.00%'), ('甲', '+2.00%')]
+
+
+def test_compacts_when_log_grows_or_interval_passes(make_store, clock):
+    store = make_store(compact_rows=3, compact_interval=30)
+    store.upsert(pd.DataFrame([change('甲'), change('乙')]))
+    assert latest_path(store.snapshot_path) is None and len(log_lines(store)) == 2
+
+    store.upsert(pd.DataFrame([change('丙')]))
+    assert latest_path(store.snapshot_path) is not None and log_lines(store) == []
+
+    store.upsert(pd.DataFrame([change('丁')]))
+    assert len(log_lines(store)) == 1
+    clock.now += 30
+    store.maybe_compact()
+    assert log_lines(store) == []
+
+
+def test_reload_from_snapshot_and_log(make_store):
+    store = make_store(compact_rows=2)
+    store.upsert(pd.DataFrame([change('甲'), change('乙')]))
+    store.upsert(pd.DataFrame([change('甲', '+3.00%'), change('丙')]))
+    store.upsert(pd.DataFrame([change('丁')]))
+    expected = store.to_frame()
+
+    restored = make_store().load()
+    assert restored.version == 5
+    pd.testing.assert_frame_equal(restored.to_frame(), expected)
+    assert restored.to_json() == store.to_json()
+    # 重启后序号继续递增
+    assert restored.upsert(pd.DataFrame([change('戊')]))['序号'].tolist() == [6]
+
+
+def test_replaying_log_over_snapshot_is_idempotent(make_store):
+    store = make_store()
+    store.upsert(pd.DataFrame([change('甲'), change('乙')]))
+    log = log_lines(store)
+    store.compact()
+    # 模拟快照写入后、清空日志前崩溃：日志中的行已包含在快照里
+    with open(store.log_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(log) + '\n')
+    df = read_changes(store.snapshot_path, store.log_path)
+    assert df['名称'].tolist() == ['甲', '乙'] and df['序号'].tolist() == [1, 2]
+    assert len(make_store().load()) == 2
+
+
+def test_flush_only_when_log_has_rows(make_store):
+    store = make_store()
+    store.flush()
+    assert latest_path(store.snapshot_path) is None
+    store.upsert(pd.DataFrame([change('甲')]))
+    store.flush()
+    assert latest_path(store.snapshot_path) is not None and log_lines(store) == []
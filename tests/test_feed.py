@@ -0,0 +1,166 @@
+import asyncio
+import json
+import socket
+import time
+
+import pytest
+
+from utils.feed import Broadcaster, EventPublisher, subscribe_feed
+
+
+@pytest.fixture
+def publisher():
+    publisher = EventPublisher(port=0, min_backoff=0.05).start()
+    yield publisher
+    publisher.close()
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, '等待超时'
+        await asyncio.sleep(0.01)
+
+
+def rows(n):
+    return [{'名称': f'股票{i}', '相关信息': '+1.00%', '板块名称': '人工智能' * 10} for i in range(n)]
+
+
+def relay(publisher, scenario, **kwargs):
+    """在事件循环中运行subscribe_feed，执行scenario(received)后取消订阅"""
+    received = []
+
+    async def main():
+        task = asyncio.create_task(subscribe_feed(received.append, port=publisher.port, retry_interval=0.05,
+                                                  **kwargs))
+        try:
+            await scenario(received)
+            assert not task.done()
+        finally:
+            task.cancel()
+
+    asyncio.run(main())
+    return received
+
+
+def test_resync_on_connect_then_messages(publisher):
+    async def scenario(received):
+        await wait_for(lambda: publisher.subscribers == 1)
+        publisher.publish({'type': 'changes', 'version': 1, 'rows': rows(2)})
+        await wait_for(lambda: len(received) == 2)
+
+    received = relay(publisher, scenario)
+    assert received[0] == {'type': 'resync'}
+    assert received[1]['version'] == 1 and len(received[1]['rows']) == 2
+
+
+def test_batch_larger_than_default_stream_limit(publisher):
+    batch = {'type': 'changes', 'version': 2, 'rows': rows(400)}
+    assert len(json.dumps(batch, ensure_ascii=False).encode('utf-8')) > 64 * 1024
+
+    async def scenario(received):
+        await wait_for(lambda: publisher.subscribers == 1)
+        publisher.publish(batch)
+        await wait_for(lambda: len(received) == 2)
+
+    assert relay(publisher, scenario)[1] == batch
+
+
+def test_overlong_line_reconnects_and_resyncs(publisher):
+    async def scenario(received):
+        await wait_for(lambda: publisher.subscribers == 1)
+        publisher.publish({'type': 'changes', 'version': 3, 'rows': rows(50)})
+        # 订阅方断开重连，重新连上后再次resync，后续消息照常送达
+        await wait_for(lambda: received.count({'type': 'resync'}) == 2)
+        await wait_for(lambda: publisher.subscribers >= 1)
+        publisher.publish({'type': 'changes', 'version': 4, 'rows': []})
+        await wait_for(lambda: received[-1].get('version') == 4)
+
+    received = relay(publisher, scenario, limit=1024)
+    assert all(message.get('version') != 3 for message in received)
+
+
+def test_publisher_replaces_oversize_message_with_resync():
+    publisher = EventPublisher(port=0, line_limit=1024).start()
+    client = socket.create_connection(('127.0.0.1', publisher.port))
+    try:
+        deadline = time.monotonic() + 5
+        while publisher.subscribers == 0:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        publisher.publish({'type': 'changes', 'version': 5, 'rows': rows(50)})
+        line = client.makefile('rb').readline()
+        assert json.loads(line) == {'type': 'resync', 'version': 5}
+    finally:
+        client.close()
+        publisher.close()
+
+
+def test_publisher_retries_bind_while_port_is_taken():
+    holder = socket.socket()
+    holder.bind(('127.0.0.1', 0))
+    holder.listen()
+    port = holder.getsockname()[1]
+    publisher = EventPublisher(port=port, min_backoff=0.05, max_backoff=0.1).start()
+    try:
+        assert publisher._server is None
+        holder.close()
+        deadline = time.monotonic() + 5
+        while publisher._server is None:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        assert publisher.port == port
+    finally:
+        holder.close()
+        publisher.close()
+
+
+def test_slow_subscriber_gets_single_resync():
+    async def main():
+        broadcaster = Broadcaster(maxsize=3)
+        slow, fast = broadcaster.subscribe(), broadcaster.subscribe()
+        seen = []
+        for version in range(4):
+            broadcaster.publish({'type': 'changes', 'version': version})
+            seen.append(fast.get_nowait()['version'])
+        # 慢连接的队列满后只保留一条resync，不影响其他连接
+        assert [slow.get_nowait() for _ in range(slow.qsize())] == [{'type': 'resync'}]
+        assert seen == [0, 1, 2, 3]
+        broadcaster.unsubscribe(slow)
+        assert len(broadcaster) == 1
+
+    asyncio.run(main())
+
+
+def test_lifespan_restarts_dead_feed_relay(monkeypatch):
+    import main
+
+    class StubSupervisor:
+        is_leader = False
+
+        def start(self):
+            pass
+
+        def stop(self):
+            pass
+
+    calls = []
+
+    async def flaky_feed(on_message):
+        calls.append(on_message)
+        if len(calls) == 1:
+            raise RuntimeError('relay crashed')
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(main, 'watch_supervisor', StubSupervisor())
+    monkeypatch.setattr(main, 'subscribe_feed', flaky_feed)
+    monkeypatch.setattr(main, 'FEED_RESTART_DELAY', 0.01)
+
+    async def run():
+        async with main.lifespan(main.app):
+            await wait_for(lambda: len(calls) == 2)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    # 退出时取消的任务不再重启
+    assert len(calls) == 2
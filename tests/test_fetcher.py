@@ -0,0 +1,109 @@
+import pandas as pd
+import pytest
+
+from utils.fetcher import TokenBucket, backoff_delay, fetch_concurrently, fetch_with_retry
+
+
+class FakeClock:
+    """可注入的时钟：sleep只推进时间并记录等待的秒数"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_backoff_delay_doubles_and_caps():
+    assert [backoff_delay(i, base=0.5, cap=4.0, jitter=0) for i in range(5)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+    assert 1.0 <= backoff_delay(1, base=0.5, jitter=0.1) <= 1.1
+
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+    for _ in range(6):
+        bucket.acquire()
+    # 前两个令牌来自初始容量，之后每个令牌等待1/rate秒
+    assert clock.sleeps == [0.5, 0.5, 0.5, 0.5]
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_token_bucket_refills_while_idle():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    clock.now += 10  # 空闲期间补满，但不超过容量
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+    bucket.acquire()
+    assert clock.sleeps == [1.0]
+
+
+def test_zero_rate_never_sleeps():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0, clock=clock, sleep=clock.sleep)
+    for _ in range(100):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+
+def test_fetch_with_retry_backs_off_until_success():
+    clock = FakeClock()
+    calls = []
+
+    def flaky(key):
+        calls.append(key)
+        if len(calls) < 3:
+            raise ConnectionError('reset')
+        return pd.DataFrame({'a': [1]})
+
+    result = fetch_with_retry(flaky, '000001', max_retries=3, base_delay=0.5, sleep=clock.sleep)
+    assert len(result) == 1
+    assert calls == ['000001'] * 3
+    # 两次重试：约0.5秒和1秒，另有不超过10%的抖动
+    assert len(clock.sleeps) == 2
+    assert 0.5 <= clock.sleeps[0] <= 0.55 and 1.0 <= clock.sleeps[1] <= 1.1
+
+
+def test_fetch_with_retry_gives_up_and_returns_none():
+    clock = FakeClock()
+    assert fetch_with_retry(lambda key: None, 'x', max_retries=3, sleep=clock.sleep) is None
+    # 最后一次失败后不再等待
+    assert len(clock.sleeps) == 2
+
+
+def test_empty_frame_retried_unless_accepted():
+    clock = FakeClock()
+    empty = pd.DataFrame(columns=['a'])
+    assert fetch_with_retry(lambda key: empty, 'x', max_retries=2, sleep=clock.sleep) is None
+    assert len(clock.sleeps) == 1
+
+    clock = FakeClock()
+    assert fetch_with_retry(lambda key: empty, 'x', max_retries=2, sleep=clock.sleep, accept_empty=True) is empty
+    assert clock.sleeps == []
+
+
+def test_fetch_with_retry_takes_a_token_per_attempt():
+    clock = FakeClock()
+    limiter = TokenBucket(rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+    attempts = iter([None, None, pd.DataFrame({'a': [1]})])
+    fetch_with_retry(lambda key: next(attempts), 'x', max_retries=3, limiter=limiter, base_delay=0.0,
+                     sleep=clock.sleep)
+    # 退避等待为0，其余等待都来自限流：第一个令牌来自初始容量，之后两次各等1秒
+    assert [s for s in clock.sleeps if s] == [1.0, 1.0]
+
+
+def test_fetch_concurrently_maps_keys_to_results():
+    results = fetch_concurrently(['a', 'b', 'c'], lambda key: None if key == 'b' else pd.DataFrame({'k': [key]}),
+                                 max_workers=2, rate_limit=0, max_retries=2, sleep=lambda s: None)
+    assert set(results) == {'a', 'b', 'c'}
+    assert results['b'] is None
+    assert results['c']['k'].tolist() == ['c']
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from factor.multi_factor import get_stock_history_data
+from utils.kline_store import KlineStore
+
+
+def make_bars(start, end, scale=1.0):
+    """[start, end]内每个工作日一根日K；scale模拟除权后整段前复权价格被改写"""
+    dates = pd.bdate_range(start, end)
+    close = (10 + np.arange(len(dates)) * 0.1) * scale
+    return pd.DataFrame({'日期': dates.date, '开盘': close, '收盘': close, '最高': close * 1.01,
+                         '最低': close * 0.99, '成交额': np.full(len(dates), 1e6)})
+
+
+class FakeSource:
+    """按请求区间切片的日K接口，记录每次请求的区间"""
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.calls = []
+
+    def __call__(self, code, start_date, end_date):
+        self.calls.append((start_date, end_date))
+        dates = pd.to_datetime(self.bars['日期']).dt.strftime('%Y%m%d')
+        return self.bars[(dates >= start_date) & (dates <= end_date)].reset_index(drop=True)
+
+
+def test_first_get_fetches_and_second_fetches_from_anchor(tmp_path):
+    store = KlineStore(root=str(tmp_path))
+    source = FakeSource(make_bars('2026-09-01', '2026-10-16'))
+    first = store.get('000001', '20260901', '20261015', source)
+    assert source.calls == [('20260901', '20261015')]
+
+    second = store.get('000001', '20260901', '20261016', source)
+    # 增量请求从倒数第二根（已收盘的）K线开始：10-15是最后一根，10-14是锚点
+    assert source.calls[-1] == ('20261014', '20261016')
+    assert len(second) == len(first) + 1
+    assert second['日期'].iloc[-1].strftime('%Y%m%d') == '20261016'
+
+
+def test_anchor_mismatch_triggers_full_refetch(tmp_path):
+    store = KlineStore(root=str(tmp_path))
+    store.get('000001', '20260901', '20261015', FakeSource(make_bars('2026-09-01', '2026-10-15')))
+
+    # 除权除息后前复权价格整段改写，锚点K线与本地不一致
+    adjusted = FakeSource(make_bars('2026-09-01', '2026-10-16', scale=0.9))
+    result = store.get('000001', '20260901', '20261016', adjusted)
+    assert adjusted.calls == [('20261014', '20261016'), ('20260901', '20261016')]
+    np.testing.assert_allclose(result['收盘'].to_numpy(), adjusted.bars['收盘'].to_numpy())
+    # 重新获取的结果已落盘，本地不再保留旧的复权价格
+    np.testing.assert_allclose(store.load('000001')['收盘'].to_numpy(), adjusted.bars['收盘'].to_numpy())
+
+
+def test_anchor_match_within_tolerance_appends(tmp_path):
+    store = KlineStore(root=str(tmp_path), tolerance=1e-4)
+    store.get('000001', '20260901', '20261015', FakeSource(make_bars('2026-09-01', '2026-10-15')))
+    nudged = FakeSource(make_bars('2026-09-01', '2026-10-16', scale=1 + 1e-6))
+    store.get('000001', '20260901', '20261016', nudged)
+    assert nudged.calls == [('20261014', '20261016')]
+
+
+def test_earlier_start_than_covered_refetches(tmp_path):
+    store = KlineStore(root=str(tmp_path))
+    source = FakeSource(make_bars('2026-08-03', '2026-10-16'))
+    store.get('000001', '20260901', '20261016', source)
+    result = store.get('000001', '20260803', '20261016', source)
+    assert source.calls[-1] == ('20260803', '20261016')
+    assert result['日期'].iloc[0].strftime('%Y%m%d') == '20260803'
+
+
+def test_history_data_through_store_with_retries(tmp_path):
+    store = KlineStore(root=str(tmp_path))
+    source = FakeSource(make_bars(pd.Timestamp.today() - pd.Timedelta(days=90), pd.Timestamp.today()))
+    failed = set()
+
+    def flaky(code, start_date, end_date):
+        # 每只股票的第一次请求失败，由fetch_with_retry退避重试
+        if code not in failed:
+            failed.add(code)
+            raise ConnectionError('reset')
+        return source(code, start_date, end_date)
+
+    codes = ['000001', '000002', '000003']
+    first = get_stock_history_data(codes, days=60, max_workers=3, rate_limit=0, fetch_func=flaky, store=store)
+    assert set(first) == set(codes) and all(len(bars) > 0 for bars in first.values())
+    assert len(source.calls) == 3
+
+    # 再次获取只请求锚点之后的增量区间
+    second = get_stock_history_data(codes, days=60, rate_limit=0, fetch_func=source, store=store)
+    assert all(second[code]['收盘'].tolist() == first[code]['收盘'].tolist() for code in codes)
+    assert len({start for start, _ in source.calls[3:]}) == 1
+    assert source.calls[3][0] > source.calls[0][0]
@@ -0,0 +1,124 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from factor.live import LiveFactors, LiveFactorService
+from factor.registry import compute_factors
+
+
+def make_history(codes, n_days, end, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=end, periods=n_days).date
+    history = {}
+    for code in codes:
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+        history[code] = pd.DataFrame({'日期': dates, '收盘': close, '最低': close * (1 - rng.uniform(0, 0.03, n_days))})
+    return history
+
+
+def live_scores(history, days, codes):
+    """用day之前的K线初始化，再逐日以当天K线作为实时快照更新"""
+    live = LiveFactors()
+    live.add({code: bars for code, bars in history.items()}, days[0])
+    for day in days:
+        spot = pd.DataFrame([
+            {'代码': code, '最新价': bars.loc[bars['日期'] == day, '收盘'].iloc[0],
+             '最低': bars.loc[bars['日期'] == day, '最低'].iloc[0]}
+            for code, bars in history.items()])
+        live.update(spot, day)
+    return live.scores(codes)
+
+
+def test_live_factors_match_batch_computation():
+    codes = [f'{i:06d}' for i in range(30)]
+    history = make_history(codes, 60, '2026-10-16')
+    today = date(2026, 10, 16)
+    expected = compute_factors(history, codes=codes)
+    result = live_scores(history, [today], codes)
+    assert_frame_equal(result[expected.columns], expected, check_exact=False, rtol=1e-9)
+
+
+def test_live_factors_match_after_rolling_days():
+    codes = [f'{i:06d}' for i in range(10)]
+    history = make_history(codes, 60, '2026-10-16', seed=1)
+    days = [date(2026, 10, 12), date(2026, 10, 13), date(2026, 10, 14), date(2026, 10, 15), date(2026, 10, 16)]
+    expected = compute_factors(history, codes=codes)
+    # 从10-12开始盘中更新，之后每个交易日把前一天的K线写入环形缓冲区
+    result = live_scores(history, days, codes)
+    assert_frame_equal(result[expected.columns], expected, check_exact=False, rtol=1e-9)
+
+
+def test_short_history_is_dropped():
+    history = make_history(['000001', '000002'], 60, '2026-10-16')
+    history['000002'] = history['000002'].tail(3).reset_index(drop=True)
+    result = live_scores(history, [date(2026, 10, 16)], ['000001', '000002'])
+    assert result['代码'].tolist() == ['000001']
+
+
+def spot_of(history, day, price_scale=1.0, low_scale=1.0):
+    """由当天日K构造实时快照；scale不为1时模拟盘中最后价格与官方收盘价不一致"""
+    rows = []
+    for i, (code, bars) in enumerate(history.items()):
+        bar = bars[bars['日期'] == day].iloc[0]
+        rows.append({'代码': code, '最新价': bar['收盘'] * price_scale, '最低': bar['最低'] * low_scale,
+                     '成交额': 1e8 * (i + 1)})
+    return pd.DataFrame(rows)
+
+
+def test_service_reconciles_previous_bar_with_official_close(tmp_path):
+    codes = [f'{i:06d}' for i in range(10)]
+    official = make_history(codes, 60, '2026-10-16', seed=2)
+    day1, day2 = date(2026, 10, 15), date(2026, 10, 16)
+    spots = {day1: spot_of(official, day1, price_scale=1.01, low_scale=1.02), day2: spot_of(official, day2)}
+    current = {}
+    service = LiveFactorService(top_n=10, spot_func=lambda: spots[current['day']],
+                                history_func=lambda codes, days: {code: official[code] for code in codes},
+                                output=str(tmp_path / 'live'))
+
+    current['day'] = day1
+    service.tick(datetime(2026, 10, 15, 14, 59))
+    current['day'] = day2
+    result = service.tick(datetime(2026, 10, 16, 9, 31))
+
+    # 10-15的K线以官方收盘价和最低价为准，而不是盘中最后一个快照
+    expected = compute_factors(official, codes=codes).sort_values('代码').reset_index(drop=True)
+    result = result.sort_values('代码').reset_index(drop=True)
+    assert_frame_equal(result[expected.columns], expected, check_exact=False, rtol=1e-9)
+
+
+def test_reseed_keeps_rolled_bar_until_history_has_it():
+    codes = ['000001', '000002']
+    official = make_history(codes, 60, '2026-10-16', seed=3)
+    day1, day2 = date(2026, 10, 15), date(2026, 10, 16)
+    live = LiveFactors()
+    live.add(official, day1)
+    live.update(spot_of(official, day1, price_scale=1.01), day1)
+
+    # 日K还没有10-15的K线：保留按快照滚动的结果
+    stale = {code: bars[bars['日期'] < day1] for code, bars in official.items()}
+    assert live.reseed(stale, day2) == 0
+    live.update(spot_of(official, day2), day2)
+    rolled = {code: bars.assign(收盘=np.where(bars['日期'] == day1, bars['收盘'] * 1.01, bars['收盘']))
+              for code, bars in official.items()}
+    expected = compute_factors(rolled, codes=codes)
+    assert_frame_equal(live.scores(codes)[expected.columns], expected, check_exact=False, rtol=1e-9)
+
+
+def test_reseed_applies_forward_adjusted_prices():
+    codes = ['000001', '000002', '000003']
+    official = make_history(codes, 60, '2026-10-16', seed=4)
+    day1, day2 = date(2026, 10, 15), date(2026, 10, 16)
+    live = LiveFactors()
+    live.add(official, day1)
+    live.update(spot_of(official, day1), day1)
+
+    # 10-16除权，前复权后之前的价格整体下调
+    adjusted = {code: bars.assign(收盘=np.where(bars['日期'] < day2, bars['收盘'] * 0.8, bars['收盘']),
+                                  最低=np.where(bars['日期'] < day2, bars['最低'] * 0.8, bars['最低']))
+                for code, bars in official.items()}
+    assert live.reseed(adjusted, day2) == 3
+    live.update(spot_of(adjusted, day2), day2)
+    expected = compute_factors(adjusted, codes=codes)
+    assert_frame_equal(live.scores(codes)[expected.columns], expected, check_exact=False, rtol=1e-9)
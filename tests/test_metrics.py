@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from utils import metrics
+from utils.metrics import ProfileTrigger, Registry, load_reports, render, report
+
+
+def test_registry_returns_existing_metric_and_checks_labels():
+    registry = Registry()
+    counter = registry.counter('jobs_total', '任务数', ('outcome',))
+    assert registry.counter('jobs_total', '任务数', ('outcome',)) is counter
+    with pytest.raises(ValueError):
+        registry.gauge('jobs_total', '任务数', ('outcome',))
+    with pytest.raises(ValueError):
+        counter.inc(kind='ok')
+    counter.inc(outcome='ok')
+    counter.inc(2, outcome='ok')
+    assert counter.samples() == [(['ok'], 3)]
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    registry.counter('jobs_total', '任务数', ('outcome',)).inc(outcome='a"b\\c')
+    registry.gauge('rows', '行数').set(12)
+    seconds = registry.histogram('stage_seconds', '耗时', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        seconds.observe(value, stage='fetch')
+
+    text = render([(None, registry.snapshot())])
+    assert text.splitlines() == [
+        '# HELP jobs_total 任务数',
+        '# TYPE jobs_total counter',
+        'jobs_total{outcome="a\\"b\\\\c"} 1',
+        '# HELP rows 行数',
+        '# TYPE rows gauge',
+        'rows 12',
+        '# HELP stage_seconds 耗时',
+        '# TYPE stage_seconds histogram',
+        'stage_seconds_bucket{stage="fetch",le="0.1"} 1',
+        'stage_seconds_bucket{stage="fetch",le="1.0"} 3',
+        'stage_seconds_bucket{stage="fetch",le="+Inf"} 4',
+        'stage_seconds_sum{stage="fetch"} 4.25',
+        'stage_seconds_count{stage="fetch"} 4',
+    ]
+
+
+def test_reports_are_merged_with_job_label(tmp_path):
+    registry = Registry()
+    registry.gauge('watch_store_rows', '行数').set(5)
+    report('watch', registry=registry, directory=str(tmp_path))
+    (tmp_path / 'broken.json').write_text('{', encoding='utf-8')
+
+    reports = load_reports(str(tmp_path))
+    assert [job for job, _ in reports] == ['watch']
+    text = render(reports)
+    assert 'watch_store_rows{job="watch"} 5' in text
+    assert 'metrics_report_timestamp_seconds{job="watch"}' in text
+
+
+def test_metrics_endpoint_exposes_api_and_reported_jobs(tmp_path, monkeypatch):
+    import main
+    registry = Registry()
+    registry.counter('watch_ticks_total', '轮询次数', ('outcome',)).inc(outcome='ok')
+    report('watch', registry=registry, directory=str(tmp_path))
+    monkeypatch.setattr(metrics, 'load_reports', lambda: load_reports(str(tmp_path)))
+
+    async def scrape():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            await client.get('/metrics')
+            return await client.get('/metrics')
+
+    response = asyncio.run(scrape())
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert 'watch_ticks_total{job="watch",outcome="ok"} 1' in response.text
+    assert 'api_request_seconds_count{job="api",path="/metrics",status="200"}' in response.text
+
+
+def test_profile_trigger_runs_once_when_requested(tmp_path):
+    trigger = ProfileTrigger('unit', directory=str(tmp_path))
+    assert trigger.run(lambda: 1) == 1
+    assert os.listdir(tmp_path) == []
+    trigger.request()
+    assert trigger.run(lambda: sum(range(1000))) == 499500
+    files = os.listdir(tmp_path)
+    assert files and not os.path.exists(trigger.flag)
+    assert all(name.startswith('unit-') for name in files)
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from factor.multi_factor import get_stock_news_data
+from utils.news_store import NewsStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def news(*items):
+    return pd.DataFrame([[f'2026-10-{day:02d} 09:00:00', title, f'http://news/{title}'] for day, title in items],
+                        columns=['发布时间', '新闻标题', '新闻链接'])
+
+
+class FakeNews:
+    """按股票返回新闻的接口，记录请求次数；failing中的股票抛出异常"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.failing = set()
+        self.calls = []
+
+    def __call__(self, code):
+        self.calls.append(code)
+        if code in self.failing:
+            raise ConnectionError('reset')
+        return self.pages[code]
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return NewsStore(root=str(tmp_path), ttl=60, max_items=3, clock=clock)
+
+
+def test_ttl_skips_requests_then_merges_newer_items(store, clock):
+    source = FakeNews({'000001': news((14, '甲'), (13, '乙'))})
+    assert store.get('000001', source)['新闻标题'].tolist() == ['甲', '乙']
+    assert store.get('000001', source)['新闻标题'].tolist() == ['甲', '乙']
+    assert source.calls == ['000001']
+    assert store.fresh('000001') is not None
+
+    clock.now += 61
+    assert store.fresh('000001') is None
+    source.pages['000001'] = news((16, '丁'), (15, '丙'), (14, '甲'))
+    # 只合并比本地更新的条目，按发布时间倒序最多保留max_items条
+    assert store.get('000001', source)['新闻标题'].tolist() == ['丁', '丙', '甲']
+    assert len(source.calls) == 2
+
+
+def test_news_data_uses_fresh_cache_and_falls_back_to_stale(store, clock):
+    source = FakeNews({'000001': news((14, '甲')), '000002': news(), '000003': news((15, '丙'))})
+    fetch = dict(rate_limit=0, fetch_func=source, store=store)
+    first = get_stock_news_data(['000001', '000002', '000003'], **fetch)
+    # 没有新闻的空表是有效结果，不重试
+    assert first == {'000001': '甲', '000002': '无相关新闻', '000003': '丙'}
+    assert sorted(source.calls) == ['000001', '000002', '000003']
+
+    # 缓存未过期：不发请求
+    source.calls.clear()
+    assert get_stock_news_data(['000001', '000002'], **fetch) == {'000001': '甲', '000002': '无相关新闻'}
+    assert source.calls == []
+
+    # 缓存过期且请求失败：重试用尽后使用过期的本地标题；从未成功获取过的视为失败
+    clock.now += 61
+    source.failing = {'000001', '000004'}
+    result = get_stock_news_data(['000001', '000004'], max_retries=2, **fetch)
+    assert result == {'000001': '甲', '000004': '新闻获取异常'}
+    assert source.calls.count('000001') == 2
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fluctuation import NEGATIVE_TYPES, TYPE_MAPPING, formatPercent, normalizeChanges
+from utils.concept_index import ConceptIndex
+
+COMMON_COLUMNS = ['板块名称', '时间', '名称', '相关信息', '类型', '四舍五入取整', '上下午', '时间排序']
+
+
+def baseline_normalize(rows, concept_df):
+    """3a72ced中getChanges的转换部分（去掉网络请求和写文件），作为对照"""
+    df = pd.DataFrame(rows).rename(columns={'c': '股票代码', 'n': '股票名称', 'tm': '时间', 'm': '市场', 't': '类型',
+                                            'i': '信息'})
+    info_df = df['信息'].str.split(',', expand=True)
+    info_df[0] = pd.to_numeric(info_df[0], errors='coerce')
+    df['涨跌幅'] = info_df[0]
+    df = df[(df['涨跌幅'] < 1) & ((df['涨跌幅'] >= 0.05) | (df['涨跌幅'] <= -0.05))]
+    negative_types = [str(t) for t in NEGATIVE_TYPES]
+    df = df[~df['类型'].astype(str).isin(negative_types)]
+
+    def format_time(tm):
+        tm_str = str(tm)
+        if len(tm_str) < 6:
+            tm_str = tm_str.zfill(6)
+        return f"{tm_str[:2]}:{tm_str[2:4]}"
+
+    output_df = pd.DataFrame()
+    output_df['股票代码'] = df['股票代码']
+    output_df['时间'] = df['时间'].apply(format_time)
+    output_df['名称'] = df['股票名称']
+    output_df['类型'] = df['类型'].astype(str).map({str(k): v for k, v in TYPE_MAPPING.items()}).fillna('未知类型')
+    output_df['四舍五入取整'] = df['涨跌幅'].apply(lambda x: int(round(x * 100)) if pd.notnull(x) else None)
+    output_df['相关信息'] = df['涨跌幅'].apply(lambda x: f"%+.2f" % (x * 100) + "%" if pd.notnull(x) else 'NaN')
+    first_concept_df = concept_df.drop_duplicates(subset=['股票代码'], keep='first')
+    output_df = pd.merge(output_df, first_concept_df[['股票代码', '板块名称']], on='股票代码', how='left')
+    output_df = output_df.sort_values('时间')
+    html_df = output_df[['板块名称', '时间', '名称', '相关信息', '类型', '四舍五入取整']].copy()
+    html_df['上下午'] = html_df['时间'].apply(lambda tm: '上午' if int(tm[:2]) < 12 else '下午')
+    html_df['时间排序'] = html_df['时间'].apply(lambda tm: int(tm[:2]) * 60 + int(tm[3:5]))
+    return html_df.sort_values(['上下午', '板块名称', '时间排序'])
+
+
+@pytest.fixture(scope='module')
+def concept_df():
+    df = pd.read_csv('static/concepts.csv', dtype={'股票代码': str})
+    return df[df['板块代码'] != '板块代码'].reset_index(drop=True)
+
+
+def recorded_batch(concept_df):
+    """由static/changes.csv中实际记录的异动还原出推送原始行，时间倒序，与接口返回的顺序一致"""
+    changes = pd.read_csv('static/changes.csv')
+    codes = dict(zip(concept_df['股票名称'], concept_df['股票代码']))
+    type_codes = {v: k for k, v in TYPE_MAPPING.items()}
+    rows = []
+    for i, change in enumerate(changes.itertuples(index=False)):
+        pct = float(change.相关信息.rstrip('%')) / 100
+        price = 10 + i % 90
+        hour, minute = map(int, change.时间.split(':'))
+        rows.append({'c': codes.get(change.名称, f'{900000 + i}'), 'n': change.名称,
+                     'tm': hour * 10000 + minute * 100 + i % 60, 'm': i % 2, 't': type_codes[change.类型],
+                     'i': f'{pct:.4f},{price:.2f},{price * pct:.2f}'})
+    return sorted(rows, key=lambda row: row['tm'], reverse=True)
+
+
+def synthetic_batch(concept_df, n=3000, seed=0):
+    """覆盖全部类型（含负面和未知类型）、过滤边界和不在成分表中的股票"""
+    rng = np.random.default_rng(seed)
+    codes = np.append(concept_df['股票代码'].unique()[:500], ['999998', '999999'])
+    types = list(TYPE_MAPPING) + NEGATIVE_TYPES + [1]
+    minutes = np.concatenate([np.arange(9 * 60 + 15, 11 * 60 + 30), np.arange(13 * 60, 15 * 60)])
+    pcts = np.concatenate([rng.uniform(-0.2, 0.2, n - 6), [0.05, -0.05, 0.0499, 1.0, 0.99995, -0.12345]])
+    rows = []
+    for pct in pcts:
+        minute = int(rng.choice(minutes))
+        rows.append({'c': str(rng.choice(codes)), 'n': f'股票{rng.integers(1000)}',
+                     'tm': minute // 60 * 10000 + minute % 60 * 100 + int(rng.integers(60)), 'm': 0,
+                     't': int(rng.choice(types)), 'i': f'{pct:.5f},12.34,0.56'})
+    return rows
+
+
+@pytest.mark.parametrize('batch', [recorded_batch, synthetic_batch])
+def test_matches_baseline_output(concept_df, batch):
+    rows = batch(concept_df)
+    expected = baseline_normalize(rows, concept_df).reset_index(drop=True)
+    actual = normalizeChanges(rows, ConceptIndex(concept_df), day=20250729)
+    assert len(actual) > 0
+    assert (actual['日期'] == 20250729).all()
+    # 旧实现没有板块时是NaN，新实现是None；只比较取值和顺序
+    assert actual[COMMON_COLUMNS].astype(object).fillna('').values.tolist() == \
+        expected[COMMON_COLUMNS].astype(object).fillna('').values.tolist()
+
+
+def test_format_percent_matches_printf():
+    values = np.concatenate([np.random.default_rng(1).uniform(-100, 100, 10000),
+                             [0.125, -0.125, 2.675, 5.005, -0.001, 0.0, -0.0, 99.995, 150.0, np.nan]])
+    assert formatPercent(values).tolist() == ['%+.2f%%' % v for v in values.tolist()]
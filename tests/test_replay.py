@@ -0,0 +1,104 @@
+import gzip
+import json
+
+import pytest
+
+import fluctuation
+from bench import fixtures
+from utils.concept_index import ConceptIndex
+from utils.event_store import ChangeStore
+from utils.replay import RecordingSession, ReplaySession, load_recording, replay
+from utils.shared_snapshot import SnapshotReader
+
+
+class StubSession:
+    """按调用次数返回不同原文的会话"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, params=None, **kwargs):
+        self.calls += 1
+        return ReplaySession({(url, (params or {}).get('pageindex')): f'第{self.calls}次'}).get(url, params)
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    def make(name):
+        return ChangeStore(str(tmp_path / name / 'changes'), str(tmp_path / name / 'changes.log'))
+    return make
+
+
+def test_recording_round_trip(tmp_path):
+    path = str(tmp_path / 'rec' / 'recording.jsonl.gz')
+    now = {'t': 100.0}
+    session = RecordingSession(StubSession(), path, clock=lambda: now['t'])
+    session.next_tick()
+    session.get('changes', params={'pageindex': 0})
+    now['t'] += 1
+    session.get('changes', params={'pageindex': 0})  # 同一轮询的重复请求取最后一次
+    session.get('rising')
+    now['t'] += 2
+    session.next_tick()
+    session.get('changes', params={'pageindex': 1})
+    session.close()
+    # 进程中断时最后一行可能不完整
+    with gzip.open(path, 'at', encoding='utf-8') as f:
+        f.write('{"run": 1, "tick"')
+
+    ticks = load_recording(path)
+    assert ticks == [(100.0, {('changes', 0): '第2次', ('rising', None): '第3次'}),
+                     (103.0, {('changes', 1): '第4次'})]
+    assert ReplaySession(ticks[0][1]).get('changes', params={'pageindex': 5}).text == ''
+
+
+def test_runs_appended_to_one_file_stay_apart(tmp_path):
+    path = str(tmp_path / 'recording.jsonl.gz')
+    for start in (100.0, 200.0):
+        session = RecordingSession(StubSession(), path, clock=lambda start=start: start)
+        session.run = int(start)
+        session.next_tick()
+        session.get('changes', params={'pageindex': 0})
+        session.close()
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line)['tick'] for line in f] == [1, 1]
+    assert [start for start, _ in load_recording(path)] == [100.0, 200.0]
+
+
+def test_replay_ends_in_the_same_state_as_one_live_poll(tmp_path, make_store, monkeypatch):
+    monkeypatch.setattr(fluctuation, 'print', lambda *args, **kwargs: None, raising=False)
+    ticks = load_recording(fixtures.recording(str(tmp_path / 'recording.jsonl.gz'), ticks=12, page_size=50, pages=3))
+    replayed = make_store('replayed')
+    stats = replay(ticks, concepts=ConceptIndex(fixtures.concept_members()), store=replayed,
+                   snapshot_path=str(tmp_path / 'changes.snap'))
+
+    # 最后一次录制的轮询能看到全部150条异动，把它们放在一页里直接处理一次应得到相同的状态（序号除外）
+    live = make_store('live')
+    session = fixtures.FixtureSession(fixtures.changes_pages(150, 1), fixtures.rising_concepts())
+    events = fluctuation.getChanges(ConceptIndex(fixtures.concept_members()), live, fluctuation.ChangeCursor(), session)
+
+    assert stats['ticks'] == 12 and stats['events'] == events and stats['rows'] == len(live)
+    state = lambda store: sorted((dict(row, 序号=None) for row in store.records()),
+                                 key=lambda row: (row['股票代码'], row['类型'], row['时间']))
+    assert state(replayed) == state(live)
+    # 每次变化都发布了共享快照，板块热度快照文件在结束时删除
+    version, count, body = SnapshotReader(str(tmp_path / 'changes.snap')).read()
+    assert (version, count) == (replayed.version, len(replayed))
+    assert json.loads(body) == replayed.records()
+    assert not (tmp_path / 'changes.snap.heat').exists()
+
+
+def test_replay_keeps_recorded_pace_with_capped_gaps(monkeypatch):
+    monkeypatch.setattr(fluctuation, 'getChanges', lambda concepts, store, cursor, session: 1)
+    now, slept = {'t': 0.0}, []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now['t'] += seconds
+
+    # 第三次轮询前有两小时午休，按max_gap回放
+    ticks = [(1000.0, {}), (1003.0, {}), (8203.0, {}), (8206.0, {})]
+    stats = replay(ticks, speed=2, concepts=ConceptIndex(fixtures.concept_members()), max_gap=60,
+                   clock=lambda: now['t'], sleep=sleep)
+    assert slept == [1.5, 30.0, 1.5]
+    assert stats['ticks'] == 4 and stats['events'] == 4 and stats['max_lag'] == 0.0
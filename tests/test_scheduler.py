@@ -0,0 +1,131 @@
+from datetime import date, datetime
+
+import pytest
+
+from utils import metrics
+from utils.scheduler import AdaptiveInterval, TickScheduler, TradingCalendar
+
+
+class FakeTime:
+    """Unix时间戳时钟：sleep只推进时间"""
+
+    def __init__(self, moment):
+        self.now = moment.timestamp()
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_scheduler(moment, interval=2.0):
+    clock = FakeTime(moment)
+    return TickScheduler(TradingCalendar(), interval=interval, clock=clock, sleep=clock.sleep, job='test'), clock
+
+
+def test_ticks_stay_on_grid_without_drift():
+    scheduler, clock = make_scheduler(datetime(2026, 10, 16, 10, 0))
+    starts = []
+
+    def task():
+        starts.append(clock.now)
+        clock.now += 0.3  # 任务耗时不应累积到下一次触发时间上
+        return 0
+
+    while len(starts) < 4:
+        scheduler.run_once(task)
+    assert [s - starts[0] for s in starts] == pytest.approx([0.0, 2.0, 4.0, 6.0])
+    assert scheduler.stats['ticks'] == 4
+    assert scheduler.stats['overruns'] == 0
+    assert scheduler.stats['last_interval'] == 2.0
+
+
+def test_overrun_skips_missed_grid_points():
+    scheduler, clock = make_scheduler(datetime(2026, 10, 16, 10, 0))
+    start = clock.now
+    starts = []
+    durations = iter([5.5, 0.1])
+
+    def task():
+        starts.append(clock.now)
+        clock.now += next(durations)
+        return 0
+
+    while len(starts) < 2:
+        scheduler.run_once(task)
+    # 第一次耗时5.5秒，错过了2秒和4秒两个网格点，下一次在6秒触发，而不是连续补跑
+    assert starts[1] - start == pytest.approx(6.0)
+    assert scheduler.stats['overruns'] == 1
+    assert scheduler.stats['skipped_ticks'] == 2
+
+
+def test_lateness_is_recorded():
+    scheduler, clock = make_scheduler(datetime(2026, 10, 16, 10, 0))
+    scheduler.run_once(lambda: 0)
+    clock.now += 2.75  # 例如进程被挂起：计划在2秒触发，实际晚了0.75秒
+    scheduler.run_once(lambda: 0)
+    assert scheduler.stats['max_lateness'] == pytest.approx(0.75)
+
+
+def test_sleeps_until_next_session_outside_trading_hours():
+    scheduler, clock = make_scheduler(datetime(2026, 10, 16, 12, 0))
+    ran = []
+    idle = []
+    assert scheduler.run_once(lambda: ran.append(1), on_idle=lambda: idle.append(1)) is False
+    assert ran == [] and idle == [1]
+    assert clock.sleeps == [pytest.approx(3600.0)]  # 12:00 -> 13:00
+
+
+def test_last_session_day():
+    calendar = TradingCalendar()
+    assert calendar.last_session_day(datetime(2026, 10, 19, 0, 30)) == date(2026, 10, 16)  # 周一凌晨 -> 上周五
+    assert calendar.last_session_day(datetime(2026, 10, 19, 9, 29)) == date(2026, 10, 16)
+    assert calendar.last_session_day(datetime(2026, 10, 19, 9, 30)) == date(2026, 10, 19)
+    holiday = TradingCalendar([date(2026, 9, 30), date(2026, 10, 9)])
+    assert holiday.last_session_day(datetime(2026, 10, 8, 10, 0)) == date(2026, 9, 30)
+
+
+def test_overrun_and_lateness_exported_as_metrics():
+    scheduler, clock = make_scheduler(datetime(2026, 10, 16, 10, 0))
+    scheduler.job = 'metrics-test'
+
+    def slow_task():
+        clock.now += 4.5
+        return 0
+
+    scheduler.run_once(slow_task)
+    scheduler.run_once(lambda: 0)
+    clock.now += 2.75
+    scheduler.run_once(lambda: 0)
+    # 晚了2.75秒才开始的一次也错过了下一个触发点
+    assert scheduler.stats['overruns'] == 2 and scheduler.stats['max_lateness'] == pytest.approx(2.75)
+    samples = {m['name']: dict((tuple(labels), value) for labels, value in m['samples'])
+               for m in metrics.REGISTRY.snapshot()['metrics'] if m['name'].startswith('scheduler_')}
+    assert samples['scheduler_overruns_total'][('metrics-test',)] == 2
+    assert samples['scheduler_skipped_ticks_total'][('metrics-test',)] == scheduler.stats['skipped_ticks'] == 3
+    assert samples['scheduler_interval_seconds'][('metrics-test',)] == 2.0
+    assert samples['scheduler_max_lateness_seconds'][('metrics-test',)] == scheduler.stats['max_lateness']
+
+
+def test_calendar_uses_trade_dates_and_falls_back_to_weekdays():
+    calendar = TradingCalendar([date(2026, 9, 30), date(2026, 10, 9)])
+    assert not calendar.is_trading_day(date(2026, 10, 8))  # 国庆休市
+    assert calendar.is_trading_day(date(2026, 10, 12))      # 日历未覆盖，按工作日
+    assert not calendar.is_trading_day(date(2026, 10, 17))
+    assert calendar.in_session(datetime(2026, 10, 9, 9, 30))
+    assert not calendar.in_session(datetime(2026, 10, 9, 11, 45))
+    assert calendar.next_session_start(datetime(2026, 9, 30, 15, 0)) == datetime(2026, 10, 9, 9, 30)
+    assert calendar.next_session_start(datetime(2026, 10, 9, 11, 45)) == datetime(2026, 10, 9, 13, 0)
+
+
+def test_adaptive_interval_follows_session_and_load():
+    interval = AdaptiveInterval()
+    assert interval.next(datetime(2026, 10, 16, 9, 35), events=5) == 1.0    # 开盘密集时段
+    assert interval.next(datetime(2026, 10, 16, 10, 30), events=5) == 2.0
+    assert interval.next(datetime(2026, 10, 16, 13, 30), events=30) == 1.5  # 事件多时加快一倍
+    # 连续空轮询逐步放慢，不超过上限
+    slow = [interval.next(datetime(2026, 10, 16, 13, 30), events=0) for _ in range(10)]
+    assert slow == sorted(slow) and slow[-1] == 10.0
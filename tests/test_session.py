@@ -0,0 +1,65 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import fluctuation
+
+
+class StubChanges(BaseHTTPRequestHandler):
+    """本地桩服务：按pageindex返回异动推送的JSONP，第一次请求返回503以触发会话的重试"""
+    protocol_version = 'HTTP/1.1'  # 保持连接，验证会话复用
+    pages = []
+    requests = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        type(self).requests.append((self.client_address[1], query['pageindex'][0]))
+        if len(type(self).requests) == 1:
+            body, status = b'busy', 503
+        else:
+            rows = self.pages[int(query['pageindex'][0])]
+            body = f"{query['cb'][0]}({json.dumps({'data': {'allstock': rows}})});".encode('utf-8')
+            status = 200
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubChanges)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StubChanges.requests = []
+    monkeypatch.setattr(fluctuation, 'CHANGES_URL', f'http://127.0.0.1:{server.server_port}/getAllStockChanges')
+    yield StubChanges
+    server.shutdown()
+    server.server_close()
+
+
+def change_row(tm, code):
+    return {'c': code, 'n': '股票', 'tm': tm, 'm': 0, 't': 8201, 'i': '0.0600,10.00,0.57'}
+
+
+def test_poll_pages_through_pooled_session(stub_server):
+    stub_server.pages = [[change_row(93500, '000001'), change_row(93400, '000002')],
+                         [change_row(93300, '000003'), change_row(93200, '000004')],
+                         [change_row(93100, '000005')]]
+    session = fluctuation.createSession(retries=2, backoff_factor=0)
+    cursor = fluctuation.ChangeCursor()
+    rows = fluctuation.pollNewChanges(cursor, pagesize=2, session=session)
+    assert [row['c'] for row in rows] == ['000001', '000002', '000003', '000004', '000005']
+    # 503由会话重试；之后的各页都复用同一个keep-alive连接
+    assert [page for _, page in stub_server.requests] == ['0', '0', '1', '2']
+    assert len({port for port, _ in stub_server.requests[1:]}) == 1
+
+    # 没有新异动时只请求第一页，且不返回已处理的行
+    stub_server.requests = [(None, None)]
+    assert fluctuation.pollNewChanges(cursor, pagesize=2, session=session) == []
+    assert [page for _, page in stub_server.requests[1:]] == ['0']
@@ -0,0 +1,124 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from utils.event_store import COLUMNS, ChangeStore, ChangesView, rows_to_json
+from utils.shared_snapshot import (HEADER, MAGIC, _WRITER, _WRITER_OFFSET, SharedChangesView, SnapshotReader,
+                                   SnapshotWriter)
+
+
+def change(name, info='+1.00%', day=20261016):
+    return dict(zip(COLUMNS, ['AI', '09:31:00', name, info, '大笔买入', 1, '上午', 571, '000001', day]))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChangeStore(str(tmp_path / 'changes'), str(tmp_path / 'changes.log'))
+
+
+def test_round_trip_across_version_bumps(tmp_path, store):
+    path = str(tmp_path / 'changes.snap')
+    writer = SnapshotWriter(path, capacity=64)
+    reader = SnapshotReader(path)
+    assert reader.read() is None  # 尚未发布
+
+    store.upsert(pd.DataFrame([change('甲'), change('乙')]))
+    writer.publish(store.version, len(store), store.to_json())
+    version, count, body = reader.read()
+    assert (version, count) == (2, 2)
+    assert [row['名称'] for row in json.loads(body)] == ['甲', '乙']
+
+    # 序号不变时返回同一份快照，不复制正文
+    assert reader.read()[2] is body
+
+    # 正文超过初始容量，写者扩容文件，读者重新映射
+    store.upsert(pd.DataFrame([change('甲', '+2.00%')] + [change(f'股票{i}') for i in range(20)]))
+    writer.publish(store.version, len(store), store.to_json())
+    version, count, body = reader.read()
+    assert (version, count) == (store.version, 22)
+    assert json.loads(body) == json.loads(rows_to_json(store._rows.values()))
+    assert json.loads(body)[-21]['相关信息'] == '+2.00%'
+    writer.close()
+    reader.close()
+
+
+def test_incremental_body_matches_full_serialization(store):
+    store.upsert(pd.DataFrame([change(f'股票{i}') for i in range(50)]))
+    store.to_json()
+    store.upsert(pd.DataFrame([change('股票3', '+5.00%'), change('新股')]))
+    assert store.to_json() == rows_to_json(store._rows.values())
+
+
+def test_writer_restart_continues_sequence(tmp_path):
+    path = str(tmp_path / 'changes.snap')
+    writer = SnapshotWriter(path)
+    writer.publish(1, 0, b'[]')
+    reader = SnapshotReader(path)
+    assert reader.read()[0] == 1
+    writer.close()
+    # 新的写者沿用文件中的序号，已映射的读者能看到新发布的内容
+    writer = SnapshotWriter(path)
+    writer.publish(1, 1, b'[{}]')
+    assert reader.read() == (1, 1, b'[{}]')
+    writer.close()
+
+
+def test_shared_view_falls_back_when_writer_stops(tmp_path, store):
+    store.upsert(pd.DataFrame([change('甲')]))
+    store.compact()
+    path = str(tmp_path / 'changes.snap')
+    view = SharedChangesView(path, fallback=ChangesView(store.snapshot_path, store.log_path))
+
+    writer = SnapshotWriter(path)
+    writer.publish(99, 0, b'[]')
+    assert view.refresh() == 99 and len(view) == 0
+
+    # 心跳过期：不再使用快照，改读快照文件
+    _WRITER.pack_into(writer._mm, _WRITER_OFFSET, os.getpid(), 0.0)
+    assert view.refresh() == store.version and len(view) == 1
+    writer.heartbeat()
+    assert view.refresh() == 99
+
+    # 写者正常关闭时PID清零
+    writer.close()
+    assert view.refresh() == store.version
+    assert [row['名称'] for row in view.records()] == ['甲']
+
+
+def test_reader_follows_replaced_file(tmp_path):
+    path = str(tmp_path / 'changes.snap')
+    old = SnapshotWriter(path)
+    old.publish(5, 0, b'[]')
+    reader = SnapshotReader(path)
+    assert reader.read()[0] == 5
+
+    os.rename(path, path + '.old')
+    new = SnapshotWriter(path)
+    new.publish(7, 0, b'[]')
+    assert reader.read()[0] == 7
+
+    os.remove(path)
+    assert reader.read() is None
+    old.close()
+    new.close()
+
+
+def test_read_returns_none_when_remap_fails(tmp_path):
+    path = str(tmp_path / 'changes.snap')
+    writer = SnapshotWriter(path, capacity=64)
+    writer.publish(1, 0, b'[]')
+    reader = SnapshotReader(path)
+    assert reader.read()[0] == 1
+
+    # 头部声明的正文超出映射范围，而重新映射时文件已不可用
+    HEADER.pack_into(writer._mm, 0, MAGIC, 4, 2, 0, 1 << 20, os.getpid(), 0.0)
+
+    def gone():
+        reader.close()
+        return False
+
+    reader._map = gone
+    assert reader.read() is None
+    writer.close()
@@ -0,0 +1,164 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from utils.supervisor import HAS_FCNTL, SUPERVISOR_PID_ENV, WatchSupervisor, hold_watch_lock
+
+SHORT_LIVED = [sys.executable, '-c', 'import sys, time; time.sleep(0.2); sys.exit(3)']
+LONG_LIVED = [sys.executable, '-c', 'import time; time.sleep(60)']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        value = condition()
+        if value:
+            return value
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def supervisors():
+    """按需创建同一控制端口上的多个管理者，测试结束时全部停止"""
+    port = free_port()
+    created = []
+
+    def make(command, **kwargs):
+        options = dict(min_backoff=0.3, max_backoff=1.2, stable_after=60, elect_interval=0.05, poll_interval=0.02,
+                       stop_timeout=2.0)
+        options.update(kwargs)
+        supervisor = WatchSupervisor(command, port=port, **options).start()
+        created.append(supervisor)
+        return supervisor
+
+    yield make
+    for supervisor in reversed(created):
+        supervisor.stop()
+
+
+def test_crashing_watcher_backs_off_and_restarts(supervisors):
+    leader = supervisors(SHORT_LIVED)
+    assert leader.is_leader
+    first = leader.status()
+    assert first['status'] == 'running' and first['restarts'] == 0
+
+    crashed = wait_until(lambda: (s := leader.status())['status'] == 'backoff' and s)
+    assert crashed['return_code'] == 3 and 0 < crashed['restart_in'] <= 0.3
+
+    rerun = wait_until(lambda: (s := leader.status())['status'] == 'running' and s['restarts'] == 1 and s)
+    assert rerun['pid'] != first['pid']
+
+    # 连续崩溃时退避时间翻倍
+    crashed = wait_until(lambda: (s := leader.status())['status'] == 'backoff' and s['restarts'] == 1 and s)
+    assert 0.3 < crashed['restart_in'] <= 0.6
+
+
+def test_restart_request_resets_backoff(supervisors):
+    leader = supervisors(LONG_LIVED)
+    pid = leader.status()['pid']
+    response = leader.restart()
+    assert response['status'] == 'restarted' and response['restarts'] == 1
+    assert response['pid'] != pid
+    assert leader.status()['status'] == 'running'
+    assert leader._backoff == leader.min_backoff
+
+
+def test_second_instance_forwards_to_leader(supervisors):
+    leader = supervisors(LONG_LIVED)
+    follower = supervisors(LONG_LIVED)
+    assert leader.is_leader and not follower.is_leader
+    assert follower.process is None
+
+    status = follower.status()
+    assert status == leader.status() | {'uptime': status['uptime']}
+    pid = status['pid']
+
+    response = follower.restart()
+    assert response['status'] == 'restarted' and response['pid'] != pid
+    assert leader.status()['restarts'] == 1 and leader.process.pid == response['pid']
+    assert follower.process is None
+
+
+
+def test_follower_takes_over_when_leader_stops(supervisors):
+    leader = supervisors(LONG_LIVED)
+    follower = supervisors(LONG_LIVED)
+    watcher = leader.process
+    leader.stop()
+    # leader停止时终止监控进程并释放端口
+    assert watcher.poll() is not None and not leader.is_leader
+
+    wait_until(lambda: follower.is_leader)
+    status = wait_until(lambda: (s := follower.status())['status'] == 'running' and s)
+    assert status['pid'] == follower.process.pid != watcher.pid
+    assert leader.status()['pid'] == status['pid']  # 原leader转为向新leader查询
+
+    process = follower.process
+    follower.stop()
+    assert process.poll() is not None
+
+
+def alive(pid):
+    """进程存在且不是僵尸进程"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='需要/proc')
+def test_watcher_exits_with_its_supervisor():
+    # 中间进程扮演管理者：带着环境变量启动监控进程，输出其PID后等待被强制结束
+    watcher = ('import time; from utils.supervisor import exit_with_supervisor; '
+               'exit_with_supervisor(interval=0.05); time.sleep(60)')
+    supervisor = subprocess.Popen(
+        [sys.executable, '-c', 'import os, subprocess, sys, time; '
+         f'child = subprocess.Popen([sys.executable, "-c", {watcher!r}], '
+         f'env=dict(os.environ, {SUPERVISOR_PID_ENV}=str(os.getpid()))); '
+         'print(child.pid, flush=True); time.sleep(60)'],
+        stdout=subprocess.PIPE, text=True)
+    pid = int(supervisor.stdout.readline())
+    time.sleep(0.5)
+    assert alive(pid)
+    supervisor.kill()
+    supervisor.wait()
+    wait_until(lambda: not alive(pid))
+
+
+@pytest.mark.skipif(not HAS_FCNTL, reason='需要fcntl')
+def test_watch_lock_waits_for_the_holder(tmp_path):
+    path = str(tmp_path / 'watch.lock')
+    holder = subprocess.Popen(
+        [sys.executable, '-c', 'import sys; from utils.supervisor import hold_watch_lock; '
+         f'lock = hold_watch_lock({path!r}); print("locked", flush=True); sys.stdin.read()'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    assert holder.stdout.readline().strip() == 'locked'
+    with open(path) as f:
+        assert f.read() == str(holder.pid)
+
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(hold_watch_lock(path)), daemon=True)
+    thread.start()
+    thread.join(0.3)
+    assert not acquired  # 持有者仍在运行，阻塞等待
+
+    holder.stdin.close()
+    holder.wait()
+    thread.join(5)
+    assert acquired
+    with open(path) as f:
+        assert f.read() == str(os.getpid())
+    acquired[0].close()
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+import pytest
+
+from utils import table_store
+from utils.table_store import latest_path, read_arrow, read_table, table_paths, write_table
+
+
+def frame():
+    return pd.DataFrame({'板块名称': ['人工智能', '机器人', '人工智能'], '股票代码': ['000001', '600000', '300001'],
+                         '数值': [1.5, -2.0, 0.25]})
+
+
+def test_round_trip_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(table_store, 'HAS_ARROW', False)
+    base = str(tmp_path / 'sub' / 'table')
+    assert latest_path(base) is None and read_table(base) is None
+    assert write_table(frame(), base) == table_paths(base)['csv']
+    pd.testing.assert_frame_equal(read_table(base, dtype={'股票代码': str}), frame())
+    assert read_arrow(base) is None
+
+
+@pytest.mark.skipif(not table_store.HAS_ARROW, reason='需要pyarrow')
+def test_feather_round_trip_uses_categories(tmp_path):
+    base = str(tmp_path / 'table')
+    assert write_table(frame(), base) == table_paths(base)['feather']
+    df = read_table(base)
+    assert isinstance(df['板块名称'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(df.astype({'板块名称': object}), frame(), check_dtype=False)
+    assert read_table(base, columns=['数值'])['数值'].tolist() == [1.5, -2.0, 0.25]
+    assert read_arrow(base).num_rows == 3
+
+
+@pytest.mark.skipif(not table_store.HAS_ARROW, reason='需要pyarrow')
+def test_feather_preferred_regardless_of_mtime(tmp_path):
+    base = str(tmp_path / 'table')
+    paths = table_paths(base)
+    write_table(frame(), base, fmt='feather')
+    frame().head(1).to_csv(paths['csv'], index=False)
+    # CSV更新（例如重新检出），仍然读取Feather
+    os.utime(paths['feather'], ns=(0, 0))
+    assert latest_path(base) == paths['feather']
+    assert len(read_table(base)) == 3
+
+    # 只剩CSV时退回CSV
+    os.remove(paths['feather'])
+    assert latest_path(base) == paths['csv']
+    assert len(read_table(base)) == 1
+
+
+@pytest.mark.skipif(not table_store.HAS_ARROW, reason='需要pyarrow')
+def test_writing_csv_drops_stale_feather(tmp_path):
+    base = str(tmp_path / 'table')
+    write_table(frame(), base, fmt='feather')
+    write_table(frame().head(2), base, fmt='csv')
+    assert not os.path.exists(table_paths(base)['feather'])
+    assert len(read_table(base)) == 2
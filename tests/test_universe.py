@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from factor.universe import board_of, project_spot, select_universes, top_k
+
+
+def test_top_k_matches_nlargest_with_ties():
+    values = np.array([3.0, 1.0, 3.0, 2.0, 3.0, 0.5])
+    expected = pd.Series(values).nlargest(2).index.tolist()
+    assert top_k(values, 2).tolist() == expected == [0, 2]
+
+
+def test_top_k_never_selects_nan():
+    values = np.array([1.0, np.nan, 3.0, np.nan, 2.0])
+    assert top_k(values, 2).tolist() == [2, 4]
+    # k大于有效元素数时只返回有效元素
+    assert top_k(values, 5).tolist() == [2, 4, 0]
+    assert top_k([np.nan, np.nan], 1).tolist() == []
+
+
+def test_board_of_prefixes():
+    boards = board_of(['sh600000', 'sz000001', 'sz300750', 'sh688981', 'bj830799', '920001', 'xx'])
+    assert list(boards) == ['沪主板', '深主板', '创业板', '科创板', '北交所', '北交所', '其他']
+
+
+def test_select_universes_matches_sorting_each_pool():
+    rng = np.random.default_rng(0)
+    codes = [f'sh60{i:04d}' for i in range(300)] + [f'sz30{i:04d}' for i in range(200)]
+    amounts = rng.uniform(1e6, 1e9, len(codes))
+    amounts[::37] = np.nan  # 停牌
+    spot = project_spot(pd.DataFrame({'代码': codes, '名称': codes, '最新价': 10.0, '成交额': amounts}))
+    universes = select_universes(spot, top=(20, 100), per_board=10)
+    assert set(universes) == {'top20', 'top100', '沪主板top10', '创业板top10'}
+
+    ranked = spot.sort_values('成交额', ascending=False, kind='stable')
+    assert spot.index[universes['top100']].tolist() == ranked.index[:100].tolist()
+    assert universes['top20'].tolist() == universes['top100'][:20].tolist()
+    for board, rows in (('沪主板', universes['沪主板top10']), ('创业板', universes['创业板top10'])):
+        expected = ranked[ranked['板块'] == board].index[:10].tolist()
+        assert rows.tolist() == expected
+
+
+def test_project_spot_keeps_only_needed_columns():
+    spot = pd.DataFrame({'股票代码': ['sz000001'], '名称': ['平安银行'], '最新价': ['11.5'], '成交额': [None],
+                         '市盈率': [5.0]})
+    projected = project_spot(spot, columns=('代码', '最新价', '成交额'))
+    assert list(projected.columns) == ['代码', '最新价', '成交额', '板块']
+    assert projected['最新价'].dtype == 'float64' and np.isnan(projected['成交额'].iloc[0])
+    assert projected['板块'].iloc[0] == '深主板'
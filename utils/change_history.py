@@ -0,0 +1,227 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from utils.event_store import DTYPES, KEY_COLUMNS, SEQ_COLUMN, STORED_COLUMNS, _clean
+from utils.table_store import HAS_ARROW, feather, latest_path, read_table, write_table
+
+# 历史异动按交易日分区：<目录>/<YYYYMMDD>.feather（或.csv）为当天全部异动，<YYYYMMDD>.index.json为索引
+HISTORY_DIR = 'static/history'
+# 建立倒排索引的列；时间排序（分钟）列按分区内的排序直接二分
+INDEX_COLUMNS = ('股票代码', '板块名称')
+_PARTITION = re.compile(r'^(\d{8})\.(feather|csv)$')
+
+
+class _Index:
+    """一个分区的索引：分钟的游程（起始分钟、起始行号）和各列取值 -> 行号列表，以及打开后的分区数据"""
+
+    def __init__(self, data):
+        self.rows = data['rows']
+        runs = np.array(data['minutes'], dtype='int64').reshape(-1, 2)
+        self.minutes, self.starts = runs[:, 0], runs[:, 1]
+        # 倒排保持为列表，查询用到的取值才转为数组
+        self.postings = {column: data[column] for column in INDEX_COLUMNS}
+        self.table = None
+
+    def minute_range(self, start=None, end=None):
+        """分钟在[start, end]内的行号区间[lo, hi)"""
+        lo = 0 if start is None else self._position(np.searchsorted(self.minutes, start, 'left'))
+        hi = self.rows if end is None else self._position(np.searchsorted(self.minutes, end, 'right'))
+        return lo, hi
+
+    def _position(self, run):
+        return int(self.starts[run]) if run < len(self.starts) else self.rows
+
+
+class ChangeHistory:
+    """
+    按交易日分区的历史异动
+
+    每个分区按(时间排序, 序号)排序后写入一次，旁边是JSON索引：股票代码和板块名称的倒排（取值 -> 行号），
+    以及分钟的游程。查询只打开涉及的交易日分区：先用索引求出行号（分钟条件是二分得到的连续区间，
+    与倒排求交），再只取这些行；有pyarrow时分区以内存映射打开，取行不读整个文件。
+    分区只在归档时整体重写，索引按文件签名缓存，最近用过的cache_size个分区的索引常驻内存。
+
+    参数：
+        directory (str): 分区目录
+        cache_size (int): 缓存索引的分区数
+    """
+
+    def __init__(self, directory=HISTORY_DIR, cache_size=32):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _base(self, day):
+        return os.path.join(self.directory, str(day))
+
+    def days(self):
+        """已归档的交易日（YYYYMMDD整数），升序"""
+        if not os.path.isdir(self.directory):
+            return []
+        days = set()
+        for filename in os.listdir(self.directory):
+            match = _PARTITION.match(filename)
+            if match and (HAS_ARROW or match.group(2) == 'csv'):
+                days.add(int(match.group(1)))
+        return sorted(days)
+
+    def append(self, df):
+        """
+        把异动按日期归档到各自的分区；分区已存在时合并，按(日期, 名称, 类型)保留最新一条
+
+        参数：
+            df (DataFrame): 包含STORED_COLUMNS各列的异动
+        """
+        for day, part in df.groupby('日期', sort=True):
+            existing = read_table(self._base(day), dtype=DTYPES)
+            if existing is not None:
+                part = pd.concat([existing[STORED_COLUMNS], part[STORED_COLUMNS]], ignore_index=True)
+                part = part.drop_duplicates(subset=list(KEY_COLUMNS), keep='last')
+            part = part.sort_values(['时间排序', SEQ_COLUMN], kind='stable').reset_index(drop=True)
+            self._write(int(day), part[STORED_COLUMNS])
+
+    def _write(self, day, df):
+        base = self._base(day)
+        path = write_table(df, base)
+        # 数据文件在前、索引在后原子替换；索引缺失或与数据不符时查询会重建
+        index = build_index(df)
+        index['source'] = os.path.basename(path)
+        with open(f'{base}.index.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(f'{base}.index.json.tmp', f'{base}.index.json')
+
+    def _index(self, day):
+        path = latest_path(self._base(day))
+        if path is None:
+            return None, None
+        st = os.stat(path)
+        sig = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._cache.get(day)
+            if cached is not None and cached[0] == sig:
+                self._cache.move_to_end(day)
+                return path, cached[1]
+        index = None
+        try:
+            with open(f'{self._base(day)}.index.json', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('source') == os.path.basename(path):
+                index = _Index(data)
+        except (OSError, ValueError):
+            pass
+        if index is None:
+            index = _Index(build_index(read_table(self._base(day), dtype=DTYPES)))
+        with self._lock:
+            self._cache[day] = (sig, index)
+            self._cache.move_to_end(day)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return path, index
+
+    def query(self, day, concept=None, code=None, start=None, end=None):
+        """
+        查询一个交易日的异动
+
+        参数：
+            day (int): 交易日，YYYYMMDD
+            concept (str, optional): 板块名称；空字符串表示没有归属板块
+            code (str, optional): 股票代码
+            start (int, optional): 起始分钟（含），当天的分钟数，例如9:30为570
+            end (int, optional): 结束分钟（含）
+
+        返回：
+            list: 行字典，按时间排序；分区不存在时为空列表
+        """
+        path, index = self._index(day)
+        if index is None:
+            return []
+        lo, hi = index.minute_range(start, end)
+        positions = None
+        for column, value in (('板块名称', concept), ('股票代码', code)):
+            if value is None:
+                continue
+            posting = index.postings[column].get(value)
+            if posting is None:
+                return []
+            posting = np.asarray(posting, dtype='int64')
+            positions = posting if positions is None else np.intersect1d(positions, posting, assume_unique=True)
+        if positions is None:
+            positions = np.arange(lo, hi)
+        else:
+            positions = positions[(positions >= lo) & (positions < hi)]
+        if not len(positions):
+            return []
+        return _take(path, index, positions)
+
+
+def build_index(df):
+    """为按时间排序排好的分区建立索引，返回可JSON序列化的dict"""
+    minutes = df['时间排序'].to_numpy(dtype='int64')
+    starts = np.flatnonzero(np.r_[True, minutes[1:] != minutes[:-1]]) if len(minutes) else np.array([], 'int64')
+    index = {'rows': len(df), 'minutes': [[int(minutes[i]), int(i)] for i in starts]}
+    for column in INDEX_COLUMNS:
+        values = df[column].astype(object).where(df[column].notna(), '').astype(str).to_numpy()
+        codes, uniques = pd.factorize(values)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        index[column] = {value: order[bounds[i]:bounds[i + 1]].tolist() for i, value in enumerate(uniques)}
+    return index
+
+
+def _take(path, index, positions):
+    """只读取分区中指定行号的行；Feather分区内存映射打开一次，随索引缓存"""
+    if path.endswith('.feather'):
+        if index.table is None:
+            index.table = feather.read_table(path, memory_map=True)
+        table = index.table.take(positions)
+        columns = [table.column(name).to_pylist() for name in STORED_COLUMNS]
+        rows = zip(*columns)
+    else:
+        df = pd.read_csv(path, dtype=DTYPES)
+        rows = df[STORED_COLUMNS].iloc[positions].itertuples(index=False, name=None)
+    return [dict(zip(STORED_COLUMNS, _clean(row))) for row in rows]
+
+
+def filter_rows(rows, concept=None, code=None, start=None, end=None):
+    """按与ChangeHistory.query相同的条件筛选当前交易日的行（行字典），按时间排序返回"""
+    selected = [row for row in rows
+                if (concept is None or (row['板块名称'] or '') == concept)
+                and (code is None or row['股票代码'] == code)
+                and (start is None or row['时间排序'] >= start)
+                and (end is None or row['时间排序'] <= end)]
+    selected.sort(key=lambda row: (row['时间排序'], row[SEQ_COLUMN]))
+    return selected
+
+
+def parse_minute(value):
+    """'HH:MM'或分钟数 -> 当天的分钟数；None原样返回"""
+    if value is None or value == '':
+        return None
+    value = str(value)
+    if ':' in value:
+        hour, minute = value.split(':', 1)
+        return int(hour) * 60 + int(minute)
+    return int(value)
+
+
+def parse_days(value):
+    """
+    解析日期参数：'YYYYMMDD'为单日，'YYYYMMDD-YYYYMMDD'为闭区间；也接受'YYYY-MM-DD'形式的单日
+
+    返回：
+        tuple: (起始交易日, 结束交易日)，YYYYMMDD整数
+    """
+    value = value.strip()
+    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', value):
+        value = value.replace('-', '')
+    if re.fullmatch(r'\d{8}', value):
+        return int(value), int(value)
+    match = re.fullmatch(r'(\d{8})-(\d{8})', value)
+    if not match:
+        raise ValueError(f'无法解析日期{value}，应为YYYYMMDD或YYYYMMDD-YYYYMMDD')
+    return int(match.group(1)), int(match.group(2))
@@ -0,0 +1,189 @@
+import json
+import os
+from utils.event_store import SEQ_COLUMN
+from utils.shared_snapshot import _SHM_DIR, SnapshotReader
+
+# 板块热度的共享快照，与异动全表的共享快照并列，可用环境变量WATCH_HEAT_SNAPSHOT_PATH修改
+HEAT_SNAPSHOT_PATH = os.environ.get('WATCH_HEAT_SNAPSHOT_PATH', os.path.join(_SHM_DIR, 'cnstockgpt-heat.snap'))
+# 热度的半衰期（分钟）：一条异动的贡献每过这么久减半
+HALF_LIFE = 10.0
+LIMIT_UP_TYPE = '封涨停板'
+LIMIT_UP_WEIGHT = 3.0  # 封涨停板计入热度的权重，其他异动为1
+NO_CONCEPT = ''  # 没有归属板块的异动在热度表中的板块名称
+
+_CONCEPT, _TIME, _NAME, _INFO, _TYPE, _PERIOD, _SORT = '板块名称', '时间', '名称', '相关信息', '类型', '上下午', '时间排序'
+
+
+class _Concept:
+    __slots__ = ('count', 'limit_ups', 'pct_sum', 'morning', 'afternoon', 'first_sort', 'first_time',
+                 'heat', 'heat_at', 'version')
+
+    def __init__(self):
+        self.count = 0
+        self.limit_ups = 0
+        self.pct_sum = 0.0
+        self.morning = 0
+        self.afternoon = 0
+        self.first_sort = None
+        self.first_time = None
+        self.heat = 0.0
+        self.heat_at = 0
+        self.version = 0
+
+    def add(self, contribution, sign):
+        pct, limit_up, period = contribution
+        self.count += sign
+        self.limit_ups += sign * limit_up
+        self.pct_sum += sign * pct
+        if period == '上午':
+            self.morning += sign
+        elif period == '下午':
+            self.afternoon += sign
+
+
+class ConceptHeat:
+    """
+    按板块增量聚合的异动热度
+
+    作为ChangeStore的监听器，每条新增或变化的行只更新所属板块的计数，是O(1)的：
+    当前异动数、封涨停板数、平均涨跌幅（涨跌幅之和/异动数）、上午/下午异动数、最早的异动时间，
+    以及按半衰期指数衰减的热度分。同一(名称, 类型)的行变化时先减去它原来的贡献，
+    因此计数与页面上展示的去重异动一致；热度则是累计的，每次变化都算一次新的触发。
+
+    热度以异动时间（当天分钟数）为时钟，衰减只在读取和更新时按时间差一次算出，
+    与轮询节奏和回放倍速无关；读取时的“当前时间”取已见过的最新异动时间。
+
+    参数：
+        half_life (float): 热度半衰期（分钟）
+        limit_up_weight (float): 封涨停板的热度权重
+    """
+
+    def __init__(self, half_life=HALF_LIFE, limit_up_weight=LIMIT_UP_WEIGHT):
+        self.half_life = half_life
+        self.limit_up_weight = limit_up_weight
+        self.clear()
+
+    def clear(self):
+        """清空聚合结果，进入新交易日时调用"""
+        self.version = 0
+        self.now = 0
+        self._concepts = {}
+        self._rows = {}  # (名称, 类型) -> (板块名称, 贡献)
+
+    def __len__(self):
+        return sum(1 for concept in self._concepts.values() if concept.count)
+
+    def _decay(self, elapsed):
+        return 0.5 ** (elapsed / self.half_life)
+
+    def update(self, rows, version):
+        """
+        合并一批新增或变化的行，签名与ChangeStore.listeners一致
+
+        参数：
+            rows (list): 行字典列表，包含STORED_COLUMNS各列
+            version (int): 这批行之后的数据版本号
+        """
+        for row in rows:
+            key = (row[_NAME], row[_TYPE])
+            name = row[_CONCEPT] if row[_CONCEPT] is not None else NO_CONCEPT
+            limit_up = row[_TYPE] == LIMIT_UP_TYPE
+            contribution = (_parse_pct(row[_INFO]), int(limit_up), row[_PERIOD])
+            old = self._rows.get(key)
+            if old is not None:
+                self._concepts[old[0]].add(old[1], -1)
+            self._rows[key] = (name, contribution)
+            concept = self._concepts.get(name)
+            if concept is None:
+                concept = self._concepts[name] = _Concept()
+            concept.add(contribution, 1)
+            concept.version = row.get(SEQ_COLUMN, version)
+
+            minute = row[_SORT] if row[_SORT] is not None else self.now
+            if concept.first_sort is None or minute < concept.first_sort:
+                concept.first_sort, concept.first_time = minute, row[_TIME]
+            # 热度保存为heat_at时刻的值，新的触发按时间差折算后相加；乱序到达的较早触发同样折算
+            weight = self.limit_up_weight if limit_up else 1.0
+            if minute >= concept.heat_at:
+                concept.heat = concept.heat * self._decay(minute - concept.heat_at) + weight
+                concept.heat_at = minute
+            else:
+                concept.heat += weight * self._decay(concept.heat_at - minute)
+            self.now = max(self.now, minute)
+        self.version = max(self.version, version)
+
+    def rows(self):
+        """
+        当前各板块的聚合结果，按热度从高到低
+
+        返回：
+            list: 行字典，键为板块名称、异动数、涨停数、平均涨跌幅、上午、下午、首次异动、热度、序号
+        """
+        rows = []
+        for name, concept in self._concepts.items():
+            if not concept.count:
+                continue
+            rows.append({
+                '板块名称': name,
+                '异动数': concept.count,
+                '涨停数': concept.limit_ups,
+                '平均涨跌幅': round(concept.pct_sum / concept.count, 2),
+                '上午': concept.morning,
+                '下午': concept.afternoon,
+                '首次异动': concept.first_time,
+                '热度': round(concept.heat * self._decay(self.now - concept.heat_at), 3),
+                '序号': concept.version,
+            })
+        rows.sort(key=lambda row: (-row['热度'], -row['异动数'], row['板块名称']))
+        return rows
+
+    def to_json(self):
+        """聚合结果的JSON数组（bytes）"""
+        return json.dumps(self.rows(), ensure_ascii=False).encode('utf-8')
+
+
+class HeatView:
+    """
+    API进程侧的板块热度视图
+
+    监控进程发布了热度共享快照时直接返回其JSON正文；否则（例如监控进程未启动或已退出）按异动视图的当前数据
+    重新聚合一次，只在版本变化时重建。重新聚合只能看到每个(名称, 类型)最新的一行，热度会比监控进程的低。
+
+    参数：
+        changes_view (ChangesView | SharedChangesView): 没有热度快照时用来聚合的异动视图
+        path (str): 热度共享快照路径
+    """
+
+    def __init__(self, changes_view, path=HEAT_SNAPSHOT_PATH):
+        self.reader = SnapshotReader(path)
+        self.changes_view = changes_view
+        self.version = 0
+        self._body = None
+
+    def exists(self):
+        return (self.reader.read() is not None and self.reader.alive()) or self.changes_view.exists()
+
+    def refresh(self):
+        """同步最新的热度，返回数据版本号"""
+        snapshot = self.reader.read()
+        if snapshot is not None and self.reader.alive():
+            self.version, _, self._body = snapshot
+            return self.version
+        version = self.changes_view.refresh()
+        if self._body is None or version != self.version:
+            heat = ConceptHeat()
+            heat.update(sorted(self.changes_view.records(), key=lambda row: row[SEQ_COLUMN]), version)
+            self.version, self._body = version, heat.to_json()
+        return self.version
+
+    def body(self):
+        """热度表的JSON正文（bytes）"""
+        return self._body
+
+
+def _parse_pct(info):
+    """相关信息形如'+9.36%'，取出百分数；无法解析时记为0"""
+    try:
+        return float(str(info).rstrip('%'))
+    except ValueError:
+        return 0.0
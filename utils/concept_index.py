@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+
+class ConceptIndex:
+    """
+    预计算的股票 -> 概念板块索引
+
+    概念成分表只在构建时展开一次，成分关系保存为整数数组。
+    每只股票归属的板块取其所属板块中涨幅排名最靠前的一个；都不在涨幅榜上时取成分表中的第一个。
+    涨幅榜变化时只对每只股票的所属板块重新排序，查询是O(1)的字典加数组下标。
+
+    参数：
+        concept_df (DataFrame): 包含['板块代码','板块名称','股票代码']的概念成分表
+    """
+
+    def __init__(self, concept_df):
+        df = concept_df[concept_df['板块代码'] != '板块代码']  # 去掉混入数据中的表头行
+        board_codes = df['板块代码'].astype(str).to_numpy()
+        stock_codes = normalize_codes(df['股票代码'])
+
+        self.board_codes, board_first, self._board_idx = np.unique(board_codes, return_index=True, return_inverse=True)
+        self.board_names = df['板块名称'].astype(str).to_numpy()[board_first]
+        self._board_pos = {code: i for i, code in enumerate(self.board_codes)}
+        self.stock_codes, self._stock_idx = np.unique(stock_codes, return_inverse=True)
+        self._code_to_idx = {code: i for i, code in enumerate(self.stock_codes)}
+        self._code_index = pd.Index(self.stock_codes)
+        self._order = np.arange(len(df))  # 成分表中的原始顺序，作为排名相同时的次序
+        self._ranking = None
+        self._names = None
+        self._lookup_table = None
+        self.rank([])
+
+    def __len__(self):
+        return len(self.stock_codes)
+
+    def rank(self, rising_codes):
+        """
+        按涨幅榜（板块代码列表，排名从前到后）更新每只股票的归属板块
+
+        返回：
+            bool: 排名是否发生变化；未变化时直接沿用上次结果
+        """
+        ranking = tuple(rising_codes)
+        if ranking == self._ranking:
+            return False
+        unranked = len(ranking) + 1
+        board_rank = np.full(len(self.board_codes), unranked, dtype='int64')
+        for position, code in reversed(list(enumerate(ranking))):
+            i = self._board_pos.get(code)
+            if i is not None:
+                board_rank[i] = position
+        membership_rank = board_rank[self._board_idx]
+        # 按股票、板块排名、原始顺序排序后，每只股票的第一条成分关系即为其归属板块
+        order = np.lexsort((self._order, membership_rank, self._stock_idx))
+        _, first = np.unique(self._stock_idx[order], return_index=True)
+        self._names = self.board_names[self._board_idx[order[first]]]
+        self._lookup_table = np.append(self._names.astype(object), None)
+        self._ranking = ranking
+        return True
+
+    def lookup(self, stock_code):
+        """返回股票的归属板块名称，不在成分表中时返回None"""
+        i = self._code_to_idx.get(str(stock_code).zfill(6))
+        return None if i is None else self._names[i]
+
+    def lookup_many(self, stock_codes):
+        """批量查询归属板块名称，返回object数组，不在成分表中的为None"""
+        codes = np.asarray(stock_codes, dtype=object)
+        idx = self._code_index.get_indexer(codes)
+        missing = idx < 0
+        if missing.any():
+            # 只对没查到的代码补齐前导0再查一次
+            idx[missing] = self._code_index.get_indexer(normalize_codes(codes[missing]))
+        # 仍找不到的下标为-1，正好取到末尾的None
+        return self._lookup_table[idx]
+
+
+def normalize_codes(codes):
+    """把股票代码统一为6位字符串（CSV读入时可能丢失前导0）"""
+    return pd.Series(codes).astype(str).str.zfill(6).to_numpy()
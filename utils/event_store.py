@@ -0,0 +1,353 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime, time as dtime, timedelta
+import pandas as pd
+from utils.scheduler import TradingCalendar
+from utils.table_store import latest_path, read_table, write_table
+
+# 异动表的列，与fluctuation.getChanges输出的html_df一致；日期为交易日（YYYYMMDD整数）
+COLUMNS = ['板块名称', '时间', '名称', '相关信息', '类型', '四舍五入取整', '上下午', '时间排序', '股票代码', '日期']
+# 同一只股票同一类型的异动在一个交易日内只保留最新一条，不同交易日互不覆盖
+KEY_COLUMNS = ('日期', '名称', '类型')
+# 持久化时额外保存的单调递增序号：每新增或变化一行分配一个新序号，用作版本号和增量查询的游标
+SEQ_COLUMN = '序号'
+STORED_COLUMNS = COLUMNS + [SEQ_COLUMN]
+DTYPES = {'股票代码': str}
+
+
+class ChangeStore:
+    """
+    盘口异动的内存去重状态，按(日期, 名称, 类型)为键
+
+    每次轮询只处理新增或变化的行：变化行追加写入日志文件，
+    定期（或日志过长时）把内存状态压缩为快照文件并清空日志，避免每2秒重写整个CSV。
+    快照加日志即为完整状态，进程重启后先读快照再重放日志。
+    快照有pyarrow时保存为Feather（字典编码的列式二进制），否则为CSV，见utils.table_store。
+    传入history时只保存当前交易日，进入新交易日后roll把之前的行归档到按日分区的历史中。
+
+    参数：
+        snapshot_path (str): 快照文件路径（不含扩展名）
+        log_path (str): 追加日志路径
+        compact_interval (float): 两次压缩之间的最短秒数
+        compact_rows (int): 日志行数达到该值时立即压缩
+        clock (callable): 单调时钟，便于测试时注入
+        history (ChangeHistory, optional): 归档历史交易日的分区存储，见utils.change_history
+
+    属性：
+        listeners (list): 回调列表，每次有新增或变化的行时以listener(rows, version)调用，rows为行字典列表
+    """
+
+    def __init__(self, snapshot_path='static/changes', log_path='static/changes.log',
+                 compact_interval=30, compact_rows=500, clock=time.monotonic, history=None):
+        self.listeners = []
+        self.history = history
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compact_interval = compact_interval
+        self.compact_rows = compact_rows
+        self._clock = clock
+        self._rows = {}
+        self._fragments = {}
+        self._log_rows = 0
+        self._last_compact = clock()
+        self._first_day = None
+        self.version = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def load(self):
+        """从快照和日志恢复内存状态"""
+        self._rows = {}
+        self._fragments = {}
+        df = read_changes(self.snapshot_path, self.log_path)
+        for row in df[STORED_COLUMNS].itertuples(index=False, name=None):
+            row = _clean(row)
+            self._rows[_key(row)] = row
+        self._first_day = min((row[_DAY_IDX] for row in self._rows.values()), default=None)
+        self.version = int(df[SEQ_COLUMN].max()) if len(df) else 0
+        self._log_rows = _count_lines(self.log_path)
+        return self
+
+    def _apply(self, df):
+        changed = []
+        for row in df[COLUMNS].itertuples(index=False, name=None):
+            row = _clean(row)
+            key = _key(row)
+            old = self._rows.get(key)
+            if old is not None and old[:-1] == row:
+                continue
+            self.version += 1
+            row = row + (self.version,)
+            # 先删除再插入，保持“保留最新一条”的顺序语义
+            self._rows.pop(key, None)
+            self._rows[key] = row
+            self._fragments.pop(key, None)
+            changed.append(row)
+            day = row[_DAY_IDX]
+            if day is not None and (self._first_day is None or day < self._first_day):
+                self._first_day = day
+        return changed
+
+    def upsert(self, df):
+        """
+        合并一批异动，返回新增或变化的行
+
+        参数：
+            df (DataFrame): 包含COLUMNS各列的异动数据
+
+        返回：
+            DataFrame: 新增或内容发生变化的行
+        """
+        changed = self._apply(df)
+        if changed:
+            os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+            with open(self.log_path, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(changed)
+            self._log_rows += len(changed)
+            records = [dict(zip(STORED_COLUMNS, row)) for row in changed]
+            for listener in self.listeners:
+                listener(records, self.version)
+        self.maybe_compact()
+        return pd.DataFrame(changed, columns=STORED_COLUMNS)
+
+    def roll(self, day):
+        """
+        进入交易日day时，把更早交易日的行归档到history并从当前状态中移除
+
+        先写归档再压缩快照，中途崩溃时重启后会重新归档，归档按键去重，结果不变。
+        没有history时不做任何事，各交易日的行都留在当前状态中。
+
+        参数：
+            day (int): 当前交易日，YYYYMMDD
+
+        返回：
+            bool: 是否归档了行；归档后调用方应通知订阅者重新同步
+        """
+        if self.history is None or self._first_day is None or self._first_day >= day:
+            return False
+        expired = [row for row in self._rows.values() if row[_DAY_IDX] is not None and row[_DAY_IDX] < day]
+        self.history.append(pd.DataFrame(expired, columns=STORED_COLUMNS))
+        self._rows = {key: row for key, row in self._rows.items() if row[_DAY_IDX] is None or row[_DAY_IDX] >= day}
+        self._fragments = {key: self._fragments[key] for key in self._rows if key in self._fragments}
+        self._first_day = min((row[_DAY_IDX] for row in self._rows.values() if row[_DAY_IDX] is not None),
+                              default=None)
+        self.compact()
+        return True
+
+    def maybe_compact(self):
+        """距上次压缩超过compact_interval秒或日志过长时执行压缩"""
+        if self._log_rows and (self._log_rows >= self.compact_rows
+                               or self._clock() - self._last_compact >= self.compact_interval):
+            self.compact()
+
+    def flush(self):
+        """日志中有未压缩的行时立即压缩，用于长时间休眠前"""
+        if self._log_rows:
+            self.compact()
+
+    def compact(self):
+        """把内存状态原子写入快照文件并清空日志"""
+        write_table(self.to_frame(), self.snapshot_path)
+        # 快照落盘后再清空日志；若中途崩溃，重放日志是幂等的
+        open(self.log_path, 'w').close()
+        self._log_rows = 0
+        self._last_compact = self._clock()
+
+    def to_frame(self):
+        """返回当前完整状态"""
+        return pd.DataFrame(list(self._rows.values()), columns=STORED_COLUMNS)
+
+    def records(self):
+        """返回行字典列表，格式与listeners收到的rows一致"""
+        return [dict(zip(STORED_COLUMNS, row)) for row in self._rows.values()]
+
+    def to_json(self):
+        """
+        当前完整状态的JSON数组（bytes），格式与ChangesView.body一致
+
+        每行的JSON片段按键缓存，只序列化新增或变化的行，其余行直接拼接已有片段，
+        因此每次发布的开销是新增行数的序列化加一次字节拼接，而不是重新序列化整张表。
+        """
+        fragments = self._fragments
+        parts = []
+        for key, row in self._rows.items():
+            fragment = fragments.get(key)
+            if fragment is None:
+                fragment = fragments[key] = _row_json(row)
+            parts.append(fragment)
+        return b'[' + b', '.join(parts) + b']'
+
+
+def read_changes(snapshot_path='static/changes', log_path='static/changes.log'):
+    """
+    读取快照并重放追加日志，返回去重后的完整异动表
+
+    返回：
+        DataFrame: 按(日期, 名称, 类型)去重、保留最新一条的异动数据，包含STORED_COLUMNS各列
+    """
+    frames = []
+    snapshot = read_table(snapshot_path, dtype=DTYPES)
+    if snapshot is not None:
+        frames.append(_fill_seq(_upgrade(snapshot)))
+    if os.path.exists(log_path) and os.path.getsize(log_path) > 0:
+        frames.append(_read_log(log_path))
+    if not frames:
+        return pd.DataFrame(columns=STORED_COLUMNS)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if len(frames) > 1:
+        df = df.drop_duplicates(subset=list(KEY_COLUMNS), keep='last').reset_index(drop=True)
+    return df
+
+
+class ChangesView:
+    """
+    API进程侧的只读增量视图
+
+    每次refresh只stat快照和日志：快照被替换（压缩）时全量重读，否则只解析日志新追加的完整行。
+    预先序列化好的JSON正文只在版本变化时重建，供多个轮询请求共享。
+    """
+
+    def __init__(self, snapshot_path='static/changes', log_path='static/changes.log'):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self._rows = {}
+        self._snapshot_sig = None
+        self._log_offset = 0
+        self.version = 0
+        self._body = None
+        self._body_version = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def exists(self):
+        return latest_path(self.snapshot_path) is not None or os.path.exists(self.log_path)
+
+    def refresh(self):
+        """同步文件变化，返回当前版本号"""
+        snapshot_sig = _file_sig(latest_path(self.snapshot_path))
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if snapshot_sig != self._snapshot_sig or log_size < self._log_offset:
+            self._reload(snapshot_sig)
+        elif log_size > self._log_offset:
+            self._read_log_tail()
+        return self.version
+
+    def _reload(self, snapshot_sig):
+        self._rows = {}
+        self._snapshot_sig = snapshot_sig
+        self._log_offset = 0
+        snapshot = read_table(self.snapshot_path, dtype=DTYPES)
+        if snapshot is not None:
+            df = _fill_seq(_upgrade(snapshot))
+            for row in df[STORED_COLUMNS].itertuples(index=False, name=None):
+                row = _clean(row)
+                self._rows[_key(row)] = row
+        self.version = max((row[-1] for row in self._rows.values()), default=0)
+        self._read_log_tail()
+
+    def _read_log_tail(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        # 只消费到最后一个换行符，写了一半的行留到下次
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return
+        self._log_offset += end
+        df = _read_log(io.BytesIO(data[:end]))
+        for row in df[STORED_COLUMNS].itertuples(index=False, name=None):
+            row = _clean(row)
+            key = _key(row)
+            self._rows.pop(key, None)
+            self._rows[key] = row
+            self.version = max(self.version, row[-1])
+
+    def records(self, since=None):
+        """返回行字典列表；指定since时只返回序号大于since的行"""
+        rows = self._rows.values()
+        if since is not None:
+            rows = [row for row in rows if row[-1] > since]
+        return [dict(zip(STORED_COLUMNS, row)) for row in rows]
+
+    def to_frame(self):
+        return pd.DataFrame(list(self._rows.values()), columns=STORED_COLUMNS)
+
+    def body(self):
+        """当前全量数据的JSON正文（bytes），只在版本变化时重新序列化"""
+        if self._body is None or self._body_version != (self._snapshot_sig, self.version):
+            self._body = rows_to_json(self._rows.values())
+            self._body_version = (self._snapshot_sig, self.version)
+        return self._body
+
+
+def rows_to_json(rows):
+    """把STORED_COLUMNS顺序的行元组序列化为JSON数组（bytes）"""
+    return json.dumps([dict(zip(STORED_COLUMNS, row)) for row in rows], ensure_ascii=False).encode('utf-8')
+
+
+def _row_json(row):
+    return json.dumps(dict(zip(STORED_COLUMNS, row)), ensure_ascii=False).encode('utf-8')
+
+
+def _clean(row):
+    """NaN转为None，numpy标量转为Python标量，便于比较和JSON序列化"""
+    return tuple(None if pd.isna(v) else (v.item() if hasattr(v, 'item') else v) for v in row)
+
+
+_KEY_IDX = tuple(COLUMNS.index(c) for c in KEY_COLUMNS)
+_DAY_IDX = COLUMNS.index('日期')
+
+def _key(row):
+    return tuple(row[i] for i in _KEY_IDX)
+
+
+def _read_log(source):
+    """解析追加日志，每行为STORED_COLUMNS各列"""
+    return pd.read_csv(source, header=None, names=STORED_COLUMNS, dtype=DTYPES)
+
+
+def _upgrade(df):
+    """
+    补齐原先的changes.csv缺少的股票代码和日期列
+
+    原先的监控进程在交易时段每次轮询都重写整个文件，文件里是它运行的最后一个交易日的异动。
+    行里的时间只有时分，文件修改时间在午夜后写入或复制后都不可靠，因此日期取升级当天之前的最近一个交易日：
+    盘中升级时这些行不会被当作今天的异动、与今天的新异动撞键，监控进程启动时roll把它们归档到历史分区。
+    """
+    if '股票代码' not in df.columns:
+        df = df.assign(股票代码=None)
+    if '日期' not in df.columns:
+        yesterday = datetime.combine(datetime.now().date() - timedelta(days=1), dtime.max)
+        day = TradingCalendar.load().last_session_day(yesterday)
+        df = df.assign(日期=int(day.strftime('%Y%m%d')))
+    return df
+
+
+def _fill_seq(df):
+    """原先的changes.csv没有序号列，按行顺序补齐；日志的每一行都带序号"""
+    if SEQ_COLUMN not in df.columns:
+        df = df.assign(**{SEQ_COLUMN: range(1, len(df) + 1)})
+    if len(df):
+        df[SEQ_COLUMN] = df[SEQ_COLUMN].astype('int64')
+    return df
+
+
+def _file_sig(path):
+    if path is None or not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return (path, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
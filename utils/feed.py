@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 监控进程发布异动事件的本地地址，可用环境变量WATCH_FEED_PORT修改端口
+FEED_HOST = '127.0.0.1'
+FEED_PORT = int(os.environ.get('WATCH_FEED_PORT', 8765))
+# 单条消息（一行JSON）的长度上限；asyncio默认只有64KB，一批几百条异动就会超出
+FEED_LINE_LIMIT = 16 * 1024 * 1024
+
+
+class EventPublisher:
+    """
+    监控进程侧的事件发布端：在本地TCP端口上接受订阅，把每条消息以一行JSON广播给所有订阅者
+
+    发布不依赖订阅者：没有订阅者时消息直接丢弃；订阅者写入超时或断开时被移除，
+    重连后由订阅方通过since增量接口补齐缺失的数据。
+
+    参数：
+        host (str): 监听地址
+        port (int): 监听端口
+        send_timeout (float): 单个订阅者的写超时秒数
+        min_backoff (float): 端口被占用时首次重试绑定前等待的秒数
+        max_backoff (float): 重试绑定的等待上限秒数
+        line_limit (int): 单条消息的字节数上限，超出时改为发送resync，由订阅方通过since增量接口拉取
+    """
+
+    def __init__(self, host=FEED_HOST, port=FEED_PORT, send_timeout=1.0, min_backoff=0.5, max_backoff=30.0,
+                 line_limit=FEED_LINE_LIMIT):
+        self.host = host
+        self.port = port
+        self.send_timeout = send_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.line_limit = line_limit
+        self._server = None
+        self._clients = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def start(self):
+        """
+        开始监听；端口被占用（例如正在退出的旧监控进程还没释放）时在后台按指数退避重试绑定，
+        绑定成功前发布的消息直接丢弃，订阅方连接后会先重新同步
+        """
+        if not self._bind():
+            threading.Thread(target=self._retry_bind, name='feed-bind', daemon=True).start()
+        return self
+
+    def _bind(self, warn=True):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server.bind((self.host, self.port))
+        except OSError as e:
+            server.close()
+            if warn:
+                logger.warning(f'事件推送端口{self.port}不可用，稍后重试: {e}')
+            return False
+        server.listen()
+        self._server = server
+        self.port = server.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name='feed-accept', daemon=True).start()
+        logger.info(f'事件推送监听于{self.host}:{self.port}')
+        return True
+
+    def _retry_bind(self):
+        backoff = self.min_backoff
+        while not self._closed.wait(backoff):
+            if self._bind(warn=False):
+                return
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _accept_loop(self):
+        while self._server is not None:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            client.settimeout(self.send_timeout)
+            with self._lock:
+                self._clients.append(client)
+
+    @property
+    def subscribers(self):
+        with self._lock:
+            return len(self._clients)
+
+    def publish(self, message):
+        """向所有订阅者广播一条消息（可JSON序列化的dict）"""
+        with self._lock:
+            clients = list(self._clients)
+        if not clients:
+            return
+        line = (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+        if len(line) > self.line_limit:
+            logger.warning(f'推送消息{len(line)}字节超过上限，改为通知订阅方重新同步')
+            line = (json.dumps({'type': 'resync', 'version': message.get('version')}) + '\n').encode('utf-8')
+        dead = []
+        for client in clients:
+            try:
+                client.sendall(line)
+            except OSError:
+                dead.append(client)
+        if dead:
+            with self._lock:
+                for client in dead:
+                    if client in self._clients:
+                        self._clients.remove(client)
+                    client.close()
+
+    def close(self):
+        self._closed.set()
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+
+
+class Broadcaster:
+    """
+    API进程内的扇出：每个SSE连接一个有界队列
+
+    某个连接消费过慢导致队列满时，清空它的队列并只放入一条resync消息，
+    让页面重新拉取全量，而不是无限堆积或阻塞其他连接。
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._queues = set()
+
+    def __len__(self):
+        return len(self._queues)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.maxsize)
+        self._queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._queues.discard(queue)
+
+    def publish(self, message):
+        for queue in self._queues:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({'type': 'resync'})
+
+
+async def subscribe_feed(on_message, host=FEED_HOST, port=FEED_PORT, retry_interval=1.0, limit=FEED_LINE_LIMIT):
+    """
+    连接监控进程的事件发布端，逐行读取消息并回调on_message；断开后按retry_interval重连
+
+    在API进程的事件循环中作为后台任务运行，取消任务即退出。
+    单条消息超过limit字节时按断开处理：重连后先发出resync，由页面重新拉取。
+    """
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port, limit=limit)
+        except OSError:
+            await asyncio.sleep(retry_interval)
+            continue
+        logger.info(f'已连接事件推送{host}:{port}')
+        on_message({'type': 'resync'})  # 连接建立前可能漏掉了事件
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    on_message(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning('丢弃无法解析的推送消息')
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        except (asyncio.LimitOverrunError, ValueError):
+            # readline在行超过limit时抛出ValueError，缓冲区已不完整，只能断开重连
+            logger.warning(f'推送消息超过{limit}字节，断开重连并重新同步')
+        finally:
+            writer.close()
+        logger.info('事件推送连接断开，稍后重连')
+        await asyncio.sleep(retry_interval)
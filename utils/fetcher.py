@@ -0,0 +1,170 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限流器
+
+    参数：
+        rate (float): 每秒补充的令牌数，即稳态请求速率；<=0 表示不限流
+        capacity (float): 桶容量，允许的瞬时突发请求数，默认等于rate
+        clock (callable): 返回单调时间（秒）的函数，便于测试时注入
+        sleep (callable): 休眠函数，便于测试时注入
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """阻塞直到取得指定数量的令牌"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+    def on_success(self):
+        """请求成功的回调，固定速率的令牌桶不做调整"""
+
+    def on_failure(self):
+        """请求失败的回调，固定速率的令牌桶不做调整"""
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    自适应速率的令牌桶：成功时线性提速，失败时成倍降速（AIMD）
+
+    参数：
+        rate (float): 初始速率
+        min_rate (float): 速率下限
+        max_rate (float): 速率上限
+        increase (float): 每次成功增加的速率
+        decrease (float): 每次失败速率乘以的系数
+    """
+
+    def __init__(self, rate, min_rate=0.2, max_rate=None, increase=0.1, decrease=0.5, **kwargs):
+        super().__init__(rate, **kwargs)
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate * 2
+        self.increase = increase
+        self.decrease = decrease
+
+    def on_success(self):
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_failure(self):
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0, jitter=0.1):
+    """
+    计算第attempt次重试（从0开始）前的指数退避等待时间
+
+    返回：
+        float: base * 2**attempt，封顶cap，并叠加少量随机抖动避免重试同步
+    """
+    delay = min(cap, base * (2 ** attempt))
+    return delay + random.uniform(0, delay * jitter)
+
+
+def fetch_with_retry(fetch_func, key, max_retries=3, limiter=None, base_delay=0.5,
+                     max_delay=8.0, sleep=time.sleep, accept_empty=False):
+    """
+    以限流和指数退避重试的方式执行单个抓取任务
+
+    参数：
+        fetch_func (callable): fetch_func(key) -> 结果；返回None视为失败，空DataFrame默认也视为失败
+        key: 抓取键，例如股票代码
+        max_retries (int): 最大尝试次数
+        limiter (TokenBucket): 限流器，每次尝试前取一个令牌
+        base_delay (float): 首次重试前等待的秒数
+        max_delay (float): 单次等待上限
+        sleep (callable): 休眠函数，便于测试时注入
+        accept_empty (bool): 空DataFrame是否为有效结果（例如没有新闻的股票），为True时不重试
+
+    返回：
+        抓取结果；全部尝试失败时返回None
+    """
+    for attempt in range(max_retries):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = fetch_func(key)
+            if result is not None and (accept_empty or not getattr(result, 'empty', False)):
+                if limiter is not None:
+                    limiter.on_success()
+                return result
+            logger.warning(f'获取{key}的数据为空，尝试重试 {attempt + 1}/{max_retries}')
+        except Exception as e:
+            logger.warning(f'获取{key}的数据失败: {str(e)}，尝试重试 {attempt + 1}/{max_retries}')
+            if limiter is not None:
+                limiter.on_failure()
+        if attempt + 1 < max_retries:
+            sleep(backoff_delay(attempt, base=base_delay, cap=max_delay))
+    logger.error(f'获取{key}的数据失败，已达到最大重试次数')
+    return None
+
+
+def fetch_concurrently(keys, fetch_func, max_workers=8, rate_limit=5.0, max_retries=3,
+                       base_delay=0.5, max_delay=8.0, limiter=None, sleep=time.sleep, accept_empty=False):
+    """
+    使用有界线程池并发抓取多个键的数据
+
+    所有线程共享同一个令牌桶，因此并发上限(max_workers)和请求速率(rate_limit)相互独立：
+    前者限制同时在途的请求数，后者限制每秒发出的请求数。
+
+    参数：
+        keys (list): 抓取键列表
+        fetch_func (callable): fetch_func(key) -> 结果
+        max_workers (int): 最大并发数
+        rate_limit (float): 每秒最多请求数，<=0表示不限流
+        max_retries (int): 每个键的最大尝试次数
+        base_delay (float): 指数退避的初始等待秒数
+        max_delay (float): 指数退避的等待上限
+        limiter (TokenBucket, optional): 外部传入的共享限流器，传入时忽略rate_limit
+        sleep (callable): 重试等待使用的休眠函数
+        accept_empty (bool): 空DataFrame是否为有效结果，见fetch_with_retry
+
+    返回：
+        dict: 以键为键、抓取结果为值的字典，顺序与keys一致；失败的键值为None
+    """
+    keys = list(keys)
+    if limiter is None:
+        limiter = TokenBucket(rate_limit, capacity=max(1, min(rate_limit, max_workers)))
+
+    def task(key):
+        return fetch_with_retry(fetch_func, key, max_retries=max_retries, limiter=limiter,
+                                base_delay=base_delay, max_delay=max_delay, sleep=sleep,
+                                accept_empty=accept_empty)
+
+    if not keys:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(keys)))) as executor:
+        results = list(executor.map(task, keys))
+    return dict(zip(keys, results))
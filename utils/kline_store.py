@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'kline')
+
+
+class KlineStore:
+    """
+    本地增量日K存储，每只股票一个列式NumPy文件(.npz)
+
+    文件中日期保存为YYYYMMDD整数数组，数值列按列保存为float64数组，并记录已覆盖的起始日期。
+    读取时先用本地数据，只向接口请求缺失的日期区间并追加；请求从本地倒数第二根（已收盘的）K线开始，
+    若这根重叠K线的前复权价格发生变化（除权除息改写了历史），则整只股票重新全量获取。
+
+    参数：
+        root (str): 存储目录，默认项目下的cache/kline
+        tolerance (float): 判断复权价格变化的相对误差阈值
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, tolerance=1e-4):
+        self.root = root
+        self.tolerance = tolerance
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, stock_code):
+        return os.path.join(self.root, f'{stock_code}.npz')
+
+    def _lock(self, stock_code):
+        with self._locks_guard:
+            return self._locks.setdefault(stock_code, threading.Lock())
+
+    def load(self, stock_code):
+        """
+        读取本地保存的日K数据
+
+        返回：
+            DataFrame: 日K数据，本地没有数据时为空DataFrame
+        """
+        path = self._path(stock_code)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        try:
+            with np.load(path, allow_pickle=False) as f:
+                dates = f['dates']
+                columns = [str(c) for c in f['columns']]
+                values = f['values']
+                covered_from = int(f['covered_from'])
+        except Exception as e:
+            logger.warning(f'读取{stock_code}的本地K线失败，将重新获取: {str(e)}')
+            return pd.DataFrame()
+        df = pd.DataFrame(values, columns=columns)
+        df.insert(0, '日期', pd.to_datetime(dates.astype(str), format='%Y%m%d').date)
+        df['代码'] = stock_code
+        df.attrs['covered_from'] = covered_from
+        return df
+
+    def save(self, stock_code, df, covered_from):
+        """
+        以原子替换的方式保存日K数据，只保存数值列
+
+        参数：
+            stock_code (str): 股票代码
+            df (DataFrame): 日K数据
+            covered_from (str|int): 本地数据已覆盖的起始日期（请求的开始日期，可早于第一根K线）
+        """
+        df = df.drop_duplicates(subset=['日期'], keep='last').sort_values('日期')
+        columns = [c for c in df.columns if c not in ('日期', '代码') and pd.api.types.is_numeric_dtype(df[c])]
+        dates = _to_int_dates(df['日期'])
+        path = self._path(stock_code)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, dates=dates, columns=np.array(columns), values=df[columns].to_numpy(dtype='float64'),
+                     covered_from=np.int64(covered_from))
+        os.replace(tmp_path, path)
+
+    def get(self, stock_code, start_date, end_date, fetch_func):
+        """
+        获取[start_date, end_date]区间的日K数据，优先使用本地数据
+
+        参数：
+            stock_code (str): 股票代码
+            start_date (str): 开始日期，格式YYYYMMDD
+            end_date (str): 结束日期，格式YYYYMMDD
+            fetch_func (callable): fetch_func(stock_code, start_date, end_date) -> DataFrame
+
+        返回：
+            DataFrame: 区间内的日K数据
+        """
+        with self._lock(stock_code):
+            cached = self.load(stock_code)
+            start_int = int(start_date)
+            if cached.empty or cached.attrs['covered_from'] > start_int:
+                merged = self._refetch(stock_code, start_date, end_date, fetch_func)
+            else:
+                merged = self._update(stock_code, cached, start_date, end_date, fetch_func)
+            if merged.empty:
+                return merged
+            return merged[_to_int_dates(merged['日期']) >= start_int].reset_index(drop=True)
+
+    def _refetch(self, stock_code, start_date, end_date, fetch_func):
+        fresh = fetch_func(stock_code, start_date, end_date)
+        if fresh is not None and not fresh.empty:
+            self.save(stock_code, fresh, start_date)
+        return fresh
+
+    def _update(self, stock_code, cached, start_date, end_date, fetch_func):
+        cached_dates = _to_int_dates(cached['日期'])
+        # 从倒数第二根K线开始请求：最后一根可能是盘中未完成的K线，倒数第二根一定已收盘，用作复权校验锚点
+        anchor = int(cached_dates[-2]) if len(cached_dates) >= 2 else int(cached_dates[-1])
+        delta = fetch_func(stock_code, str(anchor), end_date)
+        if delta is None or delta.empty:
+            return cached
+
+        delta_dates = _to_int_dates(delta['日期'])
+        anchor_rows = delta[delta_dates == anchor]
+        if anchor_rows.empty or not self._same_bar(cached[cached_dates == anchor].iloc[-1], anchor_rows.iloc[-1]):
+            logger.info(f'{stock_code}的前复权价格发生变化，重新获取全部历史数据')
+            earliest = min(int(start_date), cached.attrs['covered_from'])
+            return self._refetch(stock_code, str(earliest), end_date, fetch_func)
+
+        merged = pd.concat([cached[cached_dates < anchor], delta], ignore_index=True)
+        self.save(stock_code, merged, cached.attrs['covered_from'])
+        logger.debug(f'{stock_code}本地K线增量更新{int((delta_dates > cached_dates[-1]).sum())}条')
+        return merged
+
+    def _same_bar(self, old, new):
+        for column in ('收盘', '最低', '最高', '开盘'):
+            if column not in old.index or column not in new.index:
+                continue
+            a, b = float(old[column]), float(new[column])
+            if abs(a - b) > self.tolerance * max(abs(a), abs(b), 1e-12):
+                return False
+        return True
+
+
+def _to_int_dates(dates):
+    """将日期序列统一转换为YYYYMMDD整数数组"""
+    return pd.to_datetime(pd.Series(dates).astype(str)).dt.strftime('%Y%m%d').astype('int64').to_numpy()
@@ -0,0 +1,302 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    from pyinstrument import Profiler
+    HAS_PYINSTRUMENT = True
+except ImportError:  # pyinstrument是可选依赖，没有时使用cProfile
+    Profiler = None
+    HAS_PYINSTRUMENT = False
+
+logger = logging.getLogger(__name__)
+
+# 非API进程（监控进程、盘中因子服务、批量多因子计算）把指标快照写到这里，由API的/metrics一并输出
+METRICS_DIR = os.environ.get(
+    'METRICS_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'metrics'))
+PROFILE_DIR = os.path.join(os.path.dirname(METRICS_DIR), 'profiles')
+# 耗时直方图的默认分桶（秒），覆盖单次解析的毫秒级到一次全量抓取的数十秒
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metric:
+    """
+    一组同名指标，按标签值区分序列
+
+    参数：
+        name (str): 指标名，遵循Prometheus命名，例如watch_stage_seconds
+        help (str): 说明
+        labelnames (tuple): 标签名
+    """
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}的标签应为{self.labelnames}，实际为{tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(标签值, 值)]，值为数值，直方图为{'buckets': [...], 'sum': ..., 'count': ...}"""
+        with self._lock:
+            return [(list(key), value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    """只增不减的计数"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """可任意设置的当前值"""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """
+    耗时分布：按分桶计数，另记总和与次数，输出为Prometheus直方图
+
+    参数：
+        buckets (tuple): 递增的分桶上界，+Inf自动追加
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            # 只计入所在的分桶，输出时再累加为Prometheus要求的累计计数
+            series['buckets'][bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文：无论是否抛出异常都记录耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [(list(key), {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']})
+                    for key, value in self._values.items()]
+
+
+class Registry:
+    """进程内的指标注册表；同名指标重复声明时返回已有的实例"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f'指标{name}已以不同的类型或标签声明')
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        """可JSON序列化的全部指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            'timestamp': time.time(),
+            'metrics': [{'name': m.name, 'type': m.type, 'help': m.help, 'labelnames': list(m.labelnames),
+                         'buckets': list(getattr(m, 'buckets', ())), 'samples': m.samples()} for m in metrics],
+        }
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshots):
+    """
+    把若干指标快照渲染为Prometheus文本格式
+
+    参数：
+        snapshots (list): [(job, snapshot)]，job非空时给每条序列加上job标签
+
+    返回：
+        str: text/plain; version=0.0.4格式的文本
+    """
+    families = {}
+    for job, snapshot in snapshots:
+        extra = [('job', job)] if job else []
+        for metric in snapshot['metrics']:
+            family = families.setdefault(metric['name'], {'metric': metric, 'series': []})
+            for label_values, value in metric['samples']:
+                family['series'].append((extra + list(zip(metric['labelnames'], label_values)), value, metric))
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family['metric']['help']}")
+        lines.append(f"# TYPE {name} {family['metric']['type']}")
+        for labels, value, metric in family['series']:
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric['buckets']) + [float('inf')], value['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+    jobs = [(job, snapshot) for job, snapshot in snapshots if job]
+    if jobs:
+        lines.append('# HELP metrics_report_timestamp_seconds 各进程最近一次写入指标的时间')
+        lines.append('# TYPE metrics_report_timestamp_seconds gauge')
+        for job, snapshot in jobs:
+            lines.append(f"metrics_report_timestamp_seconds{_labels([('job', job)])} {_number(snapshot['timestamp'])}")
+    return '\n'.join(lines) + '\n'
+
+
+def report(job, registry=REGISTRY, directory=METRICS_DIR):
+    """
+    把本进程的指标快照写到directory/<job>.json，供API进程的/metrics读取
+
+    以原子替换写入，读取方不会读到写了一半的文件；写入失败只记录警告。
+    """
+    path = os.path.join(directory, f'{job}.json')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(registry.snapshot(), f, ensure_ascii=False)
+        os.replace(f'{path}.tmp', path)
+    except OSError as e:
+        logger.warning(f'写入{job}的指标失败: {e}')
+
+
+def load_reports(directory=METRICS_DIR):
+    """
+    读取其他进程写入的指标快照
+
+    返回：
+        list: [(job, snapshot)]，按job排序
+    """
+    if not os.path.isdir(directory):
+        return []
+    reports = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                reports.append((filename[:-5], json.load(f)))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f'读取指标文件{filename}失败: {e}')
+    return reports
+
+
+class ProfileTrigger:
+    """
+    按需剖析一次调用
+
+    request()在PROFILE_DIR下创建<name>.request标记文件（可由其他进程调用）；
+    持有方每次调用run(func)时检查标记，存在则在剖析器下执行这一次并写出报告，随后删除标记。
+    安装了pyinstrument时输出HTML调用树，否则输出cProfile的.prof文件和按累计耗时排序的文本摘要。
+
+    参数：
+        name (str): 剖析对象名称，用于标记和报告文件名
+        directory (str): 报告目录
+    """
+
+    def __init__(self, name, directory=PROFILE_DIR):
+        self.name = name
+        self.directory = directory
+        self.flag = os.path.join(directory, f'{name}.request')
+
+    def request(self):
+        os.makedirs(self.directory, exist_ok=True)
+        open(self.flag, 'w').close()
+        return self.flag
+
+    def run(self, func):
+        if not os.path.exists(self.flag):
+            return func()
+        try:
+            os.remove(self.flag)
+        except OSError:
+            pass
+        stem = os.path.join(self.directory, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        if HAS_PYINSTRUMENT:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                return func()
+            finally:
+                profiler.stop()
+                with open(f'{stem}.html', 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+                logger.info(f'剖析报告已写入{stem}.html')
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func)
+        finally:
+            profiler.dump_stats(f'{stem}.prof')
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(40)
+            with open(f'{stem}.txt', 'w', encoding='utf-8') as f:
+                f.write(text.getvalue())
+            logger.info(f'剖析报告已写入{stem}.prof')
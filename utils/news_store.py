@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'news')
+NEWS_COLUMNS = ['发布时间', '新闻标题', '新闻链接']
+
+
+class NewsStore:
+    """
+    本地新闻标题缓存，每只股票一个JSON文件
+
+    缓存未过期（距上次请求不足ttl秒）时直接使用本地标题，不发请求；过期后重新请求，
+    只把发布时间晚于本地最新一条的标题合并进缓存，按发布时间倒序最多保留max_items条。
+
+    参数：
+        root (str): 存储目录，默认项目下的cache/news
+        ttl (float): 缓存有效期（秒）
+        max_items (int): 每只股票最多保留的标题数
+        clock (callable): 返回Unix时间戳的函数，便于测试时注入
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, ttl=1800, max_items=20, clock=time.time):
+        self.root = root
+        self.ttl = ttl
+        self.max_items = max_items
+        self.clock = clock
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, stock_code):
+        return os.path.join(self.root, f'{stock_code}.json')
+
+    def _lock(self, stock_code):
+        with self._locks_guard:
+            return self._locks.setdefault(stock_code, threading.Lock())
+
+    def load(self, stock_code):
+        """
+        读取本地缓存的新闻
+
+        返回：
+            tuple: (上次请求的时间戳, 新闻DataFrame)；没有缓存时为(None, 空DataFrame)
+        """
+        path = self._path(stock_code)
+        if not os.path.exists(path):
+            return None, pd.DataFrame(columns=NEWS_COLUMNS)
+        try:
+            with open(path, encoding='utf-8') as f:
+                cached = json.load(f)
+        except Exception as e:
+            logger.warning(f'读取{stock_code}的本地新闻失败，将重新获取: {str(e)}')
+            return None, pd.DataFrame(columns=NEWS_COLUMNS)
+        return cached['fetched_at'], pd.DataFrame(cached['items'], columns=NEWS_COLUMNS)
+
+    def save(self, stock_code, news, fetched_at):
+        """以原子替换的方式保存新闻"""
+        path = self._path(stock_code)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': fetched_at, 'items': news[NEWS_COLUMNS].values.tolist()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def fresh(self, stock_code):
+        """缓存未过期时返回本地新闻（可能为空DataFrame，表示该股票没有新闻），否则返回None"""
+        fetched_at, cached = self.load(stock_code)
+        if fetched_at is not None and self.clock() - fetched_at < self.ttl:
+            return cached
+        return None
+
+    def get(self, stock_code, fetch_func):
+        """
+        获取股票的新闻，按发布时间倒序
+
+        参数：
+            stock_code (str): 股票代码
+            fetch_func (callable): fetch_func(stock_code) -> DataFrame，至少包含NEWS_COLUMNS各列
+
+        返回：
+            DataFrame: 新闻数据
+        """
+        with self._lock(stock_code):
+            fetched_at, cached = self.load(stock_code)
+            now = self.clock()
+            if fetched_at is not None and now - fetched_at < self.ttl:
+                return cached
+            fresh = fetch_func(stock_code)
+            if fresh is None:
+                return cached
+            merged = self._merge(cached, fresh[NEWS_COLUMNS].astype(str))
+            self.save(stock_code, merged, now)
+            return merged
+
+    def _merge(self, cached, fresh):
+        # 接口没有按时间增量查询的参数，只能取回最新一页后丢弃不比本地更新的条目
+        if not cached.empty:
+            latest = cached['发布时间'].max()
+            fresh = fresh[(fresh['发布时间'] > latest) & ~fresh['新闻链接'].isin(cached['新闻链接'])]
+            if fresh.empty:
+                return cached
+            logger.debug(f'新增{len(fresh)}条新闻')
+        merged = pd.concat([fresh, cached], ignore_index=True) if not cached.empty else fresh
+        merged = merged.drop_duplicates(subset=['新闻链接'])
+        return merged.sort_values('发布时间', ascending=False, kind='stable').head(self.max_items).reset_index(drop=True)
@@ -0,0 +1,220 @@
+"""
+东方财富异动推送的录制与回放
+
+录制：监控进程以 python fluctuation.py --record <文件> 运行时，每个原始JSONP响应连同时间戳、所属轮询序号
+写入gzip压缩的JSON行日志。回放：python -m utils.replay <文件> --speed 10，把录制的响应通过注入的会话
+按原节奏的1倍、10倍或最快速度喂给getChanges，报告每次轮询的延迟和吞吐，非交易时段也能压测开盘的事件高峰。
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingSession:
+    """
+    包装requests.Session：请求照常发出，响应原文追加写入录制日志
+
+    每行一条记录：{'run': 录制批次, 'tick': 轮询序号, 't': Unix时间戳, 'url': 地址, 'page': 页序号或None,
+    'status': 状态码, 'text': 原文}。
+    gzip按行刷新，进程中断时已写入的轮询可以读出。
+
+    参数：
+        session (requests.Session): 实际发请求的会话
+        path (str): 录制文件路径（.jsonl.gz）
+        clock (callable): 返回Unix时间戳的函数，便于合成录制时注入
+    """
+
+    def __init__(self, session, path, clock=time.time):
+        self.session = session
+        self.path = path
+        self.clock = clock
+        self.tick = 0
+        self.run = int(clock() * 1000)  # 同一文件多次录制时区分各次的轮询序号
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # 追加模式下每次启动是一个新的gzip成员，gzip.open读取时会自动连起来
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+
+    def next_tick(self):
+        """开始新的一次轮询，之后的响应都记在这次轮询下"""
+        with self._lock:
+            self.tick += 1
+            self._file.flush()
+
+    def get(self, url, params=None, **kwargs):
+        response = self.session.get(url, params=params, **kwargs)
+        record = {'run': self.run, 'tick': self.tick, 't': self.clock(), 'url': url,
+                  'page': (params or {}).get('pageindex'), 'status': response.status_code, 'text': response.text}
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return response
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load_recording(path):
+    """
+    读取录制日志，按轮询分组
+
+    返回：
+        list: [(轮询开始时间戳, {(url, page): 原文})]，按录制顺序；同一轮询重复的请求取最后一次
+    """
+    ticks = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 中断时最后一行可能不完整
+            entry = ticks.setdefault((record.get('run', 0), record['tick']), [record['t'], {}])
+            entry[0] = min(entry[0], record['t'])
+            entry[1][(record['url'], record['page'])] = record['text']
+    return sorted((tuple(entry) for entry in ticks.values()), key=lambda entry: entry[0])
+
+
+class ReplaySession:
+    """
+    回放会话：替代requests.Session注入getChanges，按(url, 页序号)返回当前轮询录制的原文
+
+    当前轮询没有录制的请求返回空文本，与接口无数据时一样处理。
+    """
+
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+
+    def get(self, url, params=None, **kwargs):
+        text = self.responses.get((url, (params or {}).get('pageindex')), '')
+        return SimpleNamespace(text=text, status_code=200)
+
+
+def replay(ticks, speed=None, concepts=None, store=None, snapshot_path=None, max_gap=60.0,
+           clock=time.perf_counter, sleep=time.sleep):
+    """
+    把录制的轮询依次喂给getChanges
+
+    参数：
+        ticks (list): load_recording的返回值
+        speed (float, optional): 回放倍速，1为原速；None表示不等待、尽快回放
+        concepts (ConceptIndex, optional): 股票 -> 概念板块索引，默认加载static下的概念成分
+        store (ChangeStore, optional): 异动状态，默认在临时目录新建，不影响static下的数据
+        snapshot_path (str, optional): 传入时与监控进程一样，每次变化都发布共享快照（板块热度写到<snapshot_path>.heat），
+            把序列化开销计入延迟
+        max_gap (float): 两次轮询之间超过max_gap秒的空闲（午休、收盘后）按max_gap秒回放
+        clock (callable): 计时函数
+        sleep (callable): 等待函数
+
+    返回：
+        dict: 轮询数、事件数、总耗时、每秒事件数、延迟分位数（毫秒）和最大落后时间（秒）
+    """
+    import fluctuation
+    from utils.concept_heat import ConceptHeat
+    from utils.concept_index import ConceptIndex
+    from utils.event_store import ChangeStore
+    from utils.shared_snapshot import SnapshotWriter
+
+    concepts = concepts or ConceptIndex(fluctuation.loadConcepts())
+    tmp = None
+    if store is None:
+        tmp = tempfile.mkdtemp()
+        store = ChangeStore(os.path.join(tmp, 'changes'), os.path.join(tmp, 'changes.log'))
+    # 与监控进程一样按板块增量聚合热度
+    heat = ConceptHeat()
+    heat.update(store.records(), store.version)
+    store.listeners.append(heat.update)
+    snapshot = heat_snapshot = None
+    if snapshot_path is not None:
+        snapshot = SnapshotWriter(snapshot_path)
+        heat_snapshot = SnapshotWriter(f'{snapshot_path}.heat')
+
+        def publish(rows, version):
+            snapshot.publish(version, len(store), store.to_json())
+            heat_snapshot.publish(version, len(heat), heat.to_json())
+        store.listeners.append(publish)
+
+    cursor = fluctuation.ChangeCursor()
+    session = ReplaySession()
+    starts = np.array([start for start, _ in ticks], dtype='float64')
+    offsets = np.concatenate([[0.0], np.cumsum(np.minimum(np.diff(starts), max_gap))]) if len(starts) else starts
+    latencies, events, max_lag = [], 0, 0.0
+    started = clock()
+    try:
+        for offset, (_, responses) in zip(offsets, ticks):
+            if speed:
+                # 按录制时的间隔换算出这次轮询应开始的时间，处理慢于录制节奏时不等待，记录落后的时间
+                due = started + offset / speed
+                now = clock()
+                if due > now:
+                    sleep(due - now)
+                else:
+                    max_lag = max(max_lag, now - due)
+            session.responses = responses
+            tick_start = clock()
+            events += fluctuation.getChanges(concepts, store, cursor, session)
+            store.maybe_compact()
+            latencies.append(clock() - tick_start)
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+            heat_snapshot.close()
+            os.remove(heat_snapshot.path)
+        if tmp is not None:
+            shutil.rmtree(tmp)
+    elapsed = clock() - started
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'ticks': len(latencies),
+        'events': events,
+        'rows': len(store),
+        'elapsed': elapsed,
+        'events_per_second': events / elapsed if elapsed > 0 else float('inf'),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'max_ms': float(latencies_ms.max()),
+        'max_lag': max_lag,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='回放录制的异动推送并报告每次轮询的延迟和吞吐')
+    parser.add_argument('path', help='录制文件（python fluctuation.py --record生成）')
+    parser.add_argument('--speed', default='max', help='回放倍速，例如1、10；max表示尽快回放（默认）')
+    parser.add_argument('--snapshot', action='store_true', help='同时发布共享快照，把序列化开销计入延迟')
+    args = parser.parse_args(argv)
+
+    ticks = load_recording(args.path)
+    speed = None if args.speed == 'max' else float(args.speed)
+    snapshot_path = os.path.join(tempfile.gettempdir(), f'replay-{os.getpid()}.snapshot') if args.snapshot else None
+    try:
+        # 监控流程每次轮询都会打印，回放时不输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = replay(ticks, speed=speed, snapshot_path=snapshot_path)
+    finally:
+        if snapshot_path and os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+    print(f"回放{stats['ticks']}次轮询，{stats['events']}条异动，当前{stats['rows']}行，耗时{stats['elapsed']:.2f}秒，"
+          f"{stats['events_per_second']:.0f}条/秒")
+    print(f"每次轮询延迟(ms): p50={stats['p50_ms']:.2f} p95={stats['p95_ms']:.2f} p99={stats['p99_ms']:.2f} "
+          f"max={stats['max_ms']:.2f}")
+    if speed:
+        print(f"最大落后于录制节奏{stats['max_lag']:.3f}秒")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,212 @@
+import logging
+import math
+import os
+import time
+from datetime import datetime, time as dtime, timedelta
+
+import pandas as pd
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+SKIPPED_TICKS = metrics.counter('scheduler_skipped_ticks_total', '任务超时而跳过的触发点数', ('job',))
+OVERRUNS = metrics.counter('scheduler_overruns_total', '任务耗时超过轮询间隔的次数', ('job',))
+MAX_LATENESS = metrics.gauge('scheduler_max_lateness_seconds', '任务开始时间相对计划触发点的最大延迟（秒）', ('job',))
+INTERVAL = metrics.gauge('scheduler_interval_seconds', '最近一次选定的轮询间隔（秒）', ('job',))
+
+# 连续竞价时段；结束时间取下一分钟，与原先按分钟闭区间判断(<=11:30、<=15:00)一致
+SESSIONS = ((dtime(9, 30), dtime(11, 31)), (dtime(13, 0), dtime(15, 1)))
+TRADE_DATES_FILE = 'static/trade_dates.csv'
+
+
+class TradingCalendar:
+    """
+    本地交易日历
+
+    交易日来自static/trade_dates.csv（由refresh_trade_dates从akshare下载缓存）；
+    文件不存在或不覆盖某一天时，按周一至周五视为交易日。
+
+    参数：
+        trade_dates (iterable, optional): 交易日（date）集合
+        sessions (tuple): 每个交易日的连续交易时段
+    """
+
+    def __init__(self, trade_dates=None, sessions=SESSIONS):
+        self.trade_dates = set(trade_dates or ())
+        self.last_known = max(self.trade_dates) if self.trade_dates else None
+        self.sessions = sessions
+
+    @classmethod
+    def load(cls, path=TRADE_DATES_FILE):
+        """从本地文件加载交易日历，文件不存在时退化为工作日日历"""
+        if not os.path.exists(path):
+            return cls()
+        df = pd.read_csv(path)
+        return cls(pd.to_datetime(df['trade_date']).dt.date)
+
+    def is_trading_day(self, day):
+        if self.last_known is not None and day <= self.last_known:
+            return day in self.trade_dates
+        return day.weekday() < 5
+
+    def in_session(self, moment):
+        """moment是否处于交易时段内"""
+        if not self.is_trading_day(moment.date()):
+            return False
+        now = moment.time()
+        return any(start <= now < end for start, end in self.sessions)
+
+    def next_session_start(self, moment):
+        """moment之后（含）最近一个交易时段的开始时间"""
+        day = moment.date()
+        for _ in range(366):
+            if self.is_trading_day(day):
+                for start, _end in self.sessions:
+                    candidate = datetime.combine(day, start)
+                    if candidate >= moment:
+                        return candidate
+            day += timedelta(days=1)
+            moment = datetime.combine(day, dtime.min)
+        raise ValueError('一年内没有交易日，请检查交易日历')
+
+
+    def last_session_day(self, moment):
+        """moment时（含）已经开盘的最近一个交易日；盘前和非交易日返回上一个交易日"""
+        day = moment.date()
+        for _ in range(366):
+            if self.is_trading_day(day) and datetime.combine(day, self.sessions[0][0]) <= moment:
+                return day
+            day -= timedelta(days=1)
+        raise ValueError('一年内没有交易日，请检查交易日历')
+
+
+def refresh_trade_dates(path=TRADE_DATES_FILE):
+    """从akshare下载交易日历并缓存到本地"""
+    import akshare as ak
+    df = ak.tool_trade_date_hist_sina()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    df.to_csv(path, index=False)
+    return TradingCalendar(pd.to_datetime(df['trade_date']).dt.date)
+
+
+class AdaptiveInterval:
+    """
+    自适应轮询间隔：按时段给出基准间隔，再按上一轮的事件量缩放
+
+    开盘和尾盘事件密集，基准间隔较短；午盘较长。上一轮事件数达到busy_events时加快一倍，
+    连续空轮询时逐步放慢，最终限制在[min_interval, max_interval]内。
+    """
+
+    def __init__(self, base=2.0, min_interval=1.0, max_interval=10.0, busy_events=20,
+                 schedule=((dtime(9, 30), dtime(10, 0), 1.0), (dtime(11, 0), dtime(14, 30), 3.0))):
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.busy_events = busy_events
+        self.schedule = schedule
+        self.factor = 1.0
+
+    def next(self, moment, events):
+        """根据当前时间和上一轮的事件数返回下一次轮询的间隔秒数"""
+        if events >= self.busy_events:
+            self.factor = 0.5
+        elif events == 0:
+            self.factor = min(self.factor * 1.25, 4.0)
+        else:
+            self.factor = 1.0
+        base = self.base
+        for start, end, interval in self.schedule:
+            if start <= moment.time() < end:
+                base = interval
+                break
+        return min(self.max_interval, max(self.min_interval, base * self.factor))
+
+
+class TickScheduler:
+    """
+    不漂移的轮询调度器
+
+    按固定的时间网格触发：下一次触发时间=上一次计划时间+间隔，而不是上一次结束时间+间隔，
+    因此请求和处理耗时不会累积成漂移。任务超时错过的网格点直接跳过并计数。
+    非交易时段按交易日历精确休眠到下一个交易时段开始。
+
+    参数：
+        calendar (TradingCalendar): 交易日历
+        interval (AdaptiveInterval|float): 轮询间隔策略或固定秒数
+        clock (callable): 返回Unix时间戳的函数，测试时可注入
+        sleep (callable): 休眠函数，测试时可注入
+        max_sleep (float): 单次休眠上限，防止系统时间跳变后长时间不醒
+        job (str): 导出stats指标时的job标签，例如'watch'、'live'
+    """
+
+    def __init__(self, calendar=None, interval=None, clock=time.time, sleep=time.sleep, max_sleep=3600,
+                 job='scheduler'):
+        self.calendar = calendar or TradingCalendar()
+        self.job = job
+        self.interval = interval if interval is not None else AdaptiveInterval()
+        self.clock = clock
+        self.sleep = sleep
+        self.max_sleep = max_sleep
+        self.stats = {'ticks': 0, 'skipped_ticks': 0, 'overruns': 0, 'max_lateness': 0.0, 'last_interval': None}
+        self._next_tick = None
+
+    def _next_interval(self, moment, events):
+        if isinstance(self.interval, (int, float)):
+            return float(self.interval)
+        return self.interval.next(moment, events)
+
+    def run_once(self, task, on_idle=None):
+        """
+        执行调度循环的一步：休眠到下一个触发点，或触发一次任务
+
+        返回：
+            bool: 本步是否执行了任务
+        """
+        now = self.clock()
+        moment = datetime.fromtimestamp(now)
+        if not self.calendar.in_session(moment):
+            self._next_tick = None
+            if on_idle is not None:
+                on_idle()
+            wake = self.calendar.next_session_start(moment).timestamp()
+            self.sleep(min(self.max_sleep, max(0.0, wake - now)))
+            return False
+        if self._next_tick is None:
+            self._next_tick = now
+        if now < self._next_tick:
+            self.sleep(self._next_tick - now)
+            return False
+
+        lateness = now - self._next_tick
+        self.stats['max_lateness'] = max(self.stats['max_lateness'], lateness)
+        MAX_LATENESS.set(self.stats['max_lateness'], job=self.job)
+        events = task() or 0
+        self.stats['ticks'] += 1
+
+        interval = self._next_interval(moment, events)
+        self.stats['last_interval'] = interval
+        INTERVAL.set(interval, job=self.job)
+        self._next_tick += interval
+        finished = self.clock()
+        if finished > self._next_tick:
+            # 任务超时：跳过已经错过的网格点，而不是连续补跑
+            missed = math.floor((finished - self._next_tick) / interval) + 1
+            self._next_tick += missed * interval
+            self.stats['overruns'] += 1
+            self.stats['skipped_ticks'] += missed
+            OVERRUNS.inc(job=self.job)
+            SKIPPED_TICKS.inc(missed, job=self.job)
+            logger.warning(f'轮询耗时{finished - now:.2f}秒超过间隔{interval:.2f}秒，跳过{missed}个触发点')
+        return True
+
+    def run(self, task, on_idle=None, stop=None):
+        """
+        持续调度，直到stop()返回True
+
+        参数：
+            task (callable): 每次触发执行的任务，返回本轮事件数（用于自适应间隔）
+            on_idle (callable, optional): 每次进入非交易时段休眠前调用
+            stop (callable, optional): 返回True时退出循环
+        """
+        while stop is None or not stop():
+            self.run_once(task, on_idle)
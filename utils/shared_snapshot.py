@@ -0,0 +1,269 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import pandas as pd
+from utils.event_store import SEQ_COLUMN, STORED_COLUMNS, ChangesView
+
+# 共享快照文件：优先放在内存文件系统/dev/shm，可用环境变量WATCH_SNAPSHOT_PATH修改
+_SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+SNAPSHOT_PATH = os.environ.get('WATCH_SNAPSHOT_PATH', os.path.join(_SHM_DIR, 'cnstockgpt-changes.snap'))
+
+# 头部：魔数、seqlock序号、数据版本、行数、正文长度、写者PID、心跳时间（Unix时间戳）；正文为全量异动的JSON数组
+MAGIC = b'CHGSNAP2'
+HEADER = struct.Struct('<8sQQQQQd')
+HEADER_SIZE = 64
+_SEQ_OFFSET = 8
+_WRITER = struct.Struct('<Qd')
+_WRITER_OFFSET = 40
+INITIAL_CAPACITY = 1 << 20
+# 写者每隔HEARTBEAT_INTERVAL秒更新心跳；读者发现写者进程已退出或心跳超过STALE_AFTER秒未更新时不再使用快照
+HEARTBEAT_INTERVAL = 5.0
+STALE_AFTER = 30.0
+
+
+class SnapshotWriter:
+    """
+    监控进程侧：把当前去重后的完整异动表发布到mmap共享的快照文件
+
+    采用seqlock：写入前把序号加一（奇数表示正在写），写完正文和头部后再加一（偶数）。
+    读者在读取前后比较序号，不一致或为奇数时重读，因此不会读到写了一半的数据，写者也从不等待读者。
+    文件只增长不缩小，避免已映射的读者访问越界。
+    头部记录写者PID和心跳时间，start_heartbeat后由后台线程定期更新，读者据此判断快照是否还有人维护。
+
+    参数：
+        path (str): 快照文件路径
+        capacity (int): 初始正文容量（字节），不够时按倍数扩容
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, capacity=INITIAL_CAPACITY):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, 'r+b')
+        size = os.fstat(fd).st_size
+        if size < HEADER_SIZE + capacity:
+            os.ftruncate(fd, HEADER_SIZE + capacity)
+        self._mm = mmap.mmap(fd, 0)
+        magic, seq = struct.unpack_from('<8sQ', self._mm, 0)
+        # 沿用已有文件的序号，已映射的读者能识别出新发布的内容；上次写到一半崩溃时序号为奇数
+        self._seq = seq + (seq & 1) if magic == MAGIC else 0
+        if magic != MAGIC:
+            HEADER.pack_into(self._mm, 0, MAGIC, 0, 0, 0, 0, 0, 0.0)
+        self.heartbeat()
+
+    def heartbeat(self):
+        """在头部写入本进程PID和当前时间"""
+        with self._lock:
+            _WRITER.pack_into(self._mm, _WRITER_OFFSET, os.getpid(), time.time())
+
+    def start_heartbeat(self, interval=HEARTBEAT_INTERVAL):
+        """启动后台线程每interval秒更新一次心跳，盘后长时间没有发布时快照也不会被读者判为过期"""
+        def run():
+            while not self._stop.wait(interval):
+                self.heartbeat()
+        threading.Thread(target=run, name='snapshot-heartbeat', daemon=True).start()
+        return self
+
+    def publish(self, version, count, body):
+        """
+        发布一份新快照
+
+        参数：
+            version (int): 数据版本号（异动序号）
+            count (int): 行数
+            body (bytes): 全量异动的JSON数组
+        """
+        needed = HEADER_SIZE + len(body)
+        with self._lock:
+            if needed > len(self._mm):
+                self._grow(needed)
+            self._seq += 1
+            struct.pack_into('<Q', self._mm, _SEQ_OFFSET, self._seq)
+            self._mm[HEADER_SIZE:needed] = body
+            HEADER.pack_into(self._mm, 0, MAGIC, self._seq, version, count, len(body), os.getpid(), time.time())
+            self._seq += 1
+            struct.pack_into('<Q', self._mm, _SEQ_OFFSET, self._seq)
+
+    def _grow(self, needed):
+        size = len(self._mm)
+        while size < needed:
+            size *= 2
+        self._mm.close()
+        os.ftruncate(self._file.fileno(), size)
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+
+    def close(self):
+        """停止心跳并把写者PID清零，读者立即改用其他数据源"""
+        self._stop.set()
+        with self._lock:
+            _WRITER.pack_into(self._mm, _WRITER_OFFSET, 0, 0.0)
+            self._mm.close()
+            self._file.close()
+
+
+class SnapshotReader:
+    """
+    API进程侧：只读映射快照文件，按seqlock协议取得一致的正文
+
+    序号未变化时只stat文件、读8个字节，不复制正文；快照文件不存在或尚未发布时read返回None。
+    文件被删除或替换（inode变化）时重新映射，不会一直读着旧文件。
+
+    参数：
+        path (str): 快照文件路径
+        retries (int): 与写者冲突时的最大重试次数
+        stale_after (float): 心跳超过该秒数未更新视为写者已停止
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, retries=100, stale_after=STALE_AFTER):
+        self.path = path
+        self.retries = retries
+        self.stale_after = stale_after
+        self._mm = None
+        self._ino = None
+        self.seq = None
+        self.snapshot = None
+
+    def _map(self):
+        self.close()
+        try:
+            with open(self.path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if st.st_size < HEADER_SIZE:
+                    return False
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._ino = st.st_ino
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _current(self):
+        """映射与路径上的文件一致时返回True；文件被替换时重新映射，被删除时返回False"""
+        try:
+            ino = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self.close()
+            return False
+        if self._mm is None or ino != self._ino:
+            self.seq = self.snapshot = None
+            return self._map()
+        return True
+
+    def alive(self):
+        """写者进程仍在运行且心跳未过期"""
+        if self._mm is None:
+            return False
+        pid, heartbeat = _WRITER.unpack_from(self._mm, _WRITER_OFFSET)
+        return bool(pid) and time.time() - heartbeat <= self.stale_after and _pid_alive(pid)
+
+    def read(self):
+        """
+        返回最新一致的快照(version, count, body)；没有可用快照时返回None
+        """
+        if not self._current():
+            return None
+        for _ in range(self.retries):
+            magic, seq1 = struct.unpack_from('<8sQ', self._mm, 0)
+            if magic != MAGIC:
+                return self.snapshot
+            if seq1 == self.seq:
+                return self.snapshot
+            if seq1 & 1:
+                continue  # 写者正在写
+            _, _, version, count, length, _, _ = HEADER.unpack_from(self._mm, 0)
+            if HEADER_SIZE + length > len(self._mm):
+                if not self._map():  # 写者扩容了文件；重新映射失败说明文件已被删除或截断
+                    return None
+                continue
+            body = self._mm[HEADER_SIZE:HEADER_SIZE + length]
+            if struct.unpack_from('<Q', self._mm, _SEQ_OFFSET)[0] == seq1:
+                self.seq = seq1
+                self.snapshot = (version, count, body) if seq1 else None
+                return self.snapshot
+        return self.snapshot
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self._ino = None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 进程存在，只是属于其他用户
+    return True
+
+
+class SharedChangesView:
+    """
+    与ChangesView接口一致的只读视图，数据来自监控进程发布的共享快照
+
+    共享快照可用时直接返回写者序列化好的JSON正文，请求路径上没有文件读取和解析；
+    监控进程尚未发布快照（例如未启动）或已经退出、心跳过期时，退回读取快照文件和追加日志的ChangesView。
+
+    参数：
+        path (str): 共享快照文件路径
+        fallback (ChangesView): 没有共享快照时使用的视图
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, fallback=None):
+        self.reader = SnapshotReader(path)
+        self.fallback = fallback if fallback is not None else ChangesView()
+        self.version = 0
+        self._shared = False
+        self._count = 0
+        self._body = None
+        self._rows = None
+        self._rows_version = None
+
+    def __len__(self):
+        return self._count if self._shared else len(self.fallback)
+
+    def exists(self):
+        return (self.reader.read() is not None and self.reader.alive()) or self.fallback.exists()
+
+    def refresh(self):
+        """同步最新快照，返回当前版本号"""
+        snapshot = self.reader.read()
+        self._shared = snapshot is not None and self.reader.alive()
+        if not self._shared:
+            self.version = self.fallback.refresh()
+            return self.version
+        self.version, self._count, self._body = snapshot
+        return self.version
+
+    def _records(self):
+        # 只有增量查询和CSV导出需要逐行数据，按版本缓存解析结果
+        # 快照文件被替换后序号从头开始，缓存键同时包含inode
+        if self._rows_version != (self.reader._ino, self.reader.seq):
+            self._rows = json.loads(self._body)
+            self._rows_version = (self.reader._ino, self.reader.seq)
+        return self._rows
+
+    def records(self, since=None):
+        """返回行字典列表；指定since时只返回序号大于since的行"""
+        if not self._shared:
+            return self.fallback.records(since)
+        rows = self._records()
+        if since is not None:
+            rows = [row for row in rows if row[SEQ_COLUMN] > since]
+        return rows
+
+    def to_frame(self):
+        if not self._shared:
+            return self.fallback.to_frame()
+        return pd.DataFrame(self._records(), columns=STORED_COLUMNS)
+
+    def body(self):
+        """当前全量数据的JSON正文（bytes）"""
+        return self._body if self._shared else self.fallback.body()
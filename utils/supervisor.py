@@ -0,0 +1,280 @@
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from utils import metrics
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:  # Windows没有flock，只能依靠exit_with_supervisor让旧的监控进程退出
+    fcntl = None
+    HAS_FCNTL = False
+
+logger = logging.getLogger(__name__)
+
+# 监控进程管理者之间选主和转发命令的本地端口，可用环境变量WATCH_CONTROL_PORT修改
+CONTROL_HOST = '127.0.0.1'
+CONTROL_PORT = int(os.environ.get('WATCH_CONTROL_PORT', 8766))
+# 传给监控进程的管理者PID，监控进程发现管理者退出后随之退出，见exit_with_supervisor
+SUPERVISOR_PID_ENV = 'WATCH_SUPERVISOR_PID'
+# 监控进程的单实例锁文件，可用环境变量WATCH_LOCK_PATH修改，见hold_watch_lock
+_LOCK_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+WATCH_LOCK_PATH = os.environ.get('WATCH_LOCK_PATH', os.path.join(_LOCK_DIR, 'cnstockgpt-watch.lock'))
+
+RESTARTS = metrics.counter('watch_supervisor_restarts_total', '监控进程的重启次数', ('reason',))
+LEADER = metrics.gauge('watch_supervisor_leader', '本进程是否为监控进程的管理者（1为是）')
+
+
+class WatchSupervisor:
+    """
+    每台主机只运行一个监控进程的管理者
+
+    API的每个worker进程各有一个WatchSupervisor，谁绑定了本地控制端口谁就是leader：
+    leader启动监控进程，进程意外退出时按指数退避重启（连续运行超过stable_after秒后退避时间复位），
+    并在控制端口上应答状态查询和重启命令；其他worker定期尝试绑定，leader所在进程退出、端口释放后接替。
+    端口由操作系统在进程退出时释放，不会因崩溃留下过期的锁。
+
+    非leader的status和restart通过控制端口转发给leader，因此无论请求落到哪个worker，结果都一致。
+    控制协议为一问一答的JSON行：{'cmd': 'status'|'restart'}。
+
+    参数：
+        command (list): 启动监控进程的命令
+        host (str): 控制端口监听地址
+        port (int): 控制端口
+        min_backoff (float): 首次重启前等待的秒数
+        max_backoff (float): 重启等待的上限秒数
+        stable_after (float): 运行超过该秒数后再退出视为新的故障，退避时间从min_backoff重新开始
+        elect_interval (float): 非leader尝试选主的间隔秒数
+        poll_interval (float): leader检查监控进程是否存活的间隔秒数
+        stop_timeout (float): 终止监控进程时等待其退出的秒数，超时后强制结束
+    """
+
+    def __init__(self, command, host=CONTROL_HOST, port=CONTROL_PORT, min_backoff=1.0, max_backoff=60.0,
+                 stable_after=60.0, elect_interval=2.0, poll_interval=0.5, stop_timeout=5.0):
+        self.command = command
+        self.host = host
+        self.port = port
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.elect_interval = elect_interval
+        self.poll_interval = poll_interval
+        self.stop_timeout = stop_timeout
+        self.process = None
+        self.restarts = 0
+        self._server = None
+        self._backoff = min_backoff
+        self._started_at = None
+        self._restart_at = None
+        self._return_code = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self._server is not None
+
+    def start(self):
+        """立即尝试选主，然后在后台线程中维持：leader监视监控进程，非leader定期重试选主"""
+        self._elect()
+        self._thread = threading.Thread(target=self._run, name='watch-supervisor', daemon=True)
+        self._thread.start()
+        return self
+
+    def _elect(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server.bind((self.host, self.port))
+        except OSError:
+            server.close()
+            return False
+        server.listen()
+        self._server = server
+        LEADER.set(1)
+        logger.info(f'进程{os.getpid()}成为监控进程的管理者（{self.host}:{self.port}）')
+        threading.Thread(target=self._serve, args=(server,), name='watch-control', daemon=True).start()
+        with self._lock:
+            self._spawn()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.is_leader:
+                self._check()
+                self._stop.wait(self.poll_interval)
+            elif not self._elect():
+                LEADER.set(0)
+                self._stop.wait(self.elect_interval)
+
+    def _spawn(self):
+        # 输出直接继承而不是管道：没有人读管道，缓冲区写满后监控进程会阻塞在下一次print
+        env = dict(os.environ, **{SUPERVISOR_PID_ENV: str(os.getpid())})
+        self.process = subprocess.Popen(self.command, stdout=None, stderr=None, env=env)
+        self._started_at = time.monotonic()
+        self._restart_at = None
+        self._return_code = None
+        logger.info(f'监控进程已启动，PID {self.process.pid}')
+
+    def _check(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._restart_at is not None:
+                if now >= self._restart_at:
+                    self.restarts += 1
+                    RESTARTS.inc(reason='crash')
+                    self._spawn()
+                return
+            if self.process is None or self.process.poll() is None:
+                return
+            self._return_code = self.process.returncode
+            if now - self._started_at >= self.stable_after:
+                self._backoff = self.min_backoff
+            self._restart_at = now + self._backoff
+            logger.warning(f'监控进程退出（返回码{self._return_code}），{self._backoff:.1f}秒后重启')
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _terminate(self):
+        process, self.process = self.process, None
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=self.stop_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def _local_status(self):
+        with self._lock:
+            status = {'leader_pid': os.getpid(), 'restarts': self.restarts}
+            if self._restart_at is not None:
+                status.update(status='backoff', return_code=self._return_code,
+                              restart_in=round(max(0.0, self._restart_at - time.monotonic()), 1))
+            elif self.process is None:
+                status['status'] = 'not_running'
+            elif self.process.poll() is None:
+                status.update(status='running', pid=self.process.pid,
+                              uptime=round(time.monotonic() - self._started_at, 1))
+            else:
+                status.update(status='stopped', return_code=self.process.returncode)
+            return status
+
+    def _local_restart(self):
+        with self._lock:
+            self._terminate()
+            self._backoff = self.min_backoff
+            self.restarts += 1
+            RESTARTS.inc(reason='request')
+            self._spawn()
+        return dict(self._local_status(), status='restarted')
+
+    def _serve(self, server):
+        while self._server is server:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.settimeout(self.stop_timeout + 5)
+                try:
+                    request = json.loads(conn.makefile('rb').readline() or b'{}')
+                    if request.get('cmd') == 'restart':
+                        response = self._local_restart()
+                    elif request.get('cmd') == 'status':
+                        response = self._local_status()
+                    else:
+                        response = {'error': f"未知命令{request.get('cmd')}"}
+                    conn.sendall((json.dumps(response) + '\n').encode('utf-8'))
+                except (OSError, ValueError) as e:
+                    logger.warning(f'处理控制命令失败: {e}')
+
+    def _ask_leader(self, cmd):
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.stop_timeout + 5) as conn:
+                conn.sendall((json.dumps({'cmd': cmd}) + '\n').encode('utf-8'))
+                return json.loads(conn.makefile('rb').readline())
+        except (OSError, ValueError) as e:
+            # 正在换主，或者leader所在进程刚退出
+            return {'status': 'no_leader', 'error': str(e)}
+
+    def status(self):
+        """监控进程的状态；非leader向leader查询"""
+        return self._local_status() if self.is_leader else self._ask_leader('status')
+
+    def restart(self):
+        """重启监控进程；非leader把命令转发给leader"""
+        return self._local_restart() if self.is_leader else self._ask_leader('restart')
+
+    def stop(self):
+        """停止后台线程；leader同时终止监控进程并释放控制端口，由其他worker接替"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + self.elect_interval)
+        server, self._server = self._server, None
+        if server is not None:
+            # 只close不会唤醒阻塞在accept中的线程，端口会一直占用到下一个连接到来
+            try:
+                server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server.close()
+            with self._lock:
+                self._restart_at = None
+                self._terminate()
+            LEADER.set(0)
+
+
+def exit_with_supervisor(interval=1.0):
+    """
+    在监控进程中调用：由WatchSupervisor启动时，管理者进程退出（包括被强制结束）后本进程也退出
+
+    否则监控进程会成为孤儿继续运行，接替的leader再启动一个，同一主机上就有两个监控进程。
+    通过后台线程轮询父进程号实现，不依赖平台特有的父进程退出信号。
+    """
+    supervisor_pid = os.environ.get(SUPERVISOR_PID_ENV)
+    if not supervisor_pid or int(supervisor_pid) != os.getppid():
+        return
+
+    def watch_parent():
+        while os.getppid() == int(supervisor_pid):
+            time.sleep(interval)
+        logger.warning(f'管理者进程{supervisor_pid}已退出，监控进程随之退出')
+        os.kill(os.getpid(), signal.SIGTERM)
+    threading.Thread(target=watch_parent, name='watch-parent', daemon=True).start()
+
+
+def hold_watch_lock(path=WATCH_LOCK_PATH):
+    """
+    在监控进程中、打开事件推送端口和共享快照之前调用：取得主机上唯一的监控进程锁，已有持有者时阻塞等待
+
+    换主时旧leader启动的监控进程要等exit_with_supervisor发现后才退出，这期间新leader已经启动了新的监控进程；
+    新进程在这里等到旧进程退出，两个进程不会同时绑定推送端口、写同一份共享快照。
+    锁是flock，持有进程退出（包括被强制结束）时由内核释放，不会留下过期的锁。
+
+    返回：
+        file: 锁文件，进程存活期间保持打开；没有fcntl的平台返回None
+    """
+    if not HAS_FCNTL:
+        return None
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    lock = open(path, 'a+')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.seek(0)
+        holder = lock.read().strip() or '未知'
+        logger.warning(f'监控进程{holder}仍在运行，等待其退出')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    lock.seek(0)
+    lock.truncate()
+    lock.write(str(os.getpid()))
+    lock.flush()
+    return lock
@@ -0,0 +1,101 @@
+import os
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    HAS_ARROW = True
+except ImportError:  # pyarrow是可选依赖，没有时退回CSV
+    pa = None
+    feather = None
+    HAS_ARROW = False
+
+# 重复度高的中文文本列，以字典编码（category）保存
+CATEGORICAL_COLUMNS = ('板块代码', '板块名称', '类型', '名称', '股票名称', '上下午', '时间')
+
+
+def table_paths(base):
+    """base（不含扩展名）对应的两种格式文件路径"""
+    return {'feather': f'{base}.feather', 'csv': f'{base}.csv'}
+
+
+def latest_path(base):
+    """
+    返回base对应的数据文件路径：有pyarrow且存在Feather文件时总是返回Feather，否则返回CSV；都不存在时返回None
+
+    不按修改时间比较：复制、检出或备份恢复都会改变mtime，而write_table写CSV时会删除同名的Feather文件，
+    因此存在的Feather文件总是最新的。
+    """
+    paths = table_paths(base)
+    if HAS_ARROW and os.path.exists(paths['feather']):
+        return paths['feather']
+    if os.path.exists(paths['csv']):
+        return paths['csv']
+    return None
+
+
+def read_table(base, columns=None, dtype=None):
+    """
+    读取base对应的数据文件（有Feather时优先读取Feather）
+
+    Feather文件以内存映射方式打开，不经过文本解析；字典编码列读入为category。
+
+    参数：
+        base (str): 不含扩展名的路径，例如'static/concepts'
+        columns (list, optional): 只读取这些列
+        dtype (dict, optional): 读取CSV时的列类型
+
+    返回：
+        DataFrame: 数据；文件不存在时为None
+    """
+    path = latest_path(base)
+    if path is None:
+        return None
+    if path.endswith('.feather'):
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        return table.to_pandas()
+    return pd.read_csv(path, usecols=columns, dtype=dtype)
+
+
+def read_arrow(base, columns=None):
+    """以内存映射方式零拷贝读取Feather文件，返回pyarrow.Table；没有Feather文件时返回None"""
+    path = table_paths(base)['feather']
+    if not HAS_ARROW or not os.path.exists(path):
+        return None
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def write_table(df, base, fmt=None):
+    """
+    原子写入数据文件
+
+    有pyarrow时写未压缩的Feather（可内存映射零拷贝读取），文本列按字典编码；否则写CSV。
+    写CSV时删除同名的Feather文件，避免读取时优先选中过期的Feather。
+
+    参数：
+        df (DataFrame): 数据
+        base (str): 不含扩展名的路径
+        fmt (str, optional): 'feather'或'csv'，默认按是否安装pyarrow选择
+
+    返回：
+        str: 写入的文件路径
+    """
+    fmt = fmt or ('feather' if HAS_ARROW else 'csv')
+    path = table_paths(base)[fmt]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    if fmt == 'feather':
+        df = df.reset_index(drop=True)
+        for column in CATEGORICAL_COLUMNS:
+            if column in df.columns and pd.api.types.is_string_dtype(df[column]):
+                df[column] = df[column].astype('category')
+        feather.write_feather(df, tmp_path, compression='uncompressed')
+    else:
+        df.to_csv(tmp_path, index=False, encoding='utf-8')
+    os.replace(tmp_path, path)
+    if fmt == 'csv':
+        try:
+            os.remove(table_paths(base)['feather'])
+        except FileNotFoundError:
+            pass
+    return path